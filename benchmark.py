@@ -0,0 +1,456 @@
+"""
+Offline retrieval benchmark
+Boots a local Postgres + pgvector (or uses --dsn), loads synthetic 1536-d corpora through the
+normal write path, serves deterministic fake embeddings from a local HTTP stub that speaks the
+OpenAI embeddings API, and reports ingest rows/sec, query latency percentiles and recall
+against brute force. Nothing here talks to Supabase or OpenAI.
+
+Usage:
+    python benchmark.py                                  # 10k rows, local Postgres via pgserver
+    python benchmark.py --rows 10000 100000 1000000 --index hnsw
+    python benchmark.py --storage bit --rerank-count 200   # compact index + re-rank (pgvector >= 0.7)
+    python benchmark.py --dsn postgresql://localhost/bench --queries 500 --json results.json
+    python benchmark.py --serve-embeddings --port 8089   # only run the fake embeddings API
+
+Each corpus size gets its own schema (bench_<rows>) with the regular setup_database.sql,
+so corpora are loaded once and reused by later runs (--reload to measure ingest again).
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from openai import OpenAI
+
+from document_store import DocumentWriter, vector_literal
+from embedding_batcher import create_embeddings
+from local_index import exact_top_k
+
+BENCH_DIR = Path(".bench")
+SCHEMA_SQL = Path(__file__).with_name("setup_database.sql")
+
+DIMENSIONS = 1536
+EMBEDDING_MODEL = "text-embedding-3-small"
+SEED = 42
+CLUSTERS = 200  # topics in the synthetic corpus
+NOISE = 0.6  # spread within a topic, same-topic cosine similarity ≈ 1 / (1 + NOISE²) ≈ 0.74
+BLOCK_SIZE = 10_000  # corpus vectors are generated per block, so 10k rows are a prefix of 100k
+CHUNKS_PER_FILE = 100
+CONTENT_CHARS = 1000  # same size as the uploaders' chunks
+WARMUP_QUERIES = 10
+# Vector index per search_settings.vector_storage (see set_vector_storage in setup_database.sql)
+VECTOR_INDEXES = {
+    "full": "chunks_embedding_idx",
+    "halfvec": "chunks_embedding_halfvec_idx",
+    "halfvec512": "chunks_embedding_halfvec512_idx",
+    "bit": "chunks_embedding_bit_idx",
+}
+
+FILLER = ("Synthetic benchmark text about AI adoption, investors and portfolio KPIs. " * 20)
+
+
+# Synthetic data
+
+@lru_cache(maxsize=1)
+def centroids() -> np.ndarray:
+    rng = np.random.default_rng(SEED)
+    c = rng.standard_normal((CLUSTERS, DIMENSIONS), dtype=np.float32)
+    return c / np.linalg.norm(c, axis=1, keepdims=True)
+
+
+def _noisy(center_ids: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Unit vectors scattered around the given centroids"""
+    c = centroids()[center_ids]
+    v = c + NOISE * rng.standard_normal(c.shape, dtype=np.float32) / np.sqrt(DIMENSIONS)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def corpus_blocks(rows: int) -> Iterator[Tuple[int, np.ndarray]]:
+    """Yield (first row, vectors) for the corpus, deterministic per block"""
+    for start in range(0, rows, BLOCK_SIZE):
+        rng = np.random.default_rng([SEED, start // BLOCK_SIZE])
+        count = min(BLOCK_SIZE, rows - start)
+        yield start, _noisy(rng.integers(CLUSTERS, size=BLOCK_SIZE)[:count], rng)
+
+
+def fake_embedding(text: str, dimensions: int = DIMENSIONS) -> np.ndarray:
+    """Deterministic embedding for a text, near one of the corpus topics"""
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+    rng = np.random.default_rng(seed)
+    vector = _noisy(rng.integers(CLUSTERS, size=1), rng)[0]
+    if dimensions < DIMENSIONS:
+        # Like text-embedding-3 shortening: truncate and renormalize
+        vector = vector[:dimensions] / np.linalg.norm(vector[:dimensions])
+    return vector
+
+
+def content_for(row: int) -> str:
+    text = f"Benchmark chunk {row}. {FILLER}"
+    return text[:CONTENT_CHARS]
+
+
+def row_filename(row: int) -> str:
+    return f"bench_{row // CHUNKS_PER_FILE:06d}.txt"
+
+
+def row_id(filename: str, chunk_index: int) -> int:
+    """Corpus row number of a search result"""
+    return int(filename[len("bench_"):-len(".txt")]) * CHUNKS_PER_FILE + chunk_index
+
+
+def query_texts(count: int) -> List[str]:
+    return [f"benchmark query {i}" for i in range(count)]
+
+
+# Fake OpenAI embeddings API
+
+class _EmbeddingHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/embeddings"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        inputs = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimensions = body.get("dimensions") or DIMENSIONS
+        as_base64 = body.get("encoding_format") == "base64"
+
+        data = []
+        for idx, text in enumerate(inputs):
+            vector = fake_embedding(text, dimensions)
+            if as_base64:
+                embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode()
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": idx, "embedding": embedding})
+
+        tokens = sum(len(t) // 4 + 1 for t in inputs)
+        payload = json.dumps({
+            "object": "list",
+            "data": data,
+            "model": body.get("model", EMBEDDING_MODEL),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeEmbeddingServer:
+    """OpenAI-compatible /v1/embeddings endpoint on localhost, use as a context manager"""
+
+    def __init__(self, port: int = 0):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), _EmbeddingHandler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# Database
+
+def local_postgres_dsn() -> str:
+    """Start (or reuse) a throwaway Postgres with pgvector under .bench/pgdata"""
+    try:
+        import pgserver
+    except ImportError:
+        raise SystemExit("❌ No --dsn / BENCH_DB_URL given and pgserver is not installed "
+                         "(pip install pgserver, or point --dsn at a local Postgres with pgvector)")
+    BENCH_DIR.mkdir(exist_ok=True)
+    print("🐘 Starting local Postgres (pgserver)...", flush=True)
+    return pgserver.get_server(BENCH_DIR / "pgdata").get_uri()
+
+
+def prepare_schema(conn, schema: str, reload: bool):
+    """Create the regular schema (tables, triggers, match_documents) inside its own schema"""
+    cursor = conn.cursor()
+    # Install pgvector in public first, otherwise it would land in the bench schema
+    cursor.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    if reload:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+    cursor.execute(f"SET search_path TO {schema}, public")
+    cursor.execute(SCHEMA_SQL.read_text())
+    conn.commit()
+
+
+def loaded_rows(conn) -> int:
+    cursor = conn.cursor()
+    cursor.execute("SELECT chunks FROM corpus_stats")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def current_index(conn) -> Optional[str]:
+    """'hnsw' or 'ivfflat' for a full-precision index, else the compact storage it serves"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE schemaname = current_schema() AND indexname = ANY(%s)
+    """, (list(VECTOR_INDEXES.values()),))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    if row[0] != VECTOR_INDEXES["full"]:
+        return next(storage for storage, name in VECTOR_INDEXES.items() if name == row[0])
+    return "hnsw" if "USING hnsw" in row[1] else "ivfflat"
+
+
+def index_size(conn) -> Optional[int]:
+    """Size of the vector index in bytes"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT sum(pg_relation_size(format('%%I.%%I', schemaname, indexname)::regclass))
+        FROM pg_indexes
+        WHERE schemaname = current_schema() AND indexname = ANY(%s)
+    """, (list(VECTOR_INDEXES.values()),))
+    size = cursor.fetchone()[0]
+    return int(size) if size is not None else None
+
+
+def drop_index(conn):
+    cursor = conn.cursor()
+    cursor.execute("DROP INDEX IF EXISTS " + ", ".join(VECTOR_INDEXES.values()))
+    cursor.execute("UPDATE search_settings SET vector_storage = 'full'")
+    conn.commit()
+
+
+def build_index(conn, kind: str, rows: int, storage: str = "full") -> float:
+    """Build the vector index, returns the build time in seconds"""
+    if kind == "none":
+        return 0.0
+    if storage != "full":
+        # Compact HNSW index over the embedding column, the search functions re-rank its candidates
+        ddl = f"SELECT set_vector_storage('{storage}')"
+        kind = f"{kind} {storage}"
+    elif kind == "hnsw":
+        ddl = "CREATE INDEX chunks_embedding_idx ON chunks USING hnsw (embedding vector_cosine_ops)"
+    else:
+        lists = max(1, rows // 1000)  # pgvector guideline for up to 1M rows
+        ddl = (f"CREATE INDEX chunks_embedding_idx ON chunks "
+               f"USING ivfflat (embedding vector_cosine_ops) WITH (lists = {lists})")
+    print(f"   🔨 Building {kind} index...", flush=True)
+    start = time.perf_counter()
+    cursor = conn.cursor()
+    cursor.execute(ddl)
+    cursor.execute("ANALYZE chunks")
+    conn.commit()
+    return time.perf_counter() - start
+
+
+def load_corpus(conn, rows: int, method: str, flush_size: int) -> float:
+    """Load the synthetic corpus with DocumentWriter, returns rows/sec of the write path"""
+    cursor = conn.cursor()
+    cursor.execute("TRUNCATE source_documents CASCADE")
+    conn.commit()
+
+    writer = DocumentWriter(conn, flush_size=flush_size, method=method)
+    write_time = 0.0
+    for start, vectors in corpus_blocks(rows):
+        block_start = time.perf_counter()
+        for offset, vector in enumerate(vectors.tolist()):
+            row = start + offset
+            writer.add(row_filename(row), "txt", content_for(row), row % CHUNKS_PER_FILE,
+                       CHUNKS_PER_FILE, vector, {"benchmark": True})
+            # Flush between files, like the uploaders
+            if (row + 1) % CHUNKS_PER_FILE == 0 and writer.flush_if_full():
+                conn.commit()
+        writer.flush()
+        conn.commit()
+        write_time += time.perf_counter() - block_start
+        done = start + len(vectors)
+        print(f"\r   📥 {done:,}/{rows:,} rows ({done / write_time:,.0f} rows/sec)", end="", flush=True)
+    print()
+    return rows / write_time if write_time else 0.0
+
+
+# Measurements
+
+def brute_force(queries: np.ndarray, rows: int, k: int, threshold: float) -> List[List[int]]:
+    """Exact top-k rows by cosine similarity above threshold, per query"""
+    best_sims, best_ids = exact_top_k(queries, corpus_blocks(rows), k)
+    return [
+        [int(i) for s, i in zip(row_sims, row_ids) if s > threshold]
+        for row_sims, row_ids in zip(best_sims, best_ids)
+    ]
+
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)}
+
+
+def run_queries(conn, client, texts: List[str], k: int, threshold: float,
+                ef_search: Optional[int] = None, probes: Optional[int] = None):
+    """Embed + search like search_documents, returns timings and result row ids"""
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    embed_times, search_times, results = [], [], []
+    for idx, text in enumerate(texts):
+        start = time.perf_counter()
+        embedding = create_embeddings(client, [text], model=EMBEDDING_MODEL, dimensions=DIMENSIONS)[0]
+        embedded = time.perf_counter()
+        cursor.execute(
+            "SELECT * FROM match_documents_ann(%s::vector, %s, %s, %s, %s)",
+            (vector_literal(embedding), threshold, k, ef_search, probes)
+        )
+        rows = cursor.fetchall()
+        done = time.perf_counter()
+        conn.rollback()  # don't keep a transaction open between queries
+
+        if idx < WARMUP_QUERIES:
+            continue
+        embed_times.append(embedded - start)
+        search_times.append(done - embedded)
+        results.append([row_id(r["filename"], r["chunk_index"]) for r in rows])
+    return embed_times, search_times, results
+
+
+def recall(results: List[List[int]], truth: List[List[int]]) -> Optional[float]:
+    scores = [len(set(r) & set(t)) / len(t) for r, t in zip(results, truth) if t]
+    return float(np.mean(scores)) if scores else None
+
+
+def benchmark_size(dsn: str, client, rows: int, args) -> Dict:
+    schema = f"bench_{rows}"
+    print(f"\n{'=' * 60}\n📊 {rows:,} rows (schema {schema}, index {args.index})\n{'=' * 60}", flush=True)
+    result = {"rows": rows, "index": args.index, "storage": args.storage, "k": args.k,
+              "threshold": args.threshold, "ef_search": args.ef_search, "probes": args.probes,
+              "rerank_count": args.rerank_count}
+
+    conn = psycopg2.connect(dsn)
+    try:
+        prepare_schema(conn, schema, args.reload)
+        if loaded_rows(conn) != rows:
+            drop_index(conn)  # load first, index after: much faster than maintaining it per row
+            result["ingest_rows_per_sec"] = load_corpus(conn, rows, args.write_method, args.flush_size)
+            result["write_method"] = args.write_method
+        else:
+            print("   ♻️  Corpus already loaded (use --reload to measure ingest)")
+
+        wanted = None if args.index == "none" else args.index if args.storage == "full" else args.storage
+        if current_index(conn) != wanted:
+            drop_index(conn)
+            result["index_build_sec"] = build_index(conn, args.index, rows, args.storage)
+        result["index_bytes"] = index_size(conn)
+        conn.cursor().execute("UPDATE search_settings SET rerank_count = %s", (args.rerank_count,))
+        conn.commit()
+
+        texts = query_texts(args.queries + WARMUP_QUERIES)
+        print(f"   🔎 Running {args.queries} queries...", flush=True)
+        embed_times, search_times, results = run_queries(
+            conn, client, texts, args.k, args.threshold, args.ef_search, args.probes
+        )
+    finally:
+        conn.close()
+
+    print("   🧮 Brute force ground truth...", flush=True)
+    queries = np.stack([fake_embedding(t) for t in texts[WARMUP_QUERIES:]])
+    truth = brute_force(queries, rows, args.k, args.threshold)
+
+    result["embedding"] = percentiles(embed_times)
+    result["search"] = percentiles(search_times)
+    result["end_to_end"] = percentiles([e + s for e, s in zip(embed_times, search_times)])
+    result["recall"] = recall(results, truth)
+    print_result(result)
+    return result
+
+
+def print_result(result: Dict):
+    def fmt(p):
+        return f"p50 {p['p50_ms']:7.2f} ms   p95 {p['p95_ms']:7.2f} ms   p99 {p['p99_ms']:7.2f} ms"
+
+    if "ingest_rows_per_sec" in result:
+        print(f"   Ingest:       {result['ingest_rows_per_sec']:,.0f} rows/sec ({result['write_method']})")
+    if result.get("index_build_sec"):
+        print(f"   Index build:  {result['index_build_sec']:.1f}s")
+    if result.get("index_bytes"):
+        print(f"   Index size:   {result['index_bytes'] / 2**20:,.1f} MB ({result['storage']})")
+    print(f"   Embedding:    {fmt(result['embedding'])}")
+    print(f"   Search:       {fmt(result['search'])}")
+    print(f"   End-to-end:   {fmt(result['end_to_end'])}")
+    if result["recall"] is None:
+        print(f"   Recall@{result['k']}:    n/a (no rows above threshold {result['threshold']})")
+    else:
+        print(f"   Recall@{result['k']}:    {result['recall']:.3f} (threshold {result['threshold']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval latency / recall / ingest benchmark")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000],
+                        help="Corpus sizes to benchmark (default: 10000)")
+    parser.add_argument("--dsn", default=os.getenv("BENCH_DB_URL"),
+                        help="Postgres with pgvector to use (default: local pgserver under .bench/)")
+    parser.add_argument("--index", choices=["hnsw", "ivfflat", "none"], default="hnsw",
+                        help="Vector index to build (default: hnsw, like setup_db.py)")
+    parser.add_argument("--storage", choices=list(VECTOR_INDEXES), default="full",
+                        help="Vector index storage, compact ones are re-ranked exactly (pgvector >= 0.7)")
+    parser.add_argument("--rerank-count", type=int, default=100,
+                        help="Candidates fetched from a compact index before re-ranking")
+    parser.add_argument("--queries", type=int, default=200, help="Measured queries per size")
+    parser.add_argument("--k", type=int, default=10, help="match_count per query")
+    parser.add_argument("--threshold", type=float, default=0.5,
+                        help="match_threshold per query (default: the chat app default)")
+    parser.add_argument("--ef-search", type=int, help="hnsw.ef_search per query (default: server default)")
+    parser.add_argument("--probes", type=int, help="ivfflat.probes per query (default: server default)")
+    parser.add_argument("--write-method", choices=["values", "copy"], default="copy",
+                        help="DocumentWriter method used to load the corpus")
+    parser.add_argument("--flush-size", type=int, default=1000, help="Rows per insert round trip")
+    parser.add_argument("--reload", action="store_true", help="Drop and reload existing corpora")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--serve-embeddings", action="store_true",
+                        help="Only run the fake OpenAI embeddings API until interrupted")
+    parser.add_argument("--port", type=int, default=8089, help="Port for --serve-embeddings")
+    args = parser.parse_args()
+    if args.storage != "full" and args.index != "hnsw":
+        parser.error("--storage needs --index hnsw")
+
+    if args.serve_embeddings:
+        with FakeEmbeddingServer(args.port) as server:
+            print(f"🧪 Fake embeddings API on {server.url} (OPENAI_BASE_URL), Ctrl+C to stop")
+            try:
+                server.thread.join()
+            except KeyboardInterrupt:
+                pass
+        return
+
+    dsn = args.dsn or local_postgres_dsn()
+    results = []
+    with FakeEmbeddingServer() as server:
+        client = OpenAI(api_key="benchmark", base_url=server.url)
+        for rows in args.rows:
+            results.append(benchmark_size(dsn, client, rows, args))
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+        print(f"\n💾 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
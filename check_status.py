@@ -8,18 +8,14 @@ load_dotenv()
 conn = psycopg2.connect(os.getenv("SUPABASE_DB_URL"))
 cursor = conn.cursor()
 
-# Get stats
-cursor.execute("SELECT COUNT(*) FROM documents")
-total_chunks = cursor.fetchone()[0]
-
-cursor.execute("SELECT COUNT(DISTINCT filename) FROM documents")
-unique_files = cursor.fetchone()[0]
+# Get stats (trigger-maintained totals, one row per file in source_documents)
+cursor.execute("SELECT files, chunks FROM corpus_stats")
+unique_files, total_chunks = cursor.fetchone()
 
 cursor.execute("""
-    SELECT filename, COUNT(*) as chunks 
-    FROM documents 
-    GROUP BY filename 
-    ORDER BY MAX(created_at) DESC 
+    SELECT filename, total_chunks as chunks 
+    FROM source_documents 
+    ORDER BY updated_at DESC 
     LIMIT 5
 """)
 recent_files = cursor.fetchall()
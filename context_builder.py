@@ -0,0 +1,197 @@
+"""
+Token-budgeted context assembly for the answer prompt
+Turns the ranked chunks into the passages the model sees: consecutive chunks of the same file
+are merged with their overlap (CHUNK_OVERLAP characters) removed, near-duplicate passages are
+dropped, and the passages are packed in rank order into a prompt token budget counted with
+the gpt-4o tokenizer.
+"""
+
+import math
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+TOKEN_ENCODING = "o200k_base"  # tokenizer of gpt-4o
+CHARS_PER_TOKEN = 4  # estimate when the tokenizer is not available
+MAX_OVERLAP_CHARS = 400  # longest overlap looked for between consecutive chunks (2x CHUNK_OVERLAP)
+MIN_OVERLAP_CHARS = 20  # shorter matches between chunk ends are coincidence, not overlap
+SHINGLE_WORDS = 5
+DUPLICATE_SIMILARITY = 0.8  # share of the word shingles of a passage found in a better one
+MIN_PASSAGE_TOKENS = 50  # a truncated passage shorter than this is left out
+TRUNCATED = " ..."
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+# Tokens
+
+def _get_encoding():
+    """tiktoken encoding, or False when tiktoken or its vocabulary file is not available"""
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+            except Exception:
+                # Not installed, or offline and the vocabulary is not in the tiktoken cache yet
+                _encoding = False
+        return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Prompt tokens of text for gpt-4o (estimated from the length without tiktoken)"""
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """The start of text that fits in max_tokens, cut at a word boundary"""
+    encoding = _get_encoding()
+    keep = max_tokens - count_tokens(TRUNCATED)
+    if encoding:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        cut = encoding.decode(tokens[:keep])
+    else:
+        if len(text) <= max_tokens * CHARS_PER_TOKEN:
+            return text
+        cut = text[:keep * CHARS_PER_TOKEN]
+    space = cut.rfind(" ")
+    return (cut[:space] if space > len(cut) // 2 else cut).rstrip() + TRUNCATED
+
+
+# Merging and deduplication
+
+def overlap_length(previous: str, following: str, max_overlap: int = MAX_OVERLAP_CHARS) -> int:
+    """Length of the longest end of previous that following starts with (0 below MIN_OVERLAP_CHARS)"""
+    for length in range(min(len(previous), len(following), max_overlap), MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(following[:length]):
+            return length
+    return 0
+
+
+def join_chunks(previous: str, following: str) -> str:
+    """Concatenate two consecutive chunks, keeping their shared text once"""
+    overlap = overlap_length(previous, following)
+    if overlap:
+        return previous + following[overlap:]
+    return previous + "\n" + following
+
+
+def merge_chunks(chunks: List[Dict]) -> List[Dict]:
+    """
+    Merge chunks of the same file with consecutive chunk_index into passages.
+
+    chunks is in rank order. A passage keeps the fields of its best ranked chunk, with the merged
+    content, chunk_indexes and the highest similarity; passages are returned in the order of
+    their best chunk.
+    """
+    by_file = defaultdict(list)
+    for rank, chunk in enumerate(chunks):
+        by_file[chunk["filename"]].append((rank, chunk))
+
+    passages = []
+    for file_chunks in by_file.values():
+        file_chunks.sort(key=lambda item: item[1]["chunk_index"])
+        group = []
+        for rank, chunk in file_chunks:
+            if group and chunk["chunk_index"] == group[-1][1]["chunk_index"]:
+                continue  # same chunk twice
+            if group and chunk["chunk_index"] != group[-1][1]["chunk_index"] + 1:
+                passages.append(_passage(group))
+                group = []
+            group.append((rank, chunk))
+        passages.append(_passage(group))
+
+    passages.sort(key=lambda passage: passage["rank"])
+    return passages
+
+
+def _passage(group) -> Dict:
+    rank, best = min(group, key=lambda item: item[0])
+    content = group[0][1]["content"]
+    for _, chunk in group[1:]:
+        content = join_chunks(content, chunk["content"])
+    return {
+        **best,
+        "content": content,
+        "chunk_index": group[0][1]["chunk_index"],
+        "chunk_indexes": [chunk["chunk_index"] for _, chunk in group],
+        "similarity": max((chunk.get("similarity") or 0) for _, chunk in group),
+        "rank": rank,
+    }
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> set:
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def drop_duplicates(passages: List[Dict], threshold: float = DUPLICATE_SIMILARITY) -> List[Dict]:
+    """
+    Passages in order, without the ones whose own shingles mostly appear in a better ranked
+    passage (a longer passage that contains a better one but adds new text is kept)
+    """
+    kept, kept_shingles = [], []
+    for passage in passages:
+        passage_shingles = shingles(passage["content"])
+        duplicate = any(
+            len(passage_shingles & other) / len(passage_shingles) >= threshold
+            for other in kept_shingles
+        )
+        if not duplicate:
+            kept.append(passage)
+            kept_shingles.append(passage_shingles)
+    return kept
+
+
+# Packing
+
+def source_header(number: int, passage: Dict) -> str:
+    """Header of a passage in the prompt, cited by the model as [Source X]"""
+    return f"[Source {number}] {passage['filename']}"
+
+
+def format_passage(number: int, passage: Dict) -> str:
+    """A passage as it appears in the prompt (see rag_engine.build_messages); this exact text
+    is what counts against the token budget"""
+    return f"\n\n{source_header(number, passage)}\n{passage['content']}\n---"
+
+
+def build_context(chunks: List[Dict], token_budget: Optional[int] = None) -> List[Dict]:
+    """
+    Passages for the prompt: merged, deduplicated and packed in rank order into token_budget.
+
+    Passages that no longer fit are left out; only the first passage is truncated when it is
+    larger than the whole budget. Each passage gets its prompt size in tokens.
+    """
+    passages = drop_duplicates(merge_chunks(chunks))
+    packed, used = [], 0
+    for passage in passages:
+        number = len(packed) + 1
+        tokens = count_tokens(format_passage(number, passage))
+        if token_budget and used + tokens > token_budget:
+            if packed:
+                continue  # a smaller, lower ranked passage may still fit
+            room = token_budget - count_tokens(format_passage(number, {**passage, "content": ""}))
+            content = passage["content"]
+            while room >= MIN_PASSAGE_TOKENS and tokens > token_budget:
+                # Tokens may merge across the wrapper, so check the formatted passage again
+                truncated = {**passage, "content": truncate_tokens(content, room)}
+                tokens = count_tokens(format_passage(number, truncated))
+                room -= max(1, tokens - token_budget)
+            if tokens > token_budget:
+                continue
+            passage = truncated
+        packed.append({**passage, "tokens": tokens})
+        used += tokens
+    return packed
@@ -0,0 +1,336 @@
+"""
+Write path for the source_documents and chunks tables
+Buffers chunk rows and flushes them in one round trip with execute_values or COPY FROM STDIN,
+plus the manifest helpers used for incremental re-indexing
+"""
+
+import hashlib
+import io
+from typing import Any, Dict, List, Optional, Tuple
+
+from psycopg2.extras import Json, execute_values
+
+FLUSH_SIZE = 500  # rows per flush
+
+DOCUMENT_COLUMNS = ("filename", "file_type", "total_chunks", "metadata")
+CHUNK_COLUMNS = ("document_id", "chunk_index", "content", "embedding")
+
+
+def vector_literal(embedding: List[float]) -> str:
+    """pgvector text format, much smaller on the wire than a Python list literal / ARRAY[]"""
+    return '[' + ','.join(map(str, embedding)) + ']'
+
+
+def _copy_escape(value: Any) -> str:
+    """Escape a value for COPY text format"""
+    if value is None:
+        return '\\N'
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+
+class DocumentWriter:
+    """
+    Buffered inserter for the source_documents and chunks tables.
+
+    Rows are added per document and written in batches of roughly flush_size
+    rows. A document's rows are never split over two flushes, so a commit after
+    flush() never leaves a half-written file behind. The caller owns the
+    transaction: call flush() and then commit the connection.
+
+    Each flush upserts one source_documents row per filename (file_type,
+    total_chunks and metadata are taken from the file's first buffered chunk,
+    metadata is merged into what is stored) and then inserts the chunks.
+    """
+
+    def __init__(self, conn, flush_size: int = FLUSH_SIZE, method: str = "values"):
+        if method not in ("values", "copy"):
+            raise ValueError(f"Unknown write method: {method}")
+        self.conn = conn
+        self.flush_size = max(1, flush_size)
+        self.method = method
+        self.rows = []
+        self.written = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self.rows)
+
+    def add(self, filename: str, file_type: str, content: str, chunk_index: int,
+            total_chunks: int, embedding: List[float], metadata: Optional[Dict] = None):
+        """Buffer one chunk row"""
+        self.rows.append((
+            filename, file_type, total_chunks, metadata or {},
+            chunk_index, content, vector_literal(embedding)
+        ))
+
+    def add_document(self, filename: str, file_type: str, total_chunks: int,
+                     chunks: List[Tuple[int, str, List[float]]], metadata: Optional[Dict] = None):
+        """Buffer the (chunk_index, content, embedding) rows of one document, all or none: when
+        a row fails nothing of the document is left in the buffer"""
+        rows = [(filename, file_type, total_chunks, metadata or {}, chunk_index, content,
+                 vector_literal(embedding))
+                for chunk_index, content, embedding in chunks]
+        self.rows.extend(rows)
+
+    def flush_if_full(self) -> int:
+        """Flush when the buffer reached flush_size; call between documents"""
+        if len(self.rows) >= self.flush_size:
+            return self.flush()
+        return 0
+
+    def flush(self) -> int:
+        """Write all buffered rows, returns the number of rows written"""
+        if not self.rows:
+            return 0
+
+        rows, self.rows = self.rows, []
+        cursor = self.conn.cursor()
+        try:
+            document_ids = self._upsert_documents(cursor, rows)
+            chunks = [(document_ids[row[0]],) + row[4:] for row in rows]
+            if self.method == "copy":
+                self._copy(cursor, chunks)
+            else:
+                execute_values(
+                    cursor,
+                    f"INSERT INTO chunks ({', '.join(CHUNK_COLUMNS)}) VALUES %s",
+                    chunks,
+                    template="(%s, %s, %s, %s::vector)",
+                    page_size=len(chunks)
+                )
+        finally:
+            cursor.close()
+
+        self.written += len(rows)
+        return len(rows)
+
+    def _upsert_documents(self, cursor, rows) -> Dict[str, int]:
+        """source_documents id per filename, creating or updating the rows"""
+        documents = {}
+        for row in rows:
+            documents.setdefault(row[0], row[:4])
+        returned = execute_values(
+            cursor,
+            f"""
+            INSERT INTO source_documents ({', '.join(DOCUMENT_COLUMNS)}) VALUES %s
+            ON CONFLICT (filename) DO UPDATE SET
+                file_type = EXCLUDED.file_type,
+                total_chunks = EXCLUDED.total_chunks,
+                metadata = COALESCE(source_documents.metadata, '{{}}') || EXCLUDED.metadata,
+                updated_at = NOW()
+            RETURNING filename, id
+            """,
+            [doc[:3] + (Json(doc[3]),) for doc in documents.values()],
+            page_size=len(documents),
+            fetch=True
+        )
+        return dict(returned)
+
+    def _copy(self, cursor, rows):
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(_copy_escape(v) for v in row))
+            buffer.write('\n')
+        buffer.seek(0)
+        cursor.copy_expert(
+            f"COPY chunks ({', '.join(CHUNK_COLUMNS)}) FROM STDIN",
+            buffer
+        )
+
+
+# --- Incremental sync helpers (ingest_manifest table) ---
+
+def chunk_hash(text: str) -> str:
+    """Hash of a chunk, equal to md5(content) computed by Postgres"""
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+def load_manifest(conn, directory: str) -> Dict[str, Dict]:
+    """Manifest entries of all files previously synced from a directory"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT filename, file_hash, chunker, embedding_model, total_chunks
+        FROM ingest_manifest
+        WHERE directory = %s
+        """,
+        (directory,)
+    )
+    manifest = {
+        row[0]: {
+            "file_hash": row[1],
+            "chunker": row[2],
+            "embedding_model": row[3],
+            "total_chunks": row[4],
+        }
+        for row in cursor.fetchall()
+    }
+    cursor.close()
+    return manifest
+
+
+def load_chunk_hashes(conn, filenames: List[str]) -> Dict[str, Dict[str, List[str]]]:
+    """Existing chunk ids per filename, grouped by content hash"""
+    existing = {name: {} for name in filenames}
+    if not filenames:
+        return existing
+
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT d.filename, md5(c.content), c.id
+        FROM source_documents d
+        JOIN chunks c ON c.document_id = d.id
+        WHERE d.filename = ANY(%s)
+        """,
+        (list(filenames),)
+    )
+    for filename, content_hash, chunk_id in cursor.fetchall():
+        existing[filename].setdefault(content_hash, []).append(str(chunk_id))
+    cursor.close()
+    return existing
+
+
+def reindex_chunks(conn, chunks: List[Tuple[str, int]], total_chunks: int):
+    """Give kept chunks (id, new chunk_index) their new position in the document"""
+    if not chunks:
+        return
+    cursor = conn.cursor()
+    execute_values(
+        cursor,
+        """
+        UPDATE chunks AS c
+        SET chunk_index = v.chunk_index, updated_at = NOW()
+        FROM (VALUES %s) AS v(id, chunk_index)
+        WHERE c.id = v.id::uuid
+        """,
+        chunks,
+        page_size=len(chunks)
+    )
+    cursor.execute(
+        """
+        UPDATE source_documents SET total_chunks = %s, updated_at = NOW()
+        WHERE id = (SELECT document_id FROM chunks WHERE id = %s::uuid)
+        """,
+        (total_chunks, chunks[0][0])
+    )
+    cursor.close()
+
+
+def delete_chunks(conn, chunk_ids: List[str]) -> int:
+    """Delete chunk rows by id"""
+    if not chunk_ids:
+        return 0
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM chunks WHERE id = ANY(%s::uuid[])", (list(chunk_ids),))
+    deleted = cursor.rowcount
+    cursor.close()
+    return deleted
+
+
+def rename_document(conn, old_filename: str, new_filename: str) -> int:
+    """Move the document, the manifest entry and the source info of a renamed file to its new name"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        UPDATE source_documents SET filename = %s, updated_at = NOW() WHERE filename = %s
+        RETURNING total_chunks
+        """,
+        (new_filename, old_filename)
+    )
+    row = cursor.fetchone()
+    updated = row[0] if row else 0
+    cursor.execute(
+        "UPDATE ingest_manifest SET filename = %s, updated_at = NOW() WHERE filename = %s",
+        (new_filename, old_filename)
+    )
+    # Keep the source link, unless the new name already has one of its own
+    cursor.execute(
+        """
+        UPDATE sources SET filename = %s, updated_at = NOW()
+        WHERE filename = %s AND NOT EXISTS (SELECT 1 FROM sources WHERE filename = %s)
+        """,
+        (new_filename, old_filename, new_filename)
+    )
+    cursor.close()
+    return updated
+
+
+def delete_document(conn, filename: str) -> int:
+    """Remove the document (its chunks cascade) and the manifest entry of a file"""
+    cursor = conn.cursor()
+    # The outer query still sees the chunks the cascade removes, so this counts them
+    cursor.execute(
+        """
+        WITH deleted AS (
+            DELETE FROM source_documents WHERE filename = %s RETURNING id
+        )
+        SELECT COUNT(*) FROM chunks WHERE document_id IN (SELECT id FROM deleted)
+        """,
+        (filename,)
+    )
+    deleted = cursor.fetchone()[0]
+    cursor.execute("DELETE FROM ingest_manifest WHERE filename = %s", (filename,))
+    cursor.close()
+    return deleted
+
+
+def upsert_manifest(conn, filename: str, directory: str, file_hash: str,
+                    chunker: str, embedding_model: str, total_chunks: int):
+    """Record the state a file was synced in"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        INSERT INTO ingest_manifest
+        (filename, directory, file_hash, chunker, embedding_model, total_chunks)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (filename) DO UPDATE SET
+            directory = EXCLUDED.directory,
+            file_hash = EXCLUDED.file_hash,
+            chunker = EXCLUDED.chunker,
+            embedding_model = EXCLUDED.embedding_model,
+            total_chunks = EXCLUDED.total_chunks,
+            updated_at = NOW()
+        """,
+        (filename, directory, file_hash, chunker, embedding_model, total_chunks)
+    )
+    cursor.close()
+
+
+# --- Document-level source info (sources table) ---
+
+def upsert_sources(conn, rows: List[Dict[str, Any]]) -> int:
+    """
+    Insert or update sources rows (dicts with filename and any of source_url, file_hash,
+    language, file_size). Missing or None values never overwrite what is already stored.
+    """
+    # One row per filename, a statement can't upsert the same row twice
+    rows = list({row["filename"]: row for row in rows}.values())
+    if not rows:
+        return 0
+    cursor = conn.cursor()
+    execute_values(
+        cursor,
+        """
+        INSERT INTO sources (filename, source_url, file_hash, language, file_size)
+        VALUES %s
+        ON CONFLICT (filename) DO UPDATE SET
+            source_url = COALESCE(EXCLUDED.source_url, sources.source_url),
+            file_hash = COALESCE(EXCLUDED.file_hash, sources.file_hash),
+            language = COALESCE(EXCLUDED.language, sources.language),
+            file_size = COALESCE(EXCLUDED.file_size, sources.file_size),
+            updated_at = NOW()
+        """,
+        [
+            (row["filename"], row.get("source_url"), row.get("file_hash"),
+             row.get("language"), row.get("file_size"))
+            for row in rows
+        ],
+        page_size=1000
+    )
+    cursor.close()
+    return len(rows)
@@ -0,0 +1,111 @@
+"""
+Batched OpenAI embedding requests shared by the uploaders, the KPI upload and the chat app
+Packs many chunks into a single embeddings.create call (bounded by item and token limits),
+maps the results back by index and retries only the batch that failed.
+Texts found in the embedding cache are not sent to the API at all.
+"""
+
+from typing import Callable, List, Optional
+
+from tenacity import retry, stop_after_attempt, wait_exponential
+
+# OpenAI limits: 2048 inputs and ~300k tokens per request, we stay well below both
+EMBEDDING_BATCH_SIZE = 256  # max inputs per request
+EMBEDDING_BATCH_TOKENS = 200_000  # max (estimated) tokens per request
+CHARS_PER_TOKEN = 4  # rough estimate, 1000 characters ≈ 250 tokens
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate used to bound request size"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def make_batches(texts: List[str], max_items: int = EMBEDDING_BATCH_SIZE,
+                 max_tokens: int = EMBEDDING_BATCH_TOKENS) -> List[List[int]]:
+    """Group text indexes into batches that respect the item and token limits"""
+    batches = []
+    current = []
+    current_tokens = 0
+
+    for idx, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_items or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(idx)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+@retry(
+    stop=stop_after_attempt(5),
+    wait=wait_exponential(multiplier=1, min=4, max=30),
+    reraise=True
+)
+def embed_batch(client, texts: List[str], model: str,
+                dimensions: Optional[int] = None) -> List[List[float]]:
+    """Embed one batch in a single request, results ordered like the input"""
+    kwargs = {"model": model, "input": texts}
+    if dimensions:
+        kwargs["dimensions"] = dimensions
+    response = client.embeddings.create(**kwargs)
+
+    # The API returns an index per item, don't rely on response order
+    vectors = [None] * len(texts)
+    for item in response.data:
+        vectors[item.index] = item.embedding
+    if any(v is None for v in vectors):
+        raise ValueError(f"Embedding response incomplete: {len(response.data)}/{len(texts)} items")
+    return vectors
+
+
+def create_embeddings(client, texts: List[str], model: str,
+                      dimensions: Optional[int] = None,
+                      max_items: int = EMBEDDING_BATCH_SIZE,
+                      max_tokens: int = EMBEDDING_BATCH_TOKENS,
+                      raise_on_error: bool = True,
+                      progress: Optional[Callable[[int, int], None]] = None,
+                      cache=None) -> List[Optional[List[float]]]:
+    """
+    Create embeddings for many texts using as few requests as possible.
+
+    Returns one embedding per input text, in input order. When raise_on_error is
+    False, texts of a batch that kept failing after retries get None instead.
+    With a cache (embedding_cache.EmbeddingCache) only cache misses are requested
+    and new embeddings are stored.
+    """
+    if cache is not None:
+        embeddings = cache.get_many(model, dimensions, texts)
+    else:
+        embeddings = [None] * len(texts)
+
+    todo = [idx for idx, e in enumerate(embeddings) if e is None]
+    done = len(texts) - len(todo)
+    if progress and done:
+        progress(done, len(texts))
+
+    for batch in make_batches([texts[i] for i in todo], max_items, max_tokens):
+        batch = [todo[i] for i in batch]
+        batch_texts = [texts[i] for i in batch]
+        try:
+            vectors = embed_batch(client, batch_texts, model, dimensions)
+        except Exception as e:
+            if raise_on_error:
+                raise
+            print(f"\n   ✗ Embedding batch of {len(batch)} failed: {str(e)[:80]}", flush=True)
+            vectors = [None] * len(batch)
+        else:
+            if cache is not None:
+                cache.put_many(model, dimensions, batch_texts, vectors)
+
+        for idx, vector in zip(batch, vectors):
+            embeddings[idx] = vector
+        done += len(batch)
+        if progress:
+            progress(done, len(texts))
+
+    return embeddings
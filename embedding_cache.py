@@ -0,0 +1,165 @@
+"""
+Persistent on-disk embedding cache
+SQLite store keyed by (model, dimensions, hash of the normalized text) with size-bounded
+LRU eviction, shared by the uploaders, the KPI upload and the chat app
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from typing import Dict, List, Optional
+
+CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".embedding_cache.sqlite3")
+CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))  # ~600 MB at 1536 dims
+CACHE_ENABLED = os.getenv("EMBEDDING_CACHE", "on").lower() not in ("off", "0", "false", "no")
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text before hashing so trivial whitespace differences still hit"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode()).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Thread-safe SQLite embedding cache.
+
+    Embeddings are stored as float32 blobs. last_used is updated on every hit and
+    the least recently used entries are evicted once max_entries is exceeded.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                dimensions INTEGER NOT NULL,
+                text_hash TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, dimensions, text_hash)
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used_idx ON embeddings(last_used)")
+        self._db.commit()
+        self._entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, dimensions: Optional[int],
+                 texts: List[str]) -> List[Optional[List[float]]]:
+        """Cached embeddings in input order, None for misses"""
+        keys = [text_hash(t) for t in texts]
+        found = {}
+        with self._lock:
+            # Stay below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = list(set(keys[start:start + 500]))
+                rows = self._db.execute(
+                    f"""
+                    SELECT text_hash, embedding FROM embeddings
+                    WHERE model = ? AND dimensions = ? AND text_hash IN ({','.join('?' * len(batch))})
+                    """,
+                    [model, dimensions or 0, *batch]
+                ).fetchall()
+                found.update(rows)
+
+            if found:
+                now = time.time()
+                self._db.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND dimensions = ? AND text_hash = ?",
+                    [(now, model, dimensions or 0, key) for key in found]
+                )
+                self._db.commit()
+
+            results = []
+            for key in keys:
+                blob = found.get(key)
+                if blob is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    results.append(array('f', blob).tolist())
+        return results
+
+    def put_many(self, model: str, dimensions: Optional[int], texts: List[str],
+                 embeddings: List[Optional[List[float]]]):
+        """Store embeddings (None entries are skipped) and evict if over capacity"""
+        now = time.time()
+        rows = [
+            (model, dimensions or 0, text_hash(t), array('f', e).tobytes(), now)
+            for t, e in zip(texts, embeddings) if e is not None
+        ]
+        if not rows:
+            return
+        with self._lock:
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, dimensions, text_hash, embedding, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._entries += self._db.total_changes - before
+            if self._entries > self.max_entries:
+                self._evict()
+            self._db.commit()
+
+    def get(self, model: str, dimensions: Optional[int], text: str) -> Optional[List[float]]:
+        return self.get_many(model, dimensions, [text])[0]
+
+    def put(self, model: str, dimensions: Optional[int], text: str, embedding: List[float]):
+        self.put_many(model, dimensions, [text], [embedding])
+
+    def _evict(self):
+        # Drop the least recently used entries plus 10% headroom, so we don't evict on every put
+        excess = self._entries - int(self.max_entries * 0.9)
+        self._db.execute(
+            """
+            DELETE FROM embeddings WHERE rowid IN (
+                SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?
+            )
+            """,
+            (excess,)
+        )
+        self._entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": self._entries,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[EmbeddingCache]:
+    """Process-wide cache instance, None when disabled with EMBEDDING_CACHE=off"""
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
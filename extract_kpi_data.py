@@ -3,63 +3,138 @@ Extract KPI Data from Dashboard HTML and prepare for Supabase upload
 This script extracts company performance metrics and creates documents for the RAG system
 """
 
+import hashlib
 import json
+import os
 import re
-from datetime import datetime
+import tempfile
+import unicodedata
+
+from js_object import load_js_declaration
+
+# Extracted COMPANY_DATA per dashboard file, keyed on mtime/size and content hash ("" = no cache)
+KPI_DATA_CACHE_PATH = os.getenv("KPI_DATA_CACHE_PATH", ".kpi_data_cache.json")
+
+# Metrics of the dashboard (keys of COMPANY_DATA)
+METRICS_INFO = {
+    'growth': {
+        'full_name': 'Revenue Growth',
+        'description': 'Year-over-year revenue growth percentage',
+        'unit': '%'
+    },
+    'rule40': {
+        'full_name': 'Rule of 40',
+        'description': 'Growth rate + profit margin (Rule of 40 benchmark)',
+        'unit': '%'
+    },
+    'gross-margin': {
+        'full_name': 'Gross Margin',
+        'description': 'Gross profit margin percentage',
+        'unit': '%'
+    }
+}
 
 def extract_company_data_from_html(html_file_path):
-    """Extract COMPANY_DATA from the HTML file"""
-    with open(html_file_path, 'r', encoding='utf-8') as f:
-        html_content = f.read()
-    
-    # Find the COMPANY_DATA JavaScript object
-    pattern = r'const COMPANY_DATA\s*=\s*({[\s\S]*?});'
-    match = re.search(pattern, html_content)
-    
-    if not match:
-        raise ValueError("Could not find COMPANY_DATA in HTML file")
-    
-    # Extract the JavaScript object as string
-    js_object = match.group(1)
-    
-    # Convert JavaScript object to Python dict
-    # Replace single quotes with double quotes for JSON compatibility
-    # Handle property names without quotes
-    js_object = re.sub(r"'([^']+)':", r'"\1":', js_object)  # 'key': -> "key":
-    js_object = re.sub(r'([{,]\s*)(\w+):', r'\1"\2":', js_object)  # key: -> "key":
-    js_object = re.sub(r":\s*'([^']*)'", r': "\1"', js_object)  # : 'value' -> : "value"
-    
-    # Parse as JSON
+    """Extract COMPANY_DATA from the HTML file (JSParseError with the line and column when the
+    object is not valid)"""
+    return load_js_declaration(html_file_path, 'COMPANY_DATA')
+
+def file_sha256(path):
+    """SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _read_cache(cache_path):
     try:
-        company_data = json.loads(js_object)
-    except json.JSONDecodeError as e:
-        print("Error parsing JSON:", e)
-        print("Extracted object:", js_object[:500])
-        raise
-    
-    return company_data
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_cache(cache_path, cache):
+    # Write to a temporary file and rename, so a reader never sees half a cache
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(cache_path)), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"⚠️  Could not write KPI data cache {cache_path}: {e}")
+
+def load_company_data(html_file_path, cache_path=KPI_DATA_CACHE_PATH):
+    """
+    COMPANY_DATA of the dashboard, extracted again only when the file changed.
+
+    Same mtime and size as the cached entry: the cached data, without reading the file. Otherwise
+    the content hash decides: unchanged (touched, copied) uses the cached data, changed parses
+    the file. Returns (company_data, extracted), extracted False when it came from the cache.
+    """
+    if not cache_path:
+        return extract_company_data_from_html(html_file_path), True
+
+    stat = os.stat(html_file_path)
+    key = os.path.abspath(html_file_path)
+    cache = _read_cache(cache_path)
+    entry = cache.get(key)
+    if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+        return entry['data'], False
+
+    sha256 = file_sha256(html_file_path)
+    extracted = not entry or entry['sha256'] != sha256
+    data = extract_company_data_from_html(html_file_path) if extracted else entry['data']
+    cache[key] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': sha256, 'data': data}
+    _write_cache(cache_path, cache)
+    return data, extracted
+
+def _name_hash(name):
+    return hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]
+
+def company_slug(company):
+    """ASCII slug of a company name: 'Crème & Co' -> 'creme-co' (a hash when nothing is left)"""
+    ascii_name = unicodedata.normalize('NFKD', company).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', '-', ascii_name.lower()).strip('-') or _name_hash(company)
+
+def company_slugs(companies):
+    """Unique slug per company name; names whose slugs collide ('A&B', 'A-B') all get a short
+    hash of the name appended, so an ID never depends on the order of the companies"""
+    slugs = {company: company_slug(company) for company in companies}
+    counts = {}
+    for slug in slugs.values():
+        counts[slug] = counts.get(slug, 0) + 1
+    return {company: f"{slug}-{_name_hash(company)}" if counts[slug] > 1 else slug
+            for company, slug in slugs.items()}
+
+def kpi_document_id(report_type, metric, year, company=None, slugs=None):
+    """Stable ID of a KPI document, one per (report_type, company, metric, year); slugs are the
+    company_slugs of all companies, so colliding names get distinct IDs"""
+    slug = ((slugs or {}).get(company) or company_slug(company)) if company else 'portfolio'
+    return f"kpi/{report_type}/{slug}/{metric}/{year}"
+
+def kpi_document(report_type, filename, content, metadata, slugs=None):
+    """Document dict with its stable ID (also in the metadata, so database rows carry it)"""
+    doc_id = kpi_document_id(report_type, metadata['metric'], metadata['year'], metadata.get('company'),
+                             slugs)
+    return {
+        'id': doc_id,
+        'filename': filename,
+        'content': content,
+        'metadata': {**metadata, 'report_type': report_type, 'kpi_id': doc_id}
+    }
 
 def create_kpi_documents(company_data):
-    """Convert KPI data into document chunks for RAG system"""
+    """
+    Convert KPI data into document chunks for RAG system.
+
+    Deterministic: the same COMPANY_DATA always gives the same documents, byte for byte, so
+    upload_kpi_to_supabase.py only re-embeds documents whose content changed.
+    """
     documents = []
-    
-    metrics_info = {
-        'growth': {
-            'full_name': 'Revenue Growth',
-            'description': 'Year-over-year revenue growth percentage',
-            'unit': '%'
-        },
-        'rule40': {
-            'full_name': 'Rule of 40',
-            'description': 'Growth rate + profit margin (Rule of 40 benchmark)',
-            'unit': '%'
-        },
-        'gross-margin': {
-            'full_name': 'Gross Margin',
-            'description': 'Gross profit margin percentage',
-            'unit': '%'
-        }
-    }
+    metrics_info = METRICS_INFO
+    slugs = company_slugs(sorted({company for years_data in company_data.values()
+                                  for companies in years_data.values() for company in companies}))
     
     # Create overview documents for each metric
     for metric_key, years_data in company_data.items():
@@ -88,17 +163,17 @@ ARR Buckets Represented:
 {', '.join(sorted(set(data['bucket'] for data in companies.values())))}
 """
             
-            documents.append({
-                'filename': f'KPI_Dashboard_{metric_key}_{year}.txt',
-                'content': summary_content.strip(),
-                'metadata': {
+            documents.append(kpi_document(
+                'metric_summary',
+                f'KPI_Dashboard_{metric_key}_{year}.txt',
+                summary_content.strip(),
+                {
                     'source_type': 'kpi_dashboard',
                     'metric': metric_key,
                     'year': year,
-                    'company_count': len(companies),
-                    'date_added': datetime.now().isoformat()
+                    'company_count': len(companies)
                 }
-            })
+            ))
             
             # Create individual company documents
             for company_name, data in companies.items():
@@ -119,19 +194,20 @@ The company is in the {data['bucket']} ARR (Annual Recurring Revenue) bucket.
 This data is from the Keen Venture Partners KPI Dashboard and represents portfolio company performance metrics.
 """
                 
-                documents.append({
-                    'filename': f'Company_{company_name}_{metric_key}_{year}.txt',
-                    'content': company_content.strip(),
-                    'metadata': {
+                documents.append(kpi_document(
+                    'company_report',
+                    f'Company_{company_name}_{metric_key}_{year}.txt',
+                    company_content.strip(),
+                    {
                         'source_type': 'kpi_dashboard',
                         'company': company_name,
                         'metric': metric_key,
                         'year': year,
                         'value': data['value'],
-                        'arr_bucket': data['bucket'],
-                        'date_added': datetime.now().isoformat()
-                    }
-                })
+                        'arr_bucket': data['bucket']
+                    },
+                    slugs
+                ))
     
     # Create cross-company comparison documents
     for metric_key, years_data in company_data.items():
@@ -158,20 +234,19 @@ The highest performing companies by {metric_name.lower()} in {year}:
 
 Analysis:
 These companies represent the top performers in {metric_name.lower()} among Keen Venture Partners' portfolio companies for {year}.
-The performance spans across different ARR buckets: {', '.join(set(data['bucket'] for _, data in top_5))}.
+The performance spans across different ARR buckets: {', '.join(dict.fromkeys(data['bucket'] for _, data in top_5))}.
 """
             
-            documents.append({
-                'filename': f'Top_Performers_{metric_key}_{year}.txt',
-                'content': top_content.strip(),
-                'metadata': {
+            documents.append(kpi_document(
+                'top_performers',
+                f'Top_Performers_{metric_key}_{year}.txt',
+                top_content.strip(),
+                {
                     'source_type': 'kpi_dashboard',
                     'metric': metric_key,
-                    'year': year,
-                    'report_type': 'top_performers',
-                    'date_added': datetime.now().isoformat()
+                    'year': year
                 }
-            })
+            ))
     
     # Create benchmark documents by ARR bucket
     for metric_key, years_data in company_data.items():
@@ -214,17 +289,16 @@ Key Insights:
 - Data sourced from Keen Venture Partners KPI Dashboard {year}
 """
             
-            documents.append({
-                'filename': f'ARR_Bucket_Analysis_{metric_key}_{year}.txt',
-                'content': bucket_content.strip(),
-                'metadata': {
+            documents.append(kpi_document(
+                'arr_bucket_analysis',
+                f'ARR_Bucket_Analysis_{metric_key}_{year}.txt',
+                bucket_content.strip(),
+                {
                     'source_type': 'kpi_dashboard',
                     'metric': metric_key,
-                    'year': year,
-                    'report_type': 'arr_bucket_analysis',
-                    'date_added': datetime.now().isoformat()
+                    'year': year
                 }
-            })
+            ))
     
     return documents
 
@@ -261,9 +335,12 @@ if __name__ == '__main__':
     html_file = 'KeenKPIDashboard.html'
     
     try:
-        # Extract data
-        company_data = extract_company_data_from_html(html_file)
-        print(f"✓ Extracted data for {len(company_data)} metrics")
+        # Extract data (cached until the dashboard changes)
+        company_data, extracted = load_company_data(html_file)
+        if extracted:
+            print(f"✓ Extracted data for {len(company_data)} metrics")
+        else:
+            print(f"✓ Dashboard unchanged, using cached data for {len(company_data)} metrics")
         
         # Create documents
         documents = create_kpi_documents(company_data)
@@ -9,12 +9,12 @@ print('\n' + '='*60)
 print('📊 FINAL UPLOAD STATISTICS')
 print('='*60)
 
-cursor.execute('SELECT file_type, COUNT(DISTINCT filename) as files, COUNT(*) as chunks FROM documents GROUP BY file_type ORDER BY files DESC')
+cursor.execute('SELECT file_type, COUNT(*) as files, SUM(total_chunks) as chunks FROM source_documents GROUP BY file_type ORDER BY files DESC')
 print('\nPer bestandstype:')
 for row in cursor.fetchall():
     print(f'   {row[0].upper()}: {row[1]} files, {row[2]:,} chunks')
 
-cursor.execute('SELECT COUNT(DISTINCT filename), COUNT(*) FROM documents')
+cursor.execute('SELECT files, chunks FROM corpus_stats')
 total = cursor.fetchone()
 print(f'\n📦 TOTAAL:')
 print(f'   Files:  {total[0]}/387 ({total[0]/387*100:.1f}%)')
@@ -0,0 +1,251 @@
+"""
+Concurrent ingestion pipeline shared by the uploaders
+Stages: read + chunk (process pool) -> embed (thread pool) -> write (single writer thread),
+connected by bounded queues so a slow stage applies backpressure to the stages before it
+"""
+
+import hashlib
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional
+
+import PyPDF2
+
+# Default concurrency per stage
+READ_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # PDF parsing is CPU bound
+EMBED_WORKERS = 4  # concurrent embedding requests
+QUEUE_SIZE = 8  # documents buffered between stages
+
+_DONE = object()  # end-of-stream marker
+
+
+@dataclass
+class PreparedDocument:
+    """A file that has been read and chunked, ready to be embedded"""
+    file_path: Path
+    file_type: str
+    chunks: List[str] = field(default_factory=list)
+    file_size: int = 0
+    file_hash: str = ""
+    content_length: int = 0
+    error: Optional[str] = None
+
+
+def read_txt_file(file_path: Path) -> str:
+    """Read content from a TXT file"""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except UnicodeDecodeError:
+        # Try with different encoding
+        with open(file_path, 'r', encoding='latin-1') as f:
+            return f.read()
+
+
+def read_pdf_file(file_path: Path) -> str:
+    """Read content from a PDF file"""
+    text = ""
+    with open(file_path, 'rb') as f:
+        pdf_reader = PyPDF2.PdfReader(f)
+        for page in pdf_reader.pages:
+            text += page.extract_text() + "\n"
+    return text
+
+
+def chunk_text(text: str, chunk_size: int, overlap: int) -> List[str]:
+    """Split text into overlapping chunks"""
+    chunks = []
+    start = 0
+    text_length = len(text)
+
+    while start < text_length:
+        end = start + chunk_size
+        chunk = text[start:end]
+
+        # Try to break at sentence or word boundary if not at end
+        if end < text_length:
+            # Look for sentence end
+            last_period = chunk.rfind('. ')
+            last_newline = chunk.rfind('\n')
+            last_break = max(last_period, last_newline)
+
+            if last_break > chunk_size * 0.5:  # Only break if we're past halfway
+                chunk = chunk[:last_break + 1]
+                end = start + last_break + 1
+
+        chunks.append(chunk.strip())
+        start = end - overlap
+
+    return [c for c in chunks if c]  # Remove empty chunks
+
+
+def prepare_document(file_path: Path, chunk_size: int, overlap: int) -> PreparedDocument:
+    """Read and chunk a single file (runs in a worker process)"""
+    file_path = Path(file_path)
+    file_extension = file_path.suffix.lower()
+    doc = PreparedDocument(file_path=file_path, file_type=file_extension[1:])
+
+    try:
+        if file_extension == '.txt':
+            content = read_txt_file(file_path)
+        elif file_extension == '.pdf':
+            content = read_pdf_file(file_path)
+        else:
+            doc.error = f"Unsupported file type: {file_extension}"
+            return doc
+        doc.file_size = file_path.stat().st_size
+    except Exception as e:
+        doc.error = f"Failed to read file: {e}"
+        return doc
+
+    if not content.strip():
+        doc.error = "File is empty or could not extract content"
+        return doc
+
+    doc.content_length = len(content)
+    doc.file_hash = hashlib.md5(content.encode()).hexdigest()
+    doc.chunks = chunk_text(content, chunk_size, overlap)
+    return doc
+
+
+def file_hash(file_path: Path) -> str:
+    """md5 of the raw file bytes, cheap enough to check every file on every sync"""
+    digest = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def find_documents(dir_path: Path) -> List[Path]:
+    """All TXT and PDF files directly inside a directory"""
+    return list(dir_path.glob("*.txt")) + list(dir_path.glob("*.pdf"))
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """Blocking put that gives up once the pipeline is stopping"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    """Blocking get that gives up once the pipeline is stopping"""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def run_pipeline(files: Iterable[Path],
+                 prepare: Callable[[Path], PreparedDocument],
+                 embed: Callable[[PreparedDocument], List[Optional[List[float]]]],
+                 write: Callable[[PreparedDocument, Optional[List[Optional[List[float]]]]], None],
+                 read_workers: int = READ_WORKERS,
+                 embed_workers: int = EMBED_WORKERS,
+                 queue_size: int = QUEUE_SIZE) -> None:
+    """
+    Run files through read/chunk -> embed -> write with bounded concurrency.
+
+    prepare must be picklable (a module-level function or functools.partial of one)
+    because it runs in a process pool; read_workers <= 0 runs it in a thread instead.
+    embed runs in embed_workers threads. write is called from the calling thread
+    only, so it may safely use a single database connection. Documents whose
+    reading or embedding failed are still passed to write with doc.error set and
+    embeddings None, so the caller reports every file.
+    """
+    embed_workers = max(1, embed_workers)
+    embed_queue = queue.Queue(maxsize=max(1, queue_size))
+    write_queue = queue.Queue(maxsize=max(1, queue_size))
+    stop = threading.Event()
+
+    def read_stage():
+        try:
+            if read_workers <= 0:
+                for file_path in files:
+                    if not _put(embed_queue, prepare(file_path), stop):
+                        return
+                return
+
+            pool = ProcessPoolExecutor(max_workers=read_workers)
+            try:
+                # Keep a bounded number of files in flight, results stay in input order
+                pending = deque()
+                for file_path in files:
+                    if stop.is_set():
+                        return
+                    pending.append((file_path, pool.submit(prepare, file_path)))
+                    if len(pending) >= read_workers * 2:
+                        if not _put(embed_queue, _result(*pending.popleft()), stop):
+                            return
+                while pending:
+                    if not _put(embed_queue, _result(*pending.popleft()), stop):
+                        return
+            finally:
+                pool.shutdown(wait=not stop.is_set(), cancel_futures=stop.is_set())
+        finally:
+            for _ in range(embed_workers):
+                _put(embed_queue, _DONE, stop)
+
+    def embed_stage():
+        try:
+            while True:
+                doc = _get(embed_queue, stop)
+                if doc is _DONE:
+                    return
+                embeddings = None
+                if doc.error is None:
+                    try:
+                        embeddings = embed(doc)
+                    except Exception as e:
+                        doc.error = f"Failed to create embeddings: {e}"
+                if not _put(write_queue, (doc, embeddings), stop):
+                    return
+        finally:
+            _put(write_queue, _DONE, stop)
+
+    threads = [threading.Thread(target=read_stage, name="ingest-read", daemon=True)]
+    threads += [
+        threading.Thread(target=embed_stage, name=f"ingest-embed-{i}", daemon=True)
+        for i in range(embed_workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    # Single writer: runs on the calling thread
+    try:
+        finished = 0
+        while finished < embed_workers:
+            item = _get(write_queue, stop)
+            if item is _DONE:
+                finished += 1
+                continue
+            write(*item)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=5)
+
+
+def _result(file_path: Path, future) -> PreparedDocument:
+    """Result of a prepare job, turning worker crashes into a per-file error"""
+    try:
+        return future.result()
+    except Exception as e:
+        file_path = Path(file_path)
+        return PreparedDocument(
+            file_path=file_path,
+            file_type=file_path.suffix.lower()[1:],
+            error=f"Failed to read file: {e}"
+        )
@@ -0,0 +1,271 @@
+"""
+Parser for JavaScript object literals
+Reads data declared in a script, like `const COMPANY_DATA = {...};` in KeenKPIDashboard.html,
+without rewriting it to JSON first. Supports the literal subset that hand-written data uses:
+unquoted and quoted keys, single- and double-quoted strings (with escapes), numbers (also hex,
+exponents and a sign), true/false/null, nested objects and arrays, trailing commas and // and
+/* */ comments.
+
+The file is read in blocks and tokenized in a single pass; reading stops at the end of the
+declared value. Errors are JSParseError (a ValueError) with the line and column.
+
+Usage:
+    python js_object.py KeenKPIDashboard.html COMPANY_DATA
+"""
+
+import io
+import json
+import re
+import sys
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+
+BLOCK_SIZE = 16384
+_LOOKAHEAD = 3  # characters after a token that decide where it ends (e.g. "e+3" of a number)
+
+# Whitespace and comments, then one token (punctuation is its own kind)
+_TOKEN = re.compile(r"""
+    (?:\s+|//[^\n]*|/\*[\s\S]*?\*/)*
+    (?:
+        (?P<punct>[{}\[\]:,])
+      | (?P<string>'(?:[^'\\\n]|\\[\s\S])*'|"(?:[^"\\\n]|\\[\s\S])*")
+      | (?P<number>[+-]?(?:0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?))
+      | (?P<name>[A-Za-z_$][\w$]*)
+      | (?P<error>[\s\S])
+    )?
+""", re.X)
+
+# Keyword before "<name> =" (searched on the same line)
+_DECLARATION = re.compile(r"(?<![\w$])(?:const|let|var)\s+$")
+
+_ESCAPE = re.compile(r"\\(u\{[0-9a-fA-F]+\}|u[0-9a-fA-F]{4}|x[0-9a-fA-F]{2}|\r\n|[\s\S])")
+_SIMPLE_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "v": "\v", "0": "\0",
+                   "\n": "", "\r\n": "", "\r": ""}  # backslash-newline continues the line
+
+_NAMES = {"true": True, "false": False, "null": None, "undefined": None,
+          "Infinity": float("inf"), "NaN": float("nan")}
+
+
+class JSParseError(ValueError):
+    """Syntax error in a JavaScript object literal, with its location (1-based line and column)"""
+
+    def __init__(self, message: str, source: str = "<string>", line: int = 0, column: int = 0,
+                 line_text: str = ""):
+        self.message = message
+        self.source = source
+        self.line = line
+        self.column = column
+        location = f"{source}:{line}:{column}: " if line else f"{source}: "
+        if line_text:
+            message += f"\n    {line_text}\n    {' ' * (column - 1)}^"
+        super().__init__(location + message)
+
+
+def _unescape(text: str) -> str:
+    def replace(match):
+        escape = match.group(1)
+        if escape.startswith("u{"):
+            return chr(int(escape[2:-1], 16))
+        if escape[0] in "ux" and len(escape) > 1:
+            return chr(int(escape[1:], 16))
+        return _SIMPLE_ESCAPES.get(escape, escape)
+    return _ESCAPE.sub(replace, text) if "\\" in text else text
+
+
+class _Tokenizer:
+    """Tokens of a text stream, read in blocks as the tokens need it"""
+
+    def __init__(self, stream: TextIO, source: str, block_size: int = BLOCK_SIZE):
+        self.stream = stream
+        self.source = source
+        self.block_size = block_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.base_line = 1  # line of buffer[0]; the buffer always starts at a line start
+
+    def read_more(self) -> bool:
+        """Append the next block, False at the end of the stream. Consumed lines are dropped
+        from the buffer; the current line stays for error messages."""
+        if self.eof:
+            return False
+        block = self.stream.read(self.block_size)
+        if not block:
+            self.eof = True
+            return False
+        cut = self.buffer.rfind("\n", 0, self.pos) + 1
+        self.base_line += self.buffer.count("\n", 0, cut)
+        self.buffer = self.buffer[cut:] + block
+        self.pos -= cut
+        return True
+
+    def location(self, pos: int) -> Tuple[int, int, str]:
+        """Line, column and text of the line at a buffer position"""
+        line_start = self.buffer.rfind("\n", 0, pos) + 1
+        line_end = self.buffer.find("\n", pos)
+        line_text = self.buffer[line_start:line_end if line_end >= 0 else len(self.buffer)]
+        return self.base_line + self.buffer.count("\n", 0, pos), pos - line_start + 1, line_text.rstrip("\r")
+
+    def error(self, message: str, pos: Optional[int] = None) -> JSParseError:
+        if pos is not None:
+            self.pos = pos
+        while self.buffer.find("\n", self.pos) < 0 and self.read_more():
+            pass  # the rest of the line, for the message
+        line, column, line_text = self.location(self.pos)
+        return JSParseError(message, self.source, line, column, line_text)
+
+    def find_declaration(self, name: str) -> bool:
+        """Move to just after `const|let|var <name> =`, reading as far as needed; False when
+        there is no such declaration"""
+        assignment = re.compile(re.escape(name) + r"\s*=(?!=)")
+        while True:
+            match = assignment.search(self.buffer, self.pos)
+            if match and (match.end() < len(self.buffer) or self.eof):
+                self.pos = match.end()
+                line_start = self.buffer.rfind("\n", 0, match.start()) + 1
+                if _DECLARATION.search(self.buffer, line_start, match.start()):
+                    return True
+                continue
+            if not match:
+                if self.eof:
+                    return False
+                # The name may start in this block and end in the next one
+                self.pos = max(self.pos, len(self.buffer) - len(name) - 64)
+            self.read_more()
+
+    def next(self) -> Tuple[str, str, int]:
+        """(kind, text, position) of the next token, skipping whitespace and comments; kind is
+        the character for punctuation, "end" at the end of the stream"""
+        while True:
+            match = _TOKEN.match(self.buffer, self.pos)
+            kind = match.lastgroup
+            # A token near the end of the buffer may continue in the next block ("0" of "0x1F",
+            # "1e" of "1e+3"); an unterminated string or comment may end there
+            if (match.end() + _LOOKAHEAD > len(self.buffer) or kind == "error") and self.read_more():
+                continue
+            self.pos = match.end()
+            if kind is None:
+                return "end", "", self.pos
+            start = match.start(kind)
+            text = match.group(kind)
+            if kind == "punct":
+                return text, text, start
+            if kind == "error":
+                if text in "'\"":
+                    raise self.error("unterminated string", start)
+                if self.buffer.startswith("/*", start):
+                    raise self.error("unterminated comment", start)
+                raise self.error(f"unexpected character {text!r}", start)
+            return kind, text, start
+
+
+class _Parser:
+    """Recursive descent over the tokens; reads nothing after the end of the value"""
+
+    def __init__(self, tokenizer: _Tokenizer):
+        self.tokenizer = tokenizer
+
+    def unexpected(self, expected: str, token: Tuple[str, str, int]) -> JSParseError:
+        kind, text, pos = token
+        found = "end of file" if kind == "end" else repr(text)
+        return self.tokenizer.error(f"expected {expected}, found {found}", pos)
+
+    def value(self, token: Optional[Tuple[str, str, int]] = None) -> Any:
+        """The value starting with token (default: the next token)"""
+        kind, text, pos = token = token or self.tokenizer.next()
+        if kind == "{":
+            return self.object()
+        if kind == "[":
+            return self.array()
+        if kind == "string":
+            return _unescape(text[1:-1])
+        if kind == "number":
+            return _number(text)
+        if kind == "name" and text in _NAMES:
+            return _NAMES[text]
+        raise self.unexpected("a value", token)
+
+    def key(self, token: Tuple[str, str, int]) -> str:
+        kind, text, pos = token
+        if kind == "string":
+            return _unescape(text[1:-1])
+        if kind == "name":
+            return text
+        if kind == "number" and text[0] not in "+-":
+            return str(_number(text))
+        raise self.unexpected("a property name or '}'", token)
+
+    def object(self) -> Dict[str, Any]:
+        next_token = self.tokenizer.next
+        result = {}
+        token = next_token()
+        while token[0] != "}":
+            key = self.key(token)
+            token = next_token()
+            if token[0] != ":":
+                raise self.unexpected("':'", token)
+            result[key] = self.value()
+            token = next_token()
+            if token[0] == ",":
+                token = next_token()
+            elif token[0] != "}":
+                raise self.unexpected("',' or '}'", token)
+        return result
+
+    def array(self) -> List[Any]:
+        next_token = self.tokenizer.next
+        result = []
+        token = next_token()
+        while token[0] != "]":
+            result.append(self.value(token))
+            token = next_token()
+            if token[0] == ",":
+                token = next_token()
+            elif token[0] != "]":
+                raise self.unexpected("',' or ']'", token)
+        return result
+
+
+def _number(text: str):
+    sign = -1 if text[0] == "-" else 1
+    digits = text.lstrip("+-")
+    if digits[:2].lower() == "0x":
+        return sign * int(digits, 16)
+    if any(c in digits for c in ".eE"):
+        return sign * float(digits)
+    return sign * int(digits)
+
+
+def parse_js_value(text: str, source: str = "<string>") -> Any:
+    """The JavaScript literal in text (nothing but whitespace and comments may follow it)"""
+    parser = _Parser(_Tokenizer(io.StringIO(text), source))
+    value = parser.value()
+    token = parser.tokenizer.next()
+    if token[0] != "end":
+        raise parser.unexpected("end of input", token)
+    return value
+
+
+def read_js_declaration(stream: TextIO, name: str, source: str = "<stream>",
+                        block_size: int = BLOCK_SIZE) -> Any:
+    """Value of the first `const|let|var <name> = <literal>` in a script or HTML page"""
+    tokenizer = _Tokenizer(stream, source, block_size)
+    if not tokenizer.find_declaration(name):
+        raise JSParseError(f"no declaration of {name} found", source)
+    return _Parser(tokenizer).value()
+
+
+def load_js_declaration(path: str, name: str, block_size: int = BLOCK_SIZE) -> Any:
+    """read_js_declaration for a file"""
+    with open(path, "r", encoding="utf-8") as f:
+        return read_js_declaration(f, name, path, block_size)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python js_object.py <file> <name>")
+        sys.exit(1)
+    try:
+        print(json.dumps(load_js_declaration(sys.argv[1], sys.argv[2]), indent=2, ensure_ascii=False))
+    except JSParseError as e:
+        print(f"✗ {e}")
+        sys.exit(1)
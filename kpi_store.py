@@ -0,0 +1,406 @@
+"""
+Structured KPI store and question router
+The COMPANY_DATA of the KPI dashboard as typed records in memory (company x metric x year ->
+value, ARR bucket), with indexes for lookups, rankings and ARR bucket averages. route() answers
+those questions straight from the store, in microseconds and citing the dashboard, so they
+skip search and gpt-4o; open questions ("why did ...", "what is the Rule of 40?") get None and
+go to the RAG pipeline (see rag_engine.RAGEngine).
+
+Usage:
+    python kpi_store.py "What is Doctify's growth rate?"
+"""
+
+import re
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from extract_kpi_data import METRICS_INFO, load_company_data
+
+KPI_DASHBOARD_PATH = "KeenKPIDashboard.html"
+
+# Question words per metric (English, Dutch, Spanish), longest match wins
+METRIC_ALIASES = {
+    "growth": ["revenue growth", "growth rate", "growth", "omzetgroei", "groei", "crecimiento"],
+    "rule40": ["rule of 40", "rule of forty", "rule-of-40", "rule40", "regel van 40", "regla del 40",
+               "regla de 40"],
+    "gross-margin": ["gross margin", "gross-margin", "brutomarge", "margen bruto", "marge", "margin",
+                     "margen"],
+}
+
+# Questions asking for an explanation need the documents, not a number
+EXPLANATION_PATTERN = re.compile(
+    r"\b(why|how come|explain|reason|cause|waarom|verklaar|leg uit|oorzaak|por qu[eé]|explica)\b", re.I
+)
+RANKING_PATTERN = re.compile(
+    r"\b(top|highest|best|lowest|worst|bottom|rank|ranking|ranked|hoogste|laagste|beste|slechtste|"
+    r"mejor|mejores|peor|peores|mayor|menor|m[aá]s alto|m[aá]s bajo)\b", re.I
+)
+LOWEST_PATTERN = re.compile(
+    r"\b(lowest|worst|bottom|least|laagste|slechtste|peor|peores|menor|m[aá]s bajo)\b", re.I
+)
+AVERAGE_PATTERN = re.compile(
+    r"\b(average|avg|mean|buckets?|gemiddeld\w*|promedio|media)\b", re.I
+)
+# Rankings and averages must be about the portfolio, not "the best growth strategies" or "the
+# average growth of SaaS companies"
+PORTFOLIO_PATTERN = re.compile(r"\b(portfolio|buckets?|arr|portefeuille|cartera)\b", re.I)
+RANKING_SCOPE_PATTERN = re.compile(
+    r"\b(compan(y|ies)|rank\w*|who|which|bedrij\w*|wie|welke?|empresas?|qui[eé]n|cu[aá]l(es)?)\b", re.I
+)
+# A lookup must ask for the figure itself ("what was", "how much", "rate", a year), not about
+# something else around the company and metric ("growth marketing tactics Feather uses")
+VALUE_PATTERN = re.compile(
+    r"\b(what(?:'s| is| was| were| are)|how (?:much|high|big|large)|rates?|values?|numbers?|figures?|"
+    r"percentages?|wat (?:is|was|zijn|waren)|hoeveel|hoe hoog|cu[aá]l (?:es|fue|era)|cu[aá]nto|"
+    r"valor|cifra|20\d\d)\b", re.I
+)
+# Words that may surround the company, metric and year in a lookup; any other word is content
+# the store cannot answer
+LOOKUP_WORDS = {
+    # English
+    "what", "whats", "is", "was", "were", "are", "the", "a", "an", "of", "for", "in", "at", "on",
+    "to", "and", "or", "vs", "versus", "s", "its", "their", "how", "much", "high", "big", "large",
+    "rate", "rates", "value", "values", "number", "numbers", "figure", "figures", "percentage",
+    "percentages", "year", "years", "show", "give", "me", "tell", "us", "compare", "did", "does",
+    "do", "has", "have", "had", "latest", "current", "kpi", "kpis", "dashboard", "by", "with",
+    # Dutch
+    "wat", "zijn", "waren", "de", "het", "een", "van", "voor", "op", "en", "hoe", "hoog", "hoeveel",
+    "toon", "geef", "mij", "jaar", "waarde", "waarden", "cijfer", "vergelijk", "heeft", "had",
+    # Spanish
+    "cual", "cuál", "es", "fue", "era", "son", "el", "la", "los", "las", "del", "y", "cuanto",
+    "cuánto", "muestra", "dame", "valor", "valores", "cifra", "año", "tiene", "tuvo", "compara",
+}
+WORD_PATTERN = re.compile(r"[^\W\d_]+")
+TOP_N_PATTERN = re.compile(r"\b(?:top|best|beste|mejores)\s+(\d{1,2})\b", re.I)
+YEAR_PATTERN = re.compile(r"\b(20\d\d)\b")
+BUCKET_PATTERN = re.compile(r"<\s*\d+\s*M|\b\d+\s*M?\s*[-–]\s*\d+\s*M\b", re.I)
+
+TEXT = {
+    "ENGLISH": {
+        "lookup": "**{company}** · {metric} {year}: **{value}** (ARR bucket {bucket}, #{rank} of {count})",
+        "missing": "**{company}** · {metric}: not in the KPI dashboard",
+        "portfolio": "Portfolio",
+        "ranking": "**{metric} {year}** ({order}):",
+        "highest": "highest first",
+        "lowest": "lowest first",
+        "average": "**Average {metric} per ARR bucket, {year}**:",
+        "source": "Source: KEEN KPI Dashboard [Source 1]",
+    },
+    "DUTCH": {
+        "lookup": "**{company}** · {metric} {year}: **{value}** (ARR bucket {bucket}, #{rank} van {count})",
+        "missing": "**{company}** · {metric}: niet in het KPI dashboard",
+        "portfolio": "Portefeuille",
+        "ranking": "**{metric} {year}** ({order}):",
+        "highest": "hoogste eerst",
+        "lowest": "laagste eerst",
+        "average": "**Gemiddelde {metric} per ARR bucket, {year}**:",
+        "source": "Bron: KEEN KPI Dashboard [Source 1]",
+    },
+    "SPANISH": {
+        "lookup": "**{company}** · {metric} {year}: **{value}** (bucket ARR {bucket}, #{rank} de {count})",
+        "missing": "**{company}** · {metric}: no está en el KPI dashboard",
+        "portfolio": "Cartera",
+        "ranking": "**{metric} {year}** ({order}):",
+        "highest": "de mayor a menor",
+        "lowest": "de menor a mayor",
+        "average": "**{metric} promedio por bucket ARR, {year}**:",
+        "source": "Fuente: KEEN KPI Dashboard [Source 1]",
+    },
+}
+
+
+def normalize_bucket(label: str) -> str:
+    """One spelling per ARR bucket: '1M – 5M', '1–5M' and '1-5M' are all '1-5M', '<1M' is '< 1M'"""
+    label = re.sub(r"\s+", "", label).replace("–", "-").upper()
+    label = re.sub(r"M(?=-)", "", label)
+    if label.startswith("<"):
+        return "< " + label[1:]
+    return label
+
+
+def format_value(value: float, unit: str) -> str:
+    """23.84 -> '23.84%', 1651.0 -> '1,651%'"""
+    return f"{value:,.2f}".rstrip("0").rstrip(".") + unit
+
+
+@dataclass(frozen=True)
+class KPIRecord:
+    company: str
+    metric: str  # key of METRICS_INFO
+    year: str
+    value: float
+    bucket: str  # normalized ARR bucket
+
+    @property
+    def metric_name(self) -> str:
+        return METRICS_INFO[self.metric]["full_name"]
+
+    @property
+    def display_value(self) -> str:
+        return format_value(self.value, METRICS_INFO[self.metric]["unit"])
+
+
+@dataclass
+class KPIAnswer:
+    intent: str  # lookup, ranking or bucket_average
+    text: str  # markdown, ends with the citation
+    records: List[KPIRecord] = field(default_factory=list)
+
+
+class KPIStore:
+    """KPI records with indexes by (company, metric, year) and by (metric, year)"""
+
+    def __init__(self, records: Iterable[KPIRecord], path: str = KPI_DASHBOARD_PATH):
+        self.path = path
+        self.records = list(records)
+        self.by_key: Dict[Tuple[str, str, str], KPIRecord] = {}
+        rankings = defaultdict(list)
+        for record in self.records:
+            self.by_key[(record.company, record.metric, record.year)] = record
+            rankings[(record.metric, record.year)].append(record)
+        # Highest value first, ties by company name
+        self.rankings: Dict[Tuple[str, str], List[KPIRecord]] = {
+            key: sorted(records, key=lambda record: (-record.value, record.company))
+            for key, records in rankings.items()
+        }
+        self.rank = {record: position
+                     for ranking in self.rankings.values()
+                     for position, record in enumerate(ranking, 1)}
+        self.companies = sorted({record.company for record in self.records})
+        self.years = sorted({record.year for record in self.records})
+        self._company_pattern = self._alternation(
+            {alias: company for company in self.companies for alias in company_aliases(company)}
+        )
+        self._metric_pattern = self._alternation(
+            {alias: metric for metric, aliases in METRIC_ALIASES.items() for alias in aliases
+             if metric in METRICS_INFO}
+        )
+
+    @staticmethod
+    def _alternation(aliases: Dict[str, str]):
+        """Whole-word, case-insensitive regex for the aliases (longest first) and its lookup"""
+        ordered = sorted(aliases, key=len, reverse=True)
+        pattern = re.compile(r"(?<!\w)(" + "|".join(re.escape(alias) for alias in ordered) + r")(?!\w)", re.I)
+        return pattern, {alias.lower(): value for alias, value in aliases.items()}
+
+    @classmethod
+    def from_company_data(cls, company_data: Dict, path: str = KPI_DASHBOARD_PATH) -> "KPIStore":
+        """Store for COMPANY_DATA: {metric: {year: {company: {"value", "bucket"}}}}"""
+        return cls((
+            KPIRecord(company, metric, str(year), float(entry["value"]), normalize_bucket(entry["bucket"]))
+            for metric, years in company_data.items()
+            for year, companies in years.items()
+            for company, entry in companies.items()
+        ), path)
+
+    @classmethod
+    def from_html(cls, path: str = KPI_DASHBOARD_PATH) -> "KPIStore":
+        """Store for the COMPANY_DATA of the dashboard HTML (ValueError when there is none)"""
+        company_data, _ = load_company_data(path)
+        if not company_data:
+            raise ValueError(f"No COMPANY_DATA in {path}")
+        return cls.from_company_data(company_data, path)
+
+    # Queries
+
+    def get(self, company: str, metric: str, year: str) -> Optional[KPIRecord]:
+        return self.by_key.get((company, metric, year))
+
+    def history(self, company: str, metric: str) -> List[KPIRecord]:
+        """Records of a company for a metric, oldest year first"""
+        return [record for year in self.years
+                if (record := self.by_key.get((company, metric, year)))]
+
+    def ranking(self, metric: str, year: str, top: Optional[int] = None,
+                ascending: bool = False) -> List[KPIRecord]:
+        ranking = self.rankings.get((metric, year), [])
+        if ascending:
+            ranking = ranking[::-1]
+        return ranking[:top] if top else list(ranking)
+
+    def bucket_averages(self, metric: str, year: str) -> Dict[str, List[KPIRecord]]:
+        """Records per ARR bucket (smallest bucket first)"""
+        buckets = defaultdict(list)
+        for record in self.rankings.get((metric, year), []):
+            buckets[record.bucket].append(record)
+        return dict(sorted(buckets.items(), key=lambda item: bucket_order(item[0])))
+
+    def latest_year(self, metric: str) -> Optional[str]:
+        years = [year for year in self.years if (metric, year) in self.rankings]
+        return years[-1] if years else None
+
+    # Question routing
+
+    def _find(self, alternation, text: str) -> List[str]:
+        pattern, lookup = alternation
+        found = []
+        for match in pattern.finditer(text):
+            value = lookup[match.group(1).lower()]
+            if value not in found:
+                found.append(value)
+        return found
+
+    def route(self, question: str, language: str = "ENGLISH") -> Optional[KPIAnswer]:
+        """
+        Direct answer for a KPI lookup, ranking or ARR bucket average, None for other questions
+        and for questions the store has no figures for.
+
+        lookup          a company (or several) and a metric, asking for the figure: "What is
+                        Doctify's growth rate?" (not "What growth tactics does Feather use?")
+        bucket_average  a metric and average/bucket: "Average gross margin per ARR bucket in 2024"
+        ranking         a metric and top/highest/lowest: "Top 3 companies by Rule of 40"
+        """
+        if EXPLANATION_PATTERN.search(question):
+            return None
+        metrics = self._find(self._metric_pattern, question)
+        if not metrics:
+            return None
+        companies = self._find(self._company_pattern, question)
+        years = [year for year in YEAR_PATTERN.findall(question) if year in self.years]
+        text = TEXT.get(language, TEXT["ENGLISH"])
+
+        top = TOP_N_PATTERN.search(question)
+        if companies:
+            if not self._asks_for_value(question):
+                return None
+            answer = self._lookup(companies, metrics, years, text)
+        elif AVERAGE_PATTERN.search(question):
+            buckets = [normalize_bucket(label) for label in BUCKET_PATTERN.findall(question)]
+            if not (buckets or PORTFOLIO_PATTERN.search(question)):
+                return None
+            answer = self._bucket_average(metrics, years, buckets, text)
+        elif top or (RANKING_PATTERN.search(question) and
+                     (RANKING_SCOPE_PATTERN.search(question) or PORTFOLIO_PATTERN.search(question))):
+            answer = self._ranking(metrics, years, int(top.group(1)) if top else None,
+                                   bool(LOWEST_PATTERN.search(question)), text)
+        else:
+            return None
+        return answer if answer.records else None
+
+    def _asks_for_value(self, question: str) -> bool:
+        """True when the question asks for the figure: a value word or a year, or the metric as
+        its last words ("Doctify gross margin?"), and no words left besides the company, metric,
+        year and LOOKUP_WORDS"""
+        rest = self._company_pattern[0].sub(" ", question)
+        rest = self._metric_pattern[0].sub(" @ ", rest)  # @ marks where the metric was
+        rest = YEAR_PATTERN.sub(" ", rest)
+        if any(word.lower() not in LOOKUP_WORDS for word in WORD_PATTERN.findall(rest)):
+            return False
+        return bool(VALUE_PATTERN.search(question)) or re.search(r"@[\s?.!]*$", rest) is not None
+
+    def _lookup(self, companies, metrics, years, text) -> KPIAnswer:
+        lines, records = [], []
+        for company in companies:
+            for metric in metrics:
+                found = ([record for year in years if (record := self.get(company, metric, year))]
+                         if years else self.history(company, metric))
+                if not found:
+                    metric_name = " ".join([METRICS_INFO[metric]["full_name"], *years])
+                    lines.append(text["missing"].format(company=company, metric=metric_name))
+                for record in found:
+                    lines.append(text["lookup"].format(
+                        company=record.company, metric=record.metric_name, year=record.year,
+                        value=record.display_value, bucket=record.bucket, rank=self.rank[record],
+                        count=len(self.rankings[(record.metric, record.year)])
+                    ))
+                records.extend(found)
+        return KPIAnswer("lookup", _answer_text(lines, text), records)
+
+    def _ranking(self, metrics, years, top, ascending, text) -> KPIAnswer:
+        lines, records = [], []
+        for metric in metrics:
+            for year in years or [self.latest_year(metric)]:
+                ranking = self.ranking(metric, year, top, ascending)
+                if not ranking:
+                    continue
+                lines.append(text["ranking"].format(metric=METRICS_INFO[metric]["full_name"], year=year,
+                                                    order=text["lowest" if ascending else "highest"]))
+                lines.extend(f"- #{self.rank[record]} {record.company}: **{record.display_value}** "
+                             f"({record.bucket})" for record in ranking)
+                records.extend(ranking)
+        return KPIAnswer("ranking", _answer_text(lines, text, bullets=False), records)
+
+    def _bucket_average(self, metrics, years, buckets, text) -> KPIAnswer:
+        lines, records = [], []
+        for metric in metrics:
+            unit = METRICS_INFO[metric]["unit"]
+            for year in years or [self.latest_year(metric)]:
+                averages = self.bucket_averages(metric, year)
+                if buckets:
+                    averages = {bucket: group for bucket, group in averages.items() if bucket in buckets}
+                if not averages:
+                    continue
+                lines.append(text["average"].format(metric=METRICS_INFO[metric]["full_name"], year=year))
+                groups = list(averages.items())
+                if not buckets:
+                    groups.append((text["portfolio"], self.rankings[(metric, year)]))
+                for label, group in groups:
+                    average = sum(record.value for record in group) / len(group)
+                    lines.append(f"- {label}: **{format_value(average, unit)}** "
+                                 f"(n={len(group)}: {', '.join(record.company for record in group)})")
+                records.extend(record for group in averages.values() for record in group)
+        return KPIAnswer("bucket_average", _answer_text(lines, text, bullets=False), records)
+
+
+def company_aliases(company: str) -> List[str]:
+    """Names a question may use for a company: 'Klima / Planet Wild' -> also 'Klima', 'Planet Wild'"""
+    aliases = [company] + [part.strip() for part in company.split("/") if part.strip()]
+    aliases += [alias.replace(".", "") for alias in aliases if "." in alias]  # Send.AI -> SendAI
+    return list(dict.fromkeys(aliases))
+
+
+def bucket_order(bucket: str) -> Tuple[float, float]:
+    """Sort key of a normalized bucket by its bounds ('< 1M' first)"""
+    bounds = [float(number) for number in re.findall(r"\d+", bucket)]
+    if bucket.startswith("<"):
+        return (0.0, bounds[0])
+    return (bounds[0], bounds[-1])
+
+
+def _answer_text(lines: List[str], text: Dict[str, str], bullets: bool = True) -> str:
+    if bullets:
+        lines = [f"- {line}" for line in lines]
+    return "\n".join(lines) + f"\n\n{text['source']}"
+
+
+def kpi_source(answer: KPIAnswer, path: str = KPI_DASHBOARD_PATH) -> Dict:
+    """Source card for a direct KPI answer, in the format of rag_engine.build_sources"""
+    content = "\n".join(
+        f"{record.company} | {record.metric_name} | {record.year} | {record.display_value} | "
+        f"ARR bucket {record.bucket}"
+        for record in answer.records
+    )
+    return {
+        "number": 1,
+        "filename": path.replace("\\", "/").rsplit("/", 1)[-1],
+        "content": content,
+        "preview": content[:400] + "..." if len(content) > 400 else content,
+        "similarity": 1.0,
+        "chunk_index": 0,
+        "chunk_label": "COMPANY_DATA",
+        "file_type": "KPI_DASHBOARD",
+        "source_url": None,
+        "tokens": 0,
+    }
+
+
+def main():
+    question = " ".join(sys.argv[1:]) or "What is Doctify's growth rate?"
+    store = KPIStore.from_html()
+    print(f"📊 {len(store.records)} KPI records, {len(store.companies)} companies, years {', '.join(store.years)}")
+
+    start = time.perf_counter()
+    answer = store.route(question)
+    elapsed = time.perf_counter() - start
+    if answer is None:
+        print(f"➡️  Not a KPI question, goes to RAG ({elapsed * 1e6:.0f} µs)")
+    else:
+        print(f"✅ {answer.intent} ({elapsed * 1e6:.0f} µs)\n")
+        print(answer.text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Load document-level source info into the sources table
+Source URLs come from url_mappings.csv, file hash and size from the metadata the uploaders
+stored with the chunks, and the language is guessed from each document's first chunk.
+Everything is written in bulk; re-running only updates what changed.
+"""
+
+import argparse
+import csv
+import os
+import re
+from collections import Counter
+
+import psycopg2
+from dotenv import load_dotenv
+
+from document_store import upsert_sources
+
+load_dotenv()
+
+URL_MAPPINGS_CSV = "url_mappings.csv"
+
+# Frequent function words per language, enough to tell EN/NL/ES apart
+LANGUAGE_WORDS = {
+    "en": {"the", "and", "of", "to", "is", "in", "that", "for", "with", "are", "this", "it"},
+    "nl": {"de", "het", "een", "en", "van", "is", "dat", "voor", "met", "niet", "zijn", "op"},
+    "es": {"el", "la", "los", "las", "de", "que", "y", "en", "para", "con", "una", "por"},
+}
+
+
+def guess_language(text: str):
+    """Most likely language (en/nl/es) of a text, None if there is nothing to go on"""
+    words = Counter(re.findall(r"\w+", text.lower()[:5000]))
+    scores = {
+        language: sum(words[w] for w in function_words)
+        for language, function_words in LANGUAGE_WORDS.items()
+    }
+    language, score = max(scores.items(), key=lambda item: item[1])
+    return language if score else None
+
+
+def read_url_mappings(csv_path: str):
+    """filename -> source URL for all mappings with status Found"""
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        return {
+            row["Filename"]: row["Source URL"].strip()
+            for row in csv.DictReader(f)
+            if row.get("Status") == "Found" and row.get("Source URL", "").strip()
+        }
+
+
+def load_document_info(conn):
+    """Hash, size, language and any source_url already in metadata, per uploaded file"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT DISTINCT ON (d.filename)
+            d.filename,
+            c.content,
+            d.metadata->>'file_hash',
+            d.metadata->>'file_size',
+            d.metadata->>'source_url'
+        FROM source_documents d
+        JOIN chunks c ON c.document_id = d.id AND c.chunk_index = 0
+        ORDER BY d.filename
+    """)
+    rows = []
+    for filename, content, file_hash, file_size, source_url in cursor.fetchall():
+        rows.append({
+            "filename": filename,
+            "file_hash": file_hash,
+            "file_size": int(file_size) if file_size else None,
+            "language": guess_language(content),
+            "source_url": source_url,
+        })
+    cursor.close()
+    return rows
+
+
+def load_sources(csv_path: str = URL_MAPPINGS_CSV):
+    conn = psycopg2.connect(os.getenv("SUPABASE_DB_URL"))
+    try:
+        mappings = read_url_mappings(csv_path)
+        print(f"📄 {len(mappings)} URL mappings in {csv_path}")
+
+        documents = load_document_info(conn)
+        print(f"📚 {len(documents)} documents in the database")
+
+        # CSV first, then document info: a URL set with update_url_metadata.py wins
+        upsert_sources(conn, [{"filename": name, "source_url": url} for name, url in mappings.items()])
+        upsert_sources(conn, documents)
+        conn.commit()
+
+        uploaded = {doc["filename"] for doc in documents}
+        linked = sum(1 for doc in documents if doc["source_url"] or doc["filename"] in mappings)
+        missing = sorted(set(mappings) - uploaded)
+        languages = Counter(doc["language"] or "unknown" for doc in documents)
+
+        print(f"\n✅ sources loaded: {linked}/{len(documents)} documents have a source URL")
+        print(f"   Languages: {', '.join(f'{k}: {v}' for k, v in languages.most_common())}")
+        if missing:
+            print(f"   ⚠ {len(missing)} mappings for files that are not uploaded (yet), e.g. {missing[0]}")
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error: {e}")
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load url_mappings.csv and document info into the sources table")
+    parser.add_argument("--csv", default=URL_MAPPINGS_CSV, help="CSV with Filename, Source URL, Status columns")
+    args = parser.parse_args()
+    load_sources(args.csv)
@@ -0,0 +1,527 @@
+"""
+Local in-process vector index
+Snapshots the chunks in the database into a directory of NumPy files that the chat app can
+search without Postgres (offline evaluation, air-gapped demos). Embeddings are stored
+normalized as one float32 matrix, ordered by IVF list so every list is a contiguous slice of
+the memory-mapped file: opening the index reads only the small files, a search reads the
+centroids plus the probed lists.
+
+Usage:
+    python local_index.py snapshot                      # writes .local_index/ from SUPABASE_DB_URL
+    python local_index.py snapshot --out demo_index --lists 200
+    python local_index.py query "What is the Rule of 40?" --index demo_index --probes 20
+    python local_index.py recall --queries 500 --k 10     # recall@k of match_documents_ann
+
+Set LOCAL_INDEX_PATH to the snapshot directory to make rag_chat.py search it instead of the
+database (LOCAL_INDEX_PROBES optional, LOCAL_INDEX_EXACT=1 ranks all chunks exactly). Full-text
+search is not part of the snapshot, so hybrid searches run as semantic searches.
+
+The exact engine (exact_search) ranks all rows for a batch of queries with blocked matrix
+products and argpartition. It is the ground truth for the recall command and fast enough to
+serve corpora of up to a few hundred thousand chunks on its own.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+
+FORMAT_VERSION = 1
+DEFAULT_PATH = ".local_index"
+EMBEDDING_DIMENSIONS = 1536
+FETCH_SIZE = 2000  # rows per round trip of the server-side snapshot cursor
+BLOCK_SIZE = 8192  # rows per matrix product when assigning lists
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 256  # training rows per list, like the sample size of IVF trainers
+SEED = 42
+EXACT_BLOCK_ROWS = 65536  # corpus rows per matrix product of the exact engine
+EXACT_BATCH_QUERIES = 256  # queries per matrix product (block of 256 x 65536 similarities = 64 MB)
+
+# Metadata keys accepted as filters, same as match_documents_filtered
+METADATA_FILTERS = ("company", "metric", "year", "source_type")
+
+DOCUMENTS_SQL = """
+    SELECT
+        source_documents.id,
+        source_documents.filename,
+        source_documents.file_type,
+        source_documents.metadata,
+        COALESCE(sources.source_url, source_documents.metadata->>'source_url') AS source_url,
+        sources.language
+    FROM source_documents
+    LEFT JOIN sources ON sources.filename = source_documents.filename
+    ORDER BY source_documents.id
+"""
+
+CHUNKS_SQL = """
+    SELECT id::text, document_id, chunk_index, content, embedding::real[]
+    FROM chunks
+    WHERE embedding IS NOT NULL
+    ORDER BY document_id, chunk_index
+"""
+
+
+# Building
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid (cosine) per row"""
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), BLOCK_SIZE):
+        block = vectors[start:start + BLOCK_SIZE]
+        assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
+
+
+def train_centroids(vectors: np.ndarray, lists: int, iterations: int = KMEANS_ITERATIONS) -> np.ndarray:
+    """Spherical k-means on a sample of the (normalized) vectors"""
+    rng = np.random.default_rng(SEED)
+    sample_size = min(len(vectors), lists * KMEANS_SAMPLE_PER_LIST)
+    sample = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+    centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = assign_lists(sample, centroids)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(lists + 1))
+        for list_id in range(lists):
+            members = order[bounds[list_id]:bounds[list_id + 1]]
+            if len(members):  # empty lists keep their centroid
+                centroids[list_id] = sample[members].mean(axis=0)
+        centroids = normalize(centroids)
+    return centroids
+
+
+def fetch_snapshot(conn):
+    """Documents, chunk rows and corpus version from one consistent read"""
+    conn.set_session(readonly=True, isolation_level="REPEATABLE READ")
+    cursor = conn.cursor()
+    cursor.execute("SELECT files, chunks, version FROM corpus_stats")
+    stats = cursor.fetchone()
+    version = stats[2] if stats else None
+    expected = stats[1] if stats else 0
+
+    cursor.execute(DOCUMENTS_SQL)
+    documents = []
+    document_rows = {}
+    for doc_id, filename, file_type, metadata, source_url, language in cursor.fetchall():
+        document_rows[doc_id] = len(documents)
+        documents.append({
+            "filename": filename,
+            "file_type": file_type,
+            "metadata": metadata or {},
+            "source_url": source_url,
+            "language": language,
+        })
+
+    ids, doc_rows, chunk_indexes, contents = [], [], [], []
+    vectors = np.empty((expected, EMBEDDING_DIMENSIONS), dtype=np.float32)
+    chunk_cursor = conn.cursor(name="local_index_snapshot")
+    chunk_cursor.itersize = FETCH_SIZE
+    chunk_cursor.execute(CHUNKS_SQL)
+    for row_id, doc_id, chunk_index, content, embedding in chunk_cursor:
+        if len(ids) == len(vectors):
+            vectors = np.resize(vectors, (max(len(vectors) * 2, FETCH_SIZE), EMBEDDING_DIMENSIONS))
+        vectors[len(ids)] = embedding
+        ids.append(row_id)
+        doc_rows.append(document_rows[doc_id])
+        chunk_indexes.append(chunk_index)
+        contents.append(content)
+        if len(ids) % (FETCH_SIZE * 5) == 0:
+            print(f"\r   📥 {len(ids):,} chunks", end="", flush=True)
+    print(f"\r   📥 {len(ids):,} chunks")
+    chunk_cursor.close()
+    conn.rollback()
+
+    rows = {
+        "ids": np.array(ids, dtype="S36"),
+        "doc_rows": np.array(doc_rows, dtype=np.int32),
+        "chunk_indexes": np.array(chunk_indexes, dtype=np.int32),
+        "contents": contents,
+    }
+    return documents, rows, vectors[:len(ids)], version
+
+
+def write_index(out: Path, documents: List[Dict], rows: Dict, vectors: np.ndarray,
+                version: Optional[int], lists: Optional[int] = None) -> Dict:
+    """Train the IVF lists and write the snapshot directory (replaced atomically)"""
+    vectors = normalize(vectors)
+    lists = max(1, min(lists or int(np.sqrt(len(vectors))), len(vectors)))
+    print(f"   🧭 Training {lists} IVF lists...", flush=True)
+    centroids = train_centroids(vectors, lists) if len(vectors) else np.zeros((0, EMBEDDING_DIMENSIONS), np.float32)
+    assignment = assign_lists(vectors, centroids)
+    order = np.argsort(assignment, kind="stable")
+    offsets = np.searchsorted(assignment[order], np.arange(lists + 1)).astype(np.int64)
+
+    contents = [rows["contents"][i].encode("utf-8") for i in order]
+    content_offsets = np.zeros(len(contents) + 1, dtype=np.int64)
+    np.cumsum([len(c) for c in contents], out=content_offsets[1:])
+
+    tmp = out.with_name(out.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    np.save(tmp / "vectors.npy", vectors[order])
+    np.save(tmp / "centroids.npy", centroids.astype(np.float32))
+    np.save(tmp / "list_offsets.npy", offsets)
+    np.save(tmp / "ids.npy", rows["ids"][order])
+    np.save(tmp / "doc_rows.npy", rows["doc_rows"][order])
+    np.save(tmp / "chunk_indexes.npy", rows["chunk_indexes"][order])
+    np.save(tmp / "content_offsets.npy", content_offsets)
+    (tmp / "content.bin").write_bytes(b"".join(contents))
+    (tmp / "documents.json").write_text(json.dumps(documents, ensure_ascii=False), encoding="utf-8")
+    manifest = {
+        "format": FORMAT_VERSION,
+        "dimensions": EMBEDDING_DIMENSIONS,
+        "files": len(documents),
+        "chunks": len(vectors),
+        "lists": lists,
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    (tmp / "manifest.json").write_text(json.dumps(manifest, indent=2))
+
+    old = out.with_name(out.name + ".old")
+    shutil.rmtree(old, ignore_errors=True)
+    if out.exists():
+        out.rename(old)
+    tmp.rename(out)
+    shutil.rmtree(old, ignore_errors=True)
+    return manifest
+
+
+def snapshot(db_url: str, out: Path, lists: Optional[int] = None) -> Dict:
+    """Export the chunks of the database into a local index directory"""
+    conn = psycopg2.connect(db_url)
+    try:
+        documents, rows, vectors, version = fetch_snapshot(conn)
+    finally:
+        conn.close()
+    return write_index(out, documents, rows, vectors, version, lists)
+
+
+# Exact search
+
+def exact_top_k(queries: np.ndarray, blocks: Iterable[Tuple[int, np.ndarray]],
+                k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact top-k rows by inner product for a batch of queries.
+
+    blocks yields (first row, matrix) pairs, so the corpus can be a memory-mapped matrix or be
+    generated block by block. Returns (similarities, rows), each (queries, min(k, rows)) and
+    sorted best first. For normalized vectors the inner product is the cosine similarity.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    best_sims = np.empty((len(queries), 0), dtype=np.float32)
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    for start, block in blocks:
+        sims = queries @ np.asarray(block, dtype=np.float32).T
+        rows = np.broadcast_to(np.arange(start, start + sims.shape[1]), sims.shape)
+        if best_sims.shape[1]:
+            sims = np.concatenate([best_sims, sims], axis=1)
+            rows = np.concatenate([best_rows, rows], axis=1)
+        if sims.shape[1] > k:
+            top = np.argpartition(sims, -k, axis=1)[:, -k:]
+            sims = np.take_along_axis(sims, top, axis=1)
+            rows = np.take_along_axis(rows, top, axis=1)
+        best_sims, best_rows = sims, rows
+    order = np.argsort(-best_sims, axis=1, kind="stable")
+    return np.take_along_axis(best_sims, order, axis=1), np.take_along_axis(best_rows, order, axis=1)
+
+
+def exact_search(vectors: np.ndarray, queries: np.ndarray, k: int,
+                 block_rows: int = EXACT_BLOCK_ROWS,
+                 batch_queries: int = EXACT_BATCH_QUERIES) -> Tuple[np.ndarray, np.ndarray]:
+    """exact_top_k over a (memory-mapped) matrix, in batches of queries"""
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    k = min(k, len(vectors))
+    sims = np.empty((len(queries), k), dtype=np.float32)
+    rows = np.empty((len(queries), k), dtype=np.int64)
+    for first in range(0, len(queries), batch_queries):
+        blocks = ((start, vectors[start:start + block_rows]) for start in range(0, len(vectors), block_rows))
+        batch = slice(first, first + batch_queries)
+        sims[batch], rows[batch] = exact_top_k(queries[batch], blocks, k)
+    return sims, rows
+
+
+# Searching
+
+class LocalIndex:
+    """
+    Read-only IVF index over a snapshot directory.
+
+    search() returns the same rows as match_documents_ann / match_documents_filtered:
+    id, filename, file_type, content, chunk_index, similarity, source_url, language, metadata.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = Path(path)
+        self.manifest = json.loads((self.path / "manifest.json").read_text())
+        if self.manifest["format"] != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported index format {self.manifest['format']}, run snapshot again")
+        self.vectors = np.load(self.path / "vectors.npy", mmap_mode="r")
+        self.centroids = np.load(self.path / "centroids.npy")
+        self.list_offsets = np.load(self.path / "list_offsets.npy")
+        self.ids = np.load(self.path / "ids.npy", mmap_mode="r")
+        self.doc_rows = np.load(self.path / "doc_rows.npy")
+        self.chunk_indexes = np.load(self.path / "chunk_indexes.npy", mmap_mode="r")
+        self.content_offsets = np.load(self.path / "content_offsets.npy", mmap_mode="r")
+        self.content = np.memmap(self.path / "content.bin", dtype=np.uint8, mode="r") \
+            if self.content_offsets[-1] else np.zeros(0, dtype=np.uint8)
+        self.documents = json.loads((self.path / "documents.json").read_text(encoding="utf-8"))
+
+    @property
+    def lists(self) -> int:
+        return len(self.centroids)
+
+    def stats(self) -> Dict:
+        """Same fields as the corpus_stats row"""
+        return {key: self.manifest[key] for key in ("files", "chunks", "version")}
+
+    def filter_options(self) -> Dict:
+        """Same fields as query_service.FILTER_OPTIONS_SQL"""
+        kpis = [doc["metadata"] for doc in self.documents if doc["file_type"] == "KPI_DASHBOARD"]
+
+        def values(key):
+            return sorted({str(meta[key]) for meta in kpis if meta.get(key) is not None})
+
+        return {
+            "file_types": sorted({doc["file_type"] for doc in self.documents}),
+            "companies": values("company"),
+            "metrics": values("metric"),
+            "years": values("year"),
+        }
+
+    def _document_mask(self, filters: Dict) -> np.ndarray:
+        file_type = filters.get("file_type")
+        wanted = {key: str(value) for key, value in filters.items() if key in METADATA_FILTERS}
+        return np.array([
+            (file_type is None or doc["file_type"] == file_type)
+            and all(str(doc["metadata"].get(key)) == value for key, value in wanted.items())
+            for doc in self.documents
+        ], dtype=bool)
+
+    def _probe(self, query: np.ndarray, probes: int):
+        """Rows and similarities of the probed lists, each list is a slice of the matrix"""
+        if probes >= self.lists:
+            ranges = [(0, len(self.vectors))]
+        else:
+            nearest = np.sort(np.argpartition(-(self.centroids @ query), probes - 1)[:probes])
+            ranges = [(self.list_offsets[i], self.list_offsets[i + 1]) for i in nearest]
+        rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+        similarities = np.concatenate([self.vectors[start:end] @ query for start, end in ranges])
+        return rows, similarities
+
+    def search(self, query_embedding, match_threshold: float = 0.5, match_count: int = 10,
+               filters: Optional[Dict] = None, probes: Optional[int] = None,
+               exact: bool = False) -> List[Dict]:
+        """
+        Top match_count chunks by cosine similarity, then the threshold (like the SQL functions).
+
+        probes is the number of IVF lists scanned (default: a tenth of the lists), exact=True
+        scans all of them. Filtered searches rank the rows of the matching documents exactly.
+        """
+        if exact:
+            probes = self.lists
+        if not len(self.vectors) or match_count <= 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+
+        filters = {name: value for name, value in (filters or {}).items() if value}
+        if filters:
+            rows = np.flatnonzero(self._document_mask(filters)[self.doc_rows])
+            similarities = self.vectors[rows] @ query
+        else:
+            rows, similarities = self._probe(query, max(1, probes or self.lists // 10))
+        if not len(rows):
+            return []
+
+        if len(rows) > match_count:
+            top = np.argpartition(-similarities, match_count - 1)[:match_count]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(-similarities[top], kind="stable")]
+        return [self._row(int(rows[i]), float(similarities[i]))
+                for i in top if similarities[i] > match_threshold]
+
+    def search_batch(self, query_embeddings, match_threshold: float = 0.5, match_count: int = 10,
+                     probes: Optional[int] = None, exact: bool = False) -> List[List[Dict]]:
+        """search() for many queries, exact=True ranks them together with exact_search"""
+        if not exact:
+            return [self.search(query, match_threshold, match_count, probes=probes)
+                    for query in query_embeddings]
+        if not len(self.vectors) or match_count <= 0:
+            return [[] for _ in query_embeddings]
+        sims, rows = exact_search(self.vectors, normalize(np.asarray(query_embeddings, dtype=np.float32)),
+                                  match_count)
+        return [
+            [self._row(int(row), float(sim)) for sim, row in zip(query_sims, query_rows) if sim > match_threshold]
+            for query_sims, query_rows in zip(sims, rows)
+        ]
+
+    def _row(self, row: int, similarity: float) -> Dict:
+        document = self.documents[self.doc_rows[row]]
+        start, end = self.content_offsets[row], self.content_offsets[row + 1]
+        return {
+            "id": self.ids[row].decode(),
+            "filename": document["filename"],
+            "file_type": document["file_type"],
+            "content": self.content[start:end].tobytes().decode("utf-8"),
+            "chunk_index": int(self.chunk_indexes[row]),
+            "similarity": similarity,
+            "source_url": document["source_url"],
+            "language": document["language"],
+            "metadata": document["metadata"],
+        }
+
+
+# Recall
+
+def recall_report(db_url: str, index: LocalIndex, queries: np.ndarray, k: int,
+                  ef_search: Optional[int] = None, probes: Optional[int] = None,
+                  local_probes: Optional[int] = None) -> Dict:
+    """recall@k of match_documents_ann and of the local IVF lists against exact search"""
+    from document_store import vector_literal
+
+    queries = normalize(np.asarray(queries, dtype=np.float32))
+    start = time.perf_counter()
+    _, truth_rows = exact_search(index.vectors, queries, k)
+    exact_seconds = time.perf_counter() - start
+
+    conn = psycopg2.connect(db_url)
+    conn.autocommit = True
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT version FROM corpus_stats")
+        row = cursor.fetchone()
+        db_version = row[0] if row else None
+        db_recall, local_recall, latencies = [], [], []
+        for query, rows in zip(queries, truth_rows):
+            truth = {index.ids[row].decode() for row in rows}
+            start = time.perf_counter()
+            cursor.execute(
+                "SELECT id::text FROM match_documents_ann(%s::vector, -1, %s, %s, %s)",
+                (vector_literal(query.tolist()), k, ef_search, probes)
+            )
+            found = {row[0] for row in cursor.fetchall()}
+            latencies.append(time.perf_counter() - start)
+            local = {row["id"] for row in index.search(query, -1, k, probes=local_probes)}
+            db_recall.append(len(found & truth) / len(truth))
+            local_recall.append(len(local & truth) / len(truth))
+    finally:
+        conn.close()
+
+    def summary(scores):
+        scores = np.array(scores)
+        return {"mean": float(scores.mean()), "min": float(scores.min()),
+                "perfect": float((scores == 1).mean())}
+
+    return {
+        "queries": len(queries),
+        "k": k,
+        "snapshot_version": index.manifest["version"],
+        "database_version": db_version,
+        "match_documents_ann": {**summary(db_recall), "ef_search": ef_search, "probes": probes,
+                                "p50_ms": float(np.median(latencies) * 1000)},
+        "local_ivf": {**summary(local_recall), "lists": index.lists,
+                      "probes": local_probes or max(1, index.lists // 10)},
+        "exact_queries_per_sec": len(queries) / exact_seconds if exact_seconds else None,
+    }
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Local in-process vector index (snapshot of the database)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    snap = commands.add_parser("snapshot", help="Export the chunks of the database")
+    snap.add_argument("--out", default=os.getenv("LOCAL_INDEX_PATH") or DEFAULT_PATH,
+                      help=f"Index directory (default: LOCAL_INDEX_PATH or {DEFAULT_PATH})")
+    snap.add_argument("--lists", type=int, help="IVF lists (default: sqrt of the number of chunks)")
+    query = commands.add_parser("query", help="Search the index from the command line")
+    query.add_argument("text")
+    query.add_argument("--index", default=os.getenv("LOCAL_INDEX_PATH") or DEFAULT_PATH)
+    query.add_argument("--count", type=int, default=5)
+    query.add_argument("--threshold", type=float, default=0.3)
+    query.add_argument("--probes", type=int, help="IVF lists to scan (default: a tenth)")
+    query.add_argument("--exact", action="store_true", help="Rank all chunks exactly")
+    recall = commands.add_parser("recall", help="recall@k of match_documents_ann against exact search")
+    recall.add_argument("--index", default=os.getenv("LOCAL_INDEX_PATH") or DEFAULT_PATH)
+    recall.add_argument("--queries", type=int, default=200, help="Chunks sampled as queries")
+    recall.add_argument("--questions", help="File with one question per line to embed as queries instead")
+    recall.add_argument("--k", type=int, default=10)
+    recall.add_argument("--ef-search", type=int, help="hnsw.ef_search for match_documents_ann")
+    recall.add_argument("--probes", type=int, help="ivfflat.probes for match_documents_ann")
+    recall.add_argument("--local-probes", type=int, help="IVF lists scanned by the local index")
+    recall.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args()
+
+    if args.command == "snapshot":
+        print(f"📸 Snapshotting the database into {args.out}/", flush=True)
+        start = time.perf_counter()
+        manifest = snapshot(os.getenv("SUPABASE_DB_URL"), Path(args.out), args.lists)
+        print(f"✅ {manifest['chunks']:,} chunks of {manifest['files']:,} files, "
+              f"{manifest['lists']} lists ({time.perf_counter() - start:.1f}s)")
+        return
+
+    from openai import OpenAI
+    from embedding_batcher import create_embeddings
+    from embedding_cache import get_cache
+
+    if args.command == "recall":
+        index = LocalIndex(args.index)
+        if args.questions:
+            questions = [line.strip() for line in Path(args.questions).read_text(encoding="utf-8").splitlines()
+                         if line.strip()]
+            queries = np.array(create_embeddings(OpenAI(), questions, model="text-embedding-3-small",
+                                                 dimensions=EMBEDDING_DIMENSIONS, cache=get_cache()))
+            source = args.questions
+        else:
+            # Stored chunks as queries: each finds itself, the other k - 1 rows are the test
+            rng = np.random.default_rng(SEED)
+            sample = np.sort(rng.choice(len(index.vectors), min(args.queries, len(index.vectors)), replace=False))
+            queries = index.vectors[sample]
+            source = "sampled chunks"
+        print(f"📏 Recall@{args.k} over {len(queries)} queries ({source})", flush=True)
+        report = recall_report(os.getenv("SUPABASE_DB_URL"), index, queries, args.k,
+                               args.ef_search, args.probes, args.local_probes)
+        if report["snapshot_version"] != report["database_version"]:
+            print("   ⚠️  The database changed since the snapshot, run snapshot again for exact ground truth")
+        for name, label in (("match_documents_ann", "match_documents_ann"), ("local_ivf", "local IVF")):
+            result = report[name]
+            print(f"   {label + ':':22} {result['mean']:.3f} (min {result['min']:.2f}, "
+                  f"{result['perfect']:.0%} of queries perfect)")
+        print(f"   Database search:       p50 {report['match_documents_ann']['p50_ms']:.1f} ms")
+        print(f"   Exact engine:          {report['exact_queries_per_sec']:,.0f} queries/sec")
+        if args.json:
+            Path(args.json).write_text(json.dumps(report, indent=2))
+            print(f"💾 Report written to {args.json}")
+        return
+
+    start = time.perf_counter()
+    index = LocalIndex(args.index)
+    opened = time.perf_counter()
+    embedding = create_embeddings(OpenAI(), [args.text], model="text-embedding-3-small",
+                                  dimensions=EMBEDDING_DIMENSIONS, cache=get_cache())[0]
+    embedded = time.perf_counter()
+    results = index.search(embedding, args.threshold, args.count, probes=args.probes, exact=args.exact)
+    searched = time.perf_counter()
+    for row in results:
+        print(f"{row['similarity']:.3f}  {row['filename']} #{row['chunk_index']}")
+    print(f"\n⏱️  open {(opened - start) * 1000:.1f} ms, embed {(embedded - opened) * 1000:.1f} ms, "
+          f"search {(searched - embedded) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
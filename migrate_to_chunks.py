@@ -0,0 +1,407 @@
+"""
+Migrate the single-table documents schema to source_documents + chunks without downtime
+
+The app and the uploaders keep working on the documents table while this runs:
+
+1. source_documents and chunks are created next to documents, and a row trigger on documents
+   mirrors every insert, update and delete into them from then on.
+2. Existing rows are copied in keyset batches (ordered by id). Each batch is one short
+   transaction that locks only its own rows (FOR SHARE), so concurrent writes to the batch
+   wait for at most one batch and writes to other rows are never blocked.
+3. The vector and full-text indexes are built with CREATE INDEX CONCURRENTLY.
+4. Cutover, one short transaction: writes to documents are blocked (reads continue) while
+   anything the mirror missed is repaired and the counts are verified, then documents is
+   renamed to documents_legacy and setup_database.sql creates the documents view, the
+   corpus statistics and the search functions on the new tables.
+
+Every step can be re-run; an interrupted migration continues where it left off.
+
+Usage:
+    python migrate_to_chunks.py                  # full migration
+    python migrate_to_chunks.py --no-cutover     # backfill only, cut over in a later run
+    python migrate_to_chunks.py --drop-legacy    # drop documents_legacy after checking the app
+"""
+
+import argparse
+import os
+import re
+import time
+from pathlib import Path
+
+import psycopg2
+from psycopg2 import errors
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SUPABASE_DB_URL = os.getenv("SUPABASE_DB_URL")
+SETUP_SQL = Path(__file__).with_name("setup_database.sql")
+
+BATCH_SIZE = 5000  # documents rows per backfill transaction
+LOCK_TIMEOUT = "5s"  # give up the cutover instead of queueing behind long transactions
+
+TABLES_SQL = """
+    CREATE TABLE IF NOT EXISTS source_documents (
+        id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+        filename TEXT NOT NULL UNIQUE,
+        file_type TEXT NOT NULL,
+        total_chunks INTEGER NOT NULL,
+        metadata JSONB,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    );
+
+    CREATE TABLE IF NOT EXISTS chunks (
+        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        document_id BIGINT NOT NULL REFERENCES source_documents(id) ON DELETE CASCADE,
+        chunk_index INTEGER NOT NULL,
+        content TEXT NOT NULL,
+        embedding vector(1536),
+        content_tsv tsvector GENERATED ALWAYS AS (
+            to_tsvector('english', content) ||
+            to_tsvector('dutch', content) ||
+            to_tsvector('spanish', content)
+        ) STORED,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    );
+
+    CREATE INDEX IF NOT EXISTS chunks_document_id_idx ON chunks(document_id, chunk_index);
+"""
+
+# chunk_size differed per chunk in the old metadata; it is length(content) now
+MIRROR_SQL = """
+    CREATE OR REPLACE FUNCTION documents_migration_mirror()
+    RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        doc_id BIGINT;
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM chunks WHERE chunks.id = OLD.id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO source_documents (filename, file_type, total_chunks, metadata)
+            VALUES (NEW.filename, NEW.file_type, NEW.total_chunks, NEW.metadata - 'chunk_size')
+            ON CONFLICT (filename) DO UPDATE SET
+                file_type = EXCLUDED.file_type,
+                total_chunks = EXCLUDED.total_chunks,
+                metadata = EXCLUDED.metadata,
+                updated_at = NOW()
+            RETURNING source_documents.id INTO doc_id;
+
+            INSERT INTO chunks (id, document_id, chunk_index, content, embedding, created_at, updated_at)
+            VALUES (NEW.id, doc_id, NEW.chunk_index, NEW.content, NEW.embedding, NEW.created_at, NEW.updated_at)
+            ON CONFLICT (id) DO NOTHING;
+        END IF;
+        -- Documents left without chunks are removed at cutover, deleting them here could
+        -- race with a backfill batch that is copying other chunks of the same file
+        RETURN NULL;
+    END;
+    $$;
+
+    CREATE OR REPLACE FUNCTION documents_migration_mirror_truncate()
+    RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+    BEGIN
+        TRUNCATE source_documents, chunks;
+        RETURN NULL;
+    END;
+    $$;
+
+    DROP TRIGGER IF EXISTS documents_migration_mirror ON documents;
+    CREATE TRIGGER documents_migration_mirror
+    AFTER INSERT OR UPDATE OR DELETE ON documents
+    FOR EACH ROW EXECUTE FUNCTION documents_migration_mirror();
+
+    DROP TRIGGER IF EXISTS documents_migration_mirror_truncate ON documents;
+    CREATE TRIGGER documents_migration_mirror_truncate
+    AFTER TRUNCATE ON documents
+    FOR EACH STATEMENT EXECUTE FUNCTION documents_migration_mirror_truncate();
+"""
+
+# Copies documents rows missing from chunks; {where} selects the rows, {limit} bounds the batch.
+# The parent upsert is a no-op update so it returns the id of existing rows as well.
+COPY_SQL = """
+    WITH batch AS (
+        SELECT * FROM documents
+        WHERE {where}
+        ORDER BY id
+        {limit}
+        FOR SHARE
+    ),
+    parents AS (
+        INSERT INTO source_documents (filename, file_type, total_chunks, metadata)
+        SELECT DISTINCT ON (filename) filename, file_type, total_chunks, metadata - 'chunk_size'
+        FROM batch
+        ORDER BY filename, chunk_index
+        ON CONFLICT (filename) DO UPDATE SET filename = EXCLUDED.filename
+        RETURNING id, filename
+    ),
+    copied AS (
+        INSERT INTO chunks (id, document_id, chunk_index, content, embedding, created_at, updated_at)
+        SELECT batch.id, parents.id, batch.chunk_index, batch.content, batch.embedding,
+               batch.created_at, batch.updated_at
+        FROM batch
+        JOIN parents USING (filename)
+        ON CONFLICT (id) DO NOTHING
+        RETURNING 1
+    )
+    SELECT
+        (SELECT COUNT(*) FROM batch),
+        (SELECT COUNT(*) FROM copied),
+        (SELECT id FROM batch ORDER BY id DESC LIMIT 1)
+"""
+
+# The mirror and the per-filename corpus statistics of the single-table schema; every file
+# is one source_documents row now, setup_database.sql installs the new statistics triggers
+LEGACY_CLEANUP_SQL = """
+    DROP TRIGGER documents_migration_mirror ON documents;
+    DROP TRIGGER documents_migration_mirror_truncate ON documents;
+    DROP FUNCTION documents_migration_mirror();
+    DROP FUNCTION documents_migration_mirror_truncate();
+
+    DROP TRIGGER IF EXISTS documents_corpus_stats_insert ON documents;
+    DROP TRIGGER IF EXISTS documents_corpus_stats_update ON documents;
+    DROP TRIGGER IF EXISTS documents_corpus_stats_delete ON documents;
+    DROP TRIGGER IF EXISTS documents_corpus_stats_truncate ON documents;
+    DROP FUNCTION IF EXISTS documents_corpus_stats_trigger();
+    DROP FUNCTION IF EXISTS documents_corpus_stats_truncate();
+    DROP FUNCTION IF EXISTS apply_corpus_stats_delta(TEXT[], BIGINT[]);
+    DROP TABLE IF EXISTS corpus_file_stats;
+"""
+
+
+def relation_kind(cursor, name: str):
+    """'r' for a table, 'v' for a view, None when the relation doesn't exist"""
+    cursor.execute(
+        """
+        SELECT c.relkind FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema() AND c.relname = %s
+        """,
+        (name,)
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def prepare(conn):
+    """Create the new tables and start mirroring writes on documents into them"""
+    print("\n1. Creating source_documents and chunks, mirroring writes...", flush=True)
+    cursor = conn.cursor()
+    cursor.execute(TABLES_SQL)
+    cursor.execute(MIRROR_SQL)
+    conn.commit()
+    cursor.close()
+    print("   ✓ Tables created, writes to documents are mirrored")
+
+
+def backfill(conn, batch_size: int, pause: float):
+    """Copy the existing documents rows in keyset batches"""
+    print(f"\n2. Copying rows in batches of {batch_size:,}...", flush=True)
+    cursor = conn.cursor()
+    cursor.execute("SELECT reltuples::BIGINT FROM pg_class WHERE oid = 'documents'::regclass")
+    estimate = max(cursor.fetchone()[0], 0)
+
+    sql = COPY_SQL.format(where="(%(last_id)s::uuid IS NULL OR id > %(last_id)s::uuid)",
+                          limit="LIMIT %(batch_size)s")
+    last_id, seen, copied = None, 0, 0
+    start = time.perf_counter()
+    while True:
+        cursor.execute(sql, {"last_id": last_id, "batch_size": batch_size})
+        batch_rows, batch_copied, batch_last = cursor.fetchone()
+        conn.commit()
+        if not batch_rows:
+            break
+        last_id = batch_last
+        seen += batch_rows
+        copied += batch_copied
+        rate = seen / (time.perf_counter() - start)
+        progress = f"/~{estimate:,}" if estimate else ""
+        print(f"\r   📥 {seen:,}{progress} rows ({copied:,} copied, {rate:,.0f} rows/sec)",
+              end="", flush=True)
+        if pause:
+            time.sleep(pause)
+    print()
+    cursor.close()
+    print(f"   ✓ {copied:,} rows copied ({seen - copied:,} were already mirrored)")
+
+
+def build_index(conn, name: str, ddl: str):
+    """CREATE INDEX CONCURRENTLY, replacing an invalid leftover of an interrupted build"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT i.indisvalid FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema() AND c.relname = %s
+        """,
+        (name,)
+    )
+    row = cursor.fetchone()
+    if row and row[0]:
+        print(f"   ✓ {name} already exists")
+        return
+    if row:
+        cursor.execute(f"DROP INDEX CONCURRENTLY {name}")
+    start = time.perf_counter()
+    cursor.execute(ddl)
+    cursor.close()
+    print(f"   ✓ {name} built in {time.perf_counter() - start:.1f}s")
+
+
+def build_indexes(conn):
+    """Build the chunks indexes without blocking the mirrored writes"""
+    print("\n3. Building indexes concurrently...", flush=True)
+    cursor = conn.cursor()
+    # Use the same vector index type (and options) as the documents table
+    cursor.execute("""
+        SELECT indexdef FROM pg_indexes
+        WHERE schemaname = current_schema() AND indexname = 'documents_embedding_idx'
+    """)
+    row = cursor.fetchone()
+    cursor.close()
+    conn.commit()
+    if row:
+        embedding_ddl = re.sub(r"^CREATE INDEX documents_embedding_idx ON \S+ ",
+                               "CREATE INDEX CONCURRENTLY chunks_embedding_idx ON chunks ", row[0])
+    else:
+        embedding_ddl = ("CREATE INDEX CONCURRENTLY chunks_embedding_idx "
+                         "ON chunks USING hnsw (embedding vector_cosine_ops)")
+
+    conn.autocommit = True
+    try:
+        build_index(conn, "chunks_embedding_idx", embedding_ddl)
+        build_index(conn, "chunks_content_tsv_idx",
+                    "CREATE INDEX CONCURRENTLY chunks_content_tsv_idx ON chunks USING gin (content_tsv)")
+        build_index(conn, "source_documents_metadata_idx",
+                    "CREATE INDEX CONCURRENTLY source_documents_metadata_idx "
+                    "ON source_documents USING gin (metadata jsonb_path_ops)")
+    finally:
+        conn.autocommit = False
+
+
+def cutover(conn):
+    """Swap documents for the new tables in one short transaction"""
+    print("\n4. Cutting over...", flush=True)
+    cursor = conn.cursor()
+    start = time.perf_counter()
+    try:
+        cursor.execute("SET LOCAL lock_timeout = %s", (LOCK_TIMEOUT,))
+        # Blocks writes, reads keep going until the rename below
+        cursor.execute("LOCK TABLE documents IN EXCLUSIVE MODE")
+        verified = swap(cursor)
+    except errors.LockNotAvailable:
+        conn.rollback()
+        print(f"   ✗ documents is busy (no lock within {LOCK_TIMEOUT}), run again to retry the cutover")
+        return False
+    except Exception:
+        conn.rollback()
+        raise
+    if not verified:
+        conn.rollback()
+        return False
+    conn.commit()
+    cursor.close()
+
+    print(f"   ✓ documents renamed to documents_legacy, view and search functions installed "
+          f"({time.perf_counter() - start:.1f}s)")
+    return True
+
+
+def swap(cursor) -> bool:
+    """Repair and verify the copy, then replace documents (runs under the cutover lock)"""
+    # The mirror keeps both sides equal, this only repairs manual edits made with it disabled
+    cursor.execute(COPY_SQL.format(
+        where="NOT EXISTS (SELECT 1 FROM chunks WHERE chunks.id = documents.id)", limit=""
+    ))
+    repaired = cursor.fetchone()[1]
+    cursor.execute("DELETE FROM chunks WHERE NOT EXISTS (SELECT 1 FROM documents WHERE documents.id = chunks.id)")
+    repaired += cursor.rowcount
+    cursor.execute("""
+        DELETE FROM source_documents
+        WHERE NOT EXISTS (SELECT 1 FROM chunks WHERE chunks.document_id = source_documents.id)
+    """)
+
+    cursor.execute("SELECT COUNT(*), COUNT(DISTINCT filename) FROM documents")
+    old_chunks, old_files = cursor.fetchone()
+    cursor.execute("SELECT (SELECT COUNT(*) FROM chunks), (SELECT COUNT(*) FROM source_documents)")
+    new_chunks, new_files = cursor.fetchone()
+    if (old_chunks, old_files) != (new_chunks, new_files):
+        print(f"   ✗ Counts differ: documents {old_files} files/{old_chunks} chunks, "
+              f"new tables {new_files} files/{new_chunks} chunks. Nothing was changed.")
+        return False
+    print(f"   ✓ {new_files:,} files / {new_chunks:,} chunks verified"
+          + (f" ({repaired:,} rows repaired)" if repaired else ""))
+
+    cursor.execute(LEGACY_CLEANUP_SQL)
+    cursor.execute("ALTER TABLE documents RENAME TO documents_legacy")
+    cursor.execute(SETUP_SQL.read_text())
+    return True
+
+
+def drop_legacy(conn):
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS documents_legacy")
+    conn.commit()
+    cursor.close()
+    print("🗑️  documents_legacy dropped")
+
+
+def migrate(batch_size: int = BATCH_SIZE, pause: float = 0.0, cut_over: bool = True,
+            drop: bool = False):
+    conn = psycopg2.connect(SUPABASE_DB_URL)
+    try:
+        cursor = conn.cursor()
+        kind = relation_kind(cursor, "documents")
+        legacy = relation_kind(cursor, "documents_legacy")
+        cursor.close()
+        conn.commit()
+
+        print("=" * 60)
+        print("MIGRATING documents → source_documents + chunks")
+        print("=" * 60)
+
+        if kind == "r":
+            prepare(conn)
+            backfill(conn, batch_size, pause)
+            build_indexes(conn)
+            if not cut_over:
+                print("\n⏸️  Backfill done, writes stay mirrored. Run again without --no-cutover to finish.")
+                return
+            if not cutover(conn):
+                return
+        elif kind == "v":
+            print("\n✓ Already migrated (documents is a view)")
+        else:
+            print("\n✓ No documents table, run setup_db.py to create the schema")
+            return
+
+        if drop and relation_kind(conn.cursor(), "documents_legacy"):
+            drop_legacy(conn)
+        elif legacy or kind == "r":
+            print("\nℹ️  documents_legacy is kept; drop it with --drop-legacy once the app is verified")
+
+        print("\n" + "=" * 60)
+        print("✅ MIGRATION COMPLETE")
+        print("=" * 60)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move documents rows into source_documents + chunks")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=0.0,
+                        help="Seconds to sleep between batches to reduce load")
+    parser.add_argument("--no-cutover", action="store_true",
+                        help="Only backfill and keep mirroring, cut over in a later run")
+    parser.add_argument("--drop-legacy", action="store_true",
+                        help="Drop documents_legacy after the cutover")
+    args = parser.parse_args()
+
+    migrate(args.batch_size, args.pause, cut_over=not args.no_cutover, drop=args.drop_legacy)
@@ -14,28 +14,23 @@ def clear_screen():
 
 def get_stats(cursor):
     """Get current upload statistics"""
-    # Total chunks
-    cursor.execute("SELECT COUNT(*) FROM documents")
-    total_chunks = cursor.fetchone()[0]
-    
-    # Unique files
-    cursor.execute("SELECT COUNT(DISTINCT filename) FROM documents")
-    unique_files = cursor.fetchone()[0]
+    # Total files and chunks (trigger-maintained)
+    cursor.execute("SELECT files, chunks FROM corpus_stats")
+    unique_files, total_chunks = cursor.fetchone()
     
     # Latest uploaded file
     cursor.execute("""
-        SELECT filename, MAX(created_at) as last_upload
-        FROM documents 
-        GROUP BY filename 
-        ORDER BY last_upload DESC 
+        SELECT filename, updated_at as last_upload
+        FROM source_documents 
+        ORDER BY updated_at DESC 
         LIMIT 1
     """)
     latest = cursor.fetchone()
     
     # File types breakdown
     cursor.execute("""
-        SELECT file_type, COUNT(DISTINCT filename) as file_count, COUNT(*) as chunk_count
-        FROM documents 
+        SELECT file_type, COUNT(*) as file_count, SUM(total_chunks) as chunk_count
+        FROM source_documents 
         GROUP BY file_type
     """)
     file_types = cursor.fetchall()
@@ -0,0 +1,119 @@
+"""
+Process-wide query caches for the chat app
+TTL + LRU caches for query embeddings and search results, shared by all Streamlit sessions
+(modules are imported once per process, unlike rag_chat.py which reruns on every interaction)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from embedding_cache import normalize_text
+
+QUERY_EMBEDDING_TTL = 24 * 3600  # embeddings of a text never change, only bound memory
+QUERY_EMBEDDING_MAX_ENTRIES = 2000
+SEARCH_RESULT_TTL = 15 * 60
+SEARCH_RESULT_MAX_ENTRIES = 500
+FILTER_OPTIONS_TTL = 15 * 60
+CORPUS_STATS_TTL = 30  # how stale the corpus stats/version may be before we ask the database again
+
+# Single row maintained by triggers on source_documents and chunks (see setup_database.sql),
+# version changes whenever rows of either table are inserted, updated or deleted
+CORPUS_STATS_SQL = "SELECT files, chunks, version FROM corpus_stats"
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ttl seconds"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                expires, value = item
+                if expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+query_embeddings = TTLCache(QUERY_EMBEDDING_MAX_ENTRIES, QUERY_EMBEDDING_TTL)
+search_results = TTLCache(SEARCH_RESULT_MAX_ENTRIES, SEARCH_RESULT_TTL)
+filter_options = TTLCache(1, FILTER_OPTIONS_TTL)
+_corpus_stats = TTLCache(1, CORPUS_STATS_TTL)
+_last_version = {"value": None}
+
+
+def query_key(query: str) -> str:
+    """Cache key for a question, insensitive to whitespace differences"""
+    return normalize_text(query)
+
+
+def search_key(query: str, mode: str, filters: Dict[str, str], match_threshold: float,
+               match_count: int, version: Optional[Any]) -> tuple:
+    """Cache key for a search on a corpus version; the question's embedding is a function of its
+    query_key, so the key is known before the embedding"""
+    return (
+        query_key(query),
+        mode,
+        tuple(sorted(filters.items())),
+        match_threshold,
+        match_count,
+        version
+    )
+
+
+def corpus_stats(fetch: Callable[[], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """
+    Current corpus stats row (files, chunks, version), asking the database (via fetch)
+    at most every CORPUS_STATS_TTL s.
+
+    When the version changes all cached search results are dropped.
+    """
+    stats = _corpus_stats.get_or_set("stats", fetch)
+    note_corpus_version(stats)
+    return stats
+
+
+def note_corpus_version(stats: Optional[Dict[str, Any]]):
+    """Drop all cached search results when the version of a corpus stats row changed"""
+    version = stats["version"] if stats else None
+    if version != _last_version["value"]:
+        if _last_version["value"] is not None:
+            search_results.clear()
+        _last_version["value"] = version
+
@@ -0,0 +1,293 @@
+"""
+Async query path for the chat app
+AsyncOpenAI client and async Postgres connection pool, shared by all requests of a process
+(see rag_engine.py). Cached results are looked up first (keyed on the question, not its
+embedding); on a miss, work that does not depend on the query embedding runs while the
+embedding request is in flight, so a question costs its critical path instead of the sum of
+its steps:
+
+    semantic   corpus version -> cached results?
+               -> embedding -> vector search
+    hybrid     corpus version -> cached results?
+               -> embedding  ||  full-text search
+               -> vector search  ||  similarity of the full-text hits
+               -> reciprocal rank fusion (same ranking as match_documents_hybrid)
+
+The corpus version comes from memory except once every query_cache.CORPUS_STATS_TTL s.
+
+Cancelling a search or answer stream aborts its OpenAI request and Postgres query.
+"""
+
+import asyncio
+import os
+import time
+from collections import defaultdict
+from typing import AsyncIterator, Dict, List, Optional
+
+from openai import AsyncOpenAI
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+import query_cache
+from embedding_cache import get_cache
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = 1536
+
+# Vector index tuning per search (None = server default): higher is better recall, slower
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "0")) or None
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "0")) or None
+
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+POOL_TIMEOUT = 30  # seconds to wait for a free connection when the pool is exhausted
+
+# Detect dead connections (e.g. after Supabase restarts or idle NAT timeouts) quickly
+CONNECT_KWARGS = {
+    "connect_timeout": 10,
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 3,
+}
+
+HYBRID_CANDIDATES = 50  # candidates per ranking before fusion
+RRF_K = 60  # as in match_documents_hybrid
+
+# Filters accepted by the searches, passed as filter_<name> to the search functions
+SEARCH_FILTERS = ("file_type", "company", "metric", "year", "source_type")
+
+FILTER_OPTIONS_SQL = """
+    SELECT
+        ARRAY(SELECT DISTINCT file_type FROM source_documents ORDER BY 1) AS file_types,
+        ARRAY(SELECT DISTINCT metadata->>'company' FROM source_documents
+              WHERE file_type = 'KPI_DASHBOARD' AND metadata ? 'company' ORDER BY 1) AS companies,
+        ARRAY(SELECT DISTINCT metadata->>'metric' FROM source_documents
+              WHERE file_type = 'KPI_DASHBOARD' AND metadata ? 'metric' ORDER BY 1) AS metrics,
+        ARRAY(SELECT DISTINCT metadata->>'year' FROM source_documents
+              WHERE file_type = 'KPI_DASHBOARD' AND metadata ? 'year' ORDER BY 1) AS years
+"""
+
+SIMILARITY_SQL = """
+    SELECT id, 1 - (embedding <=> %(embedding)s::vector) AS similarity
+    FROM chunks
+    WHERE id = ANY(%(ids)s)
+"""
+
+
+def vector_literal(embedding: List[float]) -> str:
+    """Embedding in PostgreSQL vector format"""
+    return '[' + ','.join(map(str, embedding)) + ']'
+
+
+def filter_arguments(filters: Dict[str, str]) -> str:
+    """Named filter_<name> arguments of the search functions for the given filters"""
+    return "".join(f", filter_{name} => %(filter_{name})s" for name in filters)
+
+
+def fuse_rankings(semantic: List[Dict], lexical: List[Dict], match_count: int,
+                  rrf_k: int = RRF_K) -> List[Dict]:
+    """
+    Reciprocal rank fusion of the vector and full-text rankings, best match_count rows first.
+
+    Rows get an rrf_score; lexical rows need a similarity (see QueryService.lexical_search).
+    """
+    rows, scores = {}, defaultdict(float)
+    for ranking in (semantic, lexical):
+        for position, row in enumerate(ranking, 1):
+            rows.setdefault(row["id"], row)
+            scores[row["id"]] += 1.0 / (rrf_k + position)
+
+    fused = []
+    for chunk_id in sorted(scores, key=lambda chunk_id: -scores[chunk_id])[:match_count]:
+        row = {**rows[chunk_id], "rrf_score": scores[chunk_id]}
+        row.pop("text_rank", None)
+        fused.append(row)
+    return fused
+
+
+class QueryService:
+    """
+    Async embedding, search and answer generation, shared by all sessions of the app.
+
+    Without db_url only the OpenAI calls are available (local index mode).
+    """
+
+    def __init__(self, db_url: Optional[str], api_key: Optional[str],
+                 min_size: int = POOL_MIN_SIZE, max_size: int = POOL_MAX_SIZE):
+        self.db_url = db_url
+        self.api_key = api_key
+        self.min_size = min_size
+        self.max_size = max_size
+        self.openai = None
+        self.pool = None
+        # Corpus stats of the last database round trip, refreshed by one request at a time
+        self._stats = None
+        self._stats_time = None
+        self._stats_lock = asyncio.Lock()
+
+    async def open(self):
+        """Create the OpenAI client and the pool on the running event loop"""
+        self.openai = AsyncOpenAI(api_key=self.api_key)
+        if self.db_url:
+            self.pool = AsyncConnectionPool(
+                self.db_url,
+                min_size=self.min_size,
+                max_size=self.max_size,
+                timeout=POOL_TIMEOUT,
+                # No prepared statements: they break behind transaction-mode poolers (Supabase)
+                kwargs={**CONNECT_KWARGS, "autocommit": True, "row_factory": dict_row,
+                        "prepare_threshold": None},
+                check=AsyncConnectionPool.check_connection,
+                open=False,
+            )
+            await self.pool.open(wait=False)
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+        if self.openai is not None:
+            await self.openai.close()
+
+    # Database
+
+    async def _fetch(self, sql: str, params: Optional[Dict] = None) -> List[Dict]:
+        if self.pool is None:
+            raise RuntimeError("No database configured (SUPABASE_DB_URL)")
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(sql, params)
+            return await cursor.fetchall()
+
+    async def corpus_stats(self) -> Optional[Dict]:
+        """File/chunk counts and version of the corpus, None when the database is not reachable"""
+        try:
+            rows = await self._fetch(query_cache.CORPUS_STATS_SQL)
+        except Exception:
+            return None
+        return rows[0] if rows else None
+
+    def _stats_fresh(self) -> bool:
+        return (self._stats_time is not None and
+                time.monotonic() - self._stats_time < query_cache.CORPUS_STATS_TTL)
+
+    async def cached_corpus_stats(self) -> Optional[Dict]:
+        """corpus_stats, asking the database at most every query_cache.CORPUS_STATS_TTL s;
+        concurrent requests wait for the one refresh in flight"""
+        if not self._stats_fresh():
+            async with self._stats_lock:
+                if not self._stats_fresh():
+                    self._stats = await self.corpus_stats()
+                    self._stats_time = time.monotonic()
+        query_cache.note_corpus_version(self._stats)
+        return self._stats
+
+    async def filter_options(self) -> Dict:
+        """Values for the sidebar filters (file types and KPI companies, metrics and years)"""
+        return (await self._fetch(FILTER_OPTIONS_SQL))[0]
+
+    async def vector_search(self, embedding: List[float], match_threshold: float, match_count: int,
+                            filters: Dict[str, str]) -> List[Dict]:
+        """match_documents_ann, or match_documents_filtered when there are filters"""
+        params = {
+            "embedding": vector_literal(embedding),
+            "threshold": match_threshold,
+            "count": match_count,
+            "ef_search": HNSW_EF_SEARCH,
+            "probes": IVFFLAT_PROBES,
+            **{f"filter_{name}": value for name, value in filters.items()},
+        }
+        if filters:
+            sql = ("SELECT * FROM match_documents_filtered(%(embedding)s::vector, %(threshold)s, %(count)s, "
+                   "ef_search => %(ef_search)s, probes => %(probes)s" + filter_arguments(filters) + ")")
+        else:
+            sql = ("SELECT * FROM match_documents_ann(%(embedding)s::vector, %(threshold)s, %(count)s, "
+                   "%(ef_search)s, %(probes)s)")
+        return await self._fetch(sql, params)
+
+    async def lexical_search(self, query: str, match_count: int, filters: Dict[str, str]) -> List[Dict]:
+        """Full-text ranking of match_documents_lexical (no embedding needed)"""
+        params = {"query": query, "count": match_count,
+                  **{f"filter_{name}": value for name, value in filters.items()}}
+        sql = "SELECT * FROM match_documents_lexical(%(query)s, %(count)s" + filter_arguments(filters) + ")"
+        return await self._fetch(sql, params)
+
+    async def _with_similarity(self, rows: "asyncio.Task", embedding: List[float]) -> List[Dict]:
+        """Full-text hits with their vector similarity, looked up by id once both are known"""
+        rows = await rows
+        if not rows:
+            return rows
+        similarities = await self._fetch(SIMILARITY_SQL, {
+            "embedding": vector_literal(embedding),
+            "ids": [row["id"] for row in rows],
+        })
+        similarity = {row["id"]: row["similarity"] for row in similarities}
+        return [{**row, "similarity": similarity.get(row["id"])} for row in rows]
+
+    # OpenAI
+
+    async def embed(self, query: str) -> List[float]:
+        """Embedding for a chat question (memory cache, then the embedding cache, then OpenAI)"""
+        key = query_cache.query_key(query)
+        embedding = query_cache.query_embeddings.get(key)
+        if embedding is not None:
+            return embedding
+        cache = get_cache()
+        embedding = cache.get(EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, query) if cache else None
+        if embedding is None:
+            response = await self.openai.embeddings.create(
+                model=EMBEDDING_MODEL, input=[query], dimensions=EMBEDDING_DIMENSIONS
+            )
+            embedding = response.data[0].embedding
+            if cache:
+                cache.put(EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, query, embedding)
+        query_cache.query_embeddings.set(key, embedding)
+        return embedding
+
+    async def complete(self, messages: List[Dict], **options) -> str:
+        """Chat completion text"""
+        response = await self.openai.chat.completions.create(messages=messages, **options)
+        return response.choices[0].message.content
+
+    async def stream(self, messages: List[Dict], **options) -> AsyncIterator[str]:
+        """Chat completion text as the tokens arrive (the request is closed when cancelled)"""
+        response = await self.openai.chat.completions.create(messages=messages, stream=True, **options)
+        async with response:
+            async for event in response:
+                if event.choices and event.choices[0].delta.content:
+                    yield event.choices[0].delta.content
+
+    # Search
+
+    async def search(self, query: str, match_count: int, match_threshold: float,
+                     mode: str = "semantic", filters: Optional[Dict[str, str]] = None) -> List[Dict]:
+        """
+        Search chunks (results cached until the corpus changes), see the module docstring for
+        what runs concurrently.
+        """
+        filters = filters or {}
+        stats = await self.cached_corpus_stats()
+        cache_key = query_cache.search_key(
+            query, mode, filters, match_threshold, match_count, stats["version"] if stats else None
+        )
+        cached = query_cache.search_results.get(cache_key)
+        if cached is not None:
+            return cached
+
+        if mode == "hybrid":
+            lexical = asyncio.create_task(self.lexical_search(query, HYBRID_CANDIDATES, filters))
+            try:
+                embedding = await self.embed(query)
+                # The threshold only applies to the vector ranking, keyword matches always count
+                semantic, lexical_rows = await asyncio.gather(
+                    self.vector_search(embedding, match_threshold, HYBRID_CANDIDATES, filters),
+                    self._with_similarity(lexical, embedding),
+                )
+            finally:
+                lexical.cancel()
+            results = fuse_rankings(semantic, lexical_rows, match_count)
+        else:
+            embedding = await self.embed(query)
+            results = await self.vector_search(embedding, match_threshold, match_count, filters)
+
+        query_cache.search_results.set(cache_key, results)
+        return results
@@ -1,12 +1,9 @@
 import streamlit as st
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import openai
-from openai import OpenAI
 import os
 from dotenv import load_dotenv
-import json
+import time
 from datetime import datetime
+from rag_client import connect
 
 # Load environment variables (for local development)
 load_dotenv()
@@ -34,9 +31,6 @@ def get_secret(key):
     # Fall back to environment variable (for local development)
     return os.getenv(key)
 
-# Initialize OpenAI client
-client = OpenAI(api_key=get_secret('OPENAI_API_KEY'))
-
 # Set theme to light
 st.markdown("""
 <script>
@@ -341,157 +335,107 @@ else:
     </div>
     """, unsafe_allow_html=True)
 
-# Database connection
-def get_db_connection():
-    """Create database connection"""
-    try:
-        conn = psycopg2.connect(
-            get_secret('SUPABASE_DB_URL'),
-            cursor_factory=RealDictCursor
-        )
-        conn.autocommit = True  # Important for read-only queries
-        return conn
-    except Exception as e:
-        st.error(f"Database connection error: {str(e)}")
-        return None
+# Retrieval and answers: the HTTP service (python rag_service.py) when RAG_SERVICE_URL is set,
+# otherwise the engine in this process (one per process, shared by all sessions)
+RAG_SERVICE_URL = get_secret('RAG_SERVICE_URL')
 
-def get_embedding(text):
-    """Generate embedding for text using OpenAI"""
-    response = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text
+@st.cache_resource(show_spinner=False)
+def get_engine():
+    """Client of the retrieval/answer engine"""
+    return connect(
+        RAG_SERVICE_URL,
+        db_url=get_secret('SUPABASE_DB_URL'),
+        api_key=get_secret('OPENAI_API_KEY'),
+        local_index_path=get_secret('LOCAL_INDEX_PATH')
     )
-    return response.data[0].embedding
 
-def search_documents(query, match_count=5, match_threshold=0.7):
-    """Search for relevant document chunks"""
-    conn = None
-    cursor = None
-    try:
-        # Generate query embedding
-        query_embedding = get_embedding(query)
-        
-        # Convert embedding list to PostgreSQL vector format
-        embedding_str = '[' + ','.join(map(str, query_embedding)) + ']'
-        
-        # Connect to database
-        conn = get_db_connection()
-        if not conn:
-            return []
-        
-        cursor = conn.cursor()
-        
-        # Call the match_documents function with proper type casting
-        cursor.execute(
-            "SELECT * FROM match_documents(%s::vector, %s, %s)",
-            (embedding_str, match_threshold, match_count)
-        )
-        
-        results = cursor.fetchall()
-        
-        return results
-    except Exception as e:
-        st.error(f"Error searching documents: {str(e)}")
-        return []
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+# Search modes: "semantic" = vector only, "hybrid" = vector + full-text fused with RRF
+SEARCH_MODES = {"Hybrid (semantic + keywords)": "hybrid", "Semantic": "semantic"}
 
-def generate_answer(query, context_chunks):
-    """Generate answer using OpenAI with context"""
-    if not context_chunks:
-        return "I could not find relevant information in the documents. / Ik kon geen relevante informatie vinden in de documenten.", []
-    
-    # Improved language detection
-    query_lower = query.lower()
-    
-    # Dutch indicators
-    dutch_words = ['wat', 'hoe', 'welke', 'waarom', 'waar', 'wanneer', 'wie', 'kunnen', 'moet', 'hebben', 
-                   'zijn', 'wordt', 'voor', 'met', 'van', 'een', 'het', 'de', 'bij', 'naar', 'over']
-    # Spanish indicators  
-    spanish_words = ['qué', 'cómo', 'cuál', 'por qué', 'dónde', 'cuándo', 'quién', 'puede', 'debe', 
-                     'tiene', 'son', 'está', 'para', 'con', 'del', 'los', 'las', 'una', 'sobre']
-    # English indicators
-    english_words = ['what', 'how', 'which', 'why', 'where', 'when', 'who', 'can', 'should', 'have', 
-                     'is', 'are', 'for', 'with', 'from', 'about', 'the', 'and', 'to', 'of']
-    
-    dutch_count = sum(1 for word in dutch_words if word in query_lower)
-    spanish_count = sum(1 for word in spanish_words if word in query_lower)
-    english_count = sum(1 for word in english_words if word in query_lower)
-    
-    # Determine language based on highest count
-    if dutch_count > spanish_count and dutch_count > english_count:
-        language = "DUTCH"
-        language_full = "Dutch/Nederlands"
-    elif spanish_count > dutch_count and spanish_count > english_count:
-        language = "SPANISH"
-        language_full = "Spanish/Español"
-    else:
-        language = "ENGLISH"
-        language_full = "English"
-    
-    # Prepare context with numbered sources
-    context_text = ""
-    for i, chunk in enumerate(context_chunks, 1):
-        context_text += f"\n\n[Source {i}] {chunk['filename']}\n{chunk['content']}\n---"
-    
-    # Create prompt with VERY explicit language instruction
-    prompt = f"""CRITICAL INSTRUCTION: You MUST answer in {language} ONLY. The user's question is in {language}.
+def fetch_corpus_stats():
+    """File/chunk counts and version of the corpus (single trigger-maintained row)"""
+    try:
+        return get_engine().corpus_stats()
+    except Exception:
+        return None
 
-The source documents below may be in Spanish, Dutch, or English, but you MUST translate/answer in {language} regardless of source language.
+@st.cache_data(ttl=300, show_spinner=False)
+def get_engine_health():
+    """Re-ranking setup of the engine (reranker, rerank_candidates), for the sidebar defaults"""
+    try:
+        return get_engine().health()
+    except Exception:
+        return {}
 
-Sources (ignore their language, answer in {language}):
-{context_text}
+def get_filter_options():
+    """Values for the sidebar filters (file types and KPI companies, metrics and years)"""
+    try:
+        return get_engine().filter_options() or {}
+    except Exception:
+        return {}
 
-User Question (in {language}): {query}
+def timed_stream(chunks, timings, start):
+    """Pass a token stream through, recording the time to the first token"""
+    for chunk in chunks:
+        timings.setdefault("first_token", time.perf_counter() - start)
+        yield chunk
 
-ANSWER REQUIREMENTS (in {language} ONLY):
-1. Write your ENTIRE answer in {language} - DO NOT use Spanish, Dutch, or any other language
-2. Translate information from sources into {language}
-3. Add [Source X] citations after each statement
-4. Include relevant details, examples, and data
-5. If sources are in a different language, TRANSLATE the content to {language}
+def format_timings(timings, candidates, kept):
+    """One-line summary of the time per pipeline stage"""
+    if "kpi" in timings:
+        # Answered from the KPI store: no search, no LLM
+        return f"⏱️ KPI store {timings['kpi'] * 1e6:,.0f} µs · {candidates} KPI values, no search or LLM"
+    labels = (("search", "search"), ("rerank", "re-rank"), ("context", "context"),
+              ("first_token", "first token"), ("answer", "answer"))
+    stages = [f"{label} {timings[key] * 1000:,.0f} ms" for key, label in labels if key in timings]
+    tokens = sum(passage.get("tokens", 0) for passage in kept)
+    return f"⏱️ {' · '.join(stages)} · {candidates} chunks → {len(kept)} sources ({tokens:,} tokens)"
 
-Begin your answer in {language} now:"""
+ERROR_ANSWER = "Er is een fout opgetreden bij het genereren van het antwoord."
+NO_CONTEXT = {"sources": [], "candidates": 0, "timings": {}}
 
-    # Generate answer
+def answer_text(events):
+    """Answer text from the events of an answer stream (ERROR_ANSWER when generation fails)"""
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": f"You are an expert assistant. CRITICAL RULE: You MUST answer ONLY in {language_full}. Even if source documents are in other languages, translate everything to {language_full}. Always cite sources as [Source X]."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=1200
-        )
-        
-        answer = response.choices[0].message.content
-        
-        # Prepare sources with more detail
-        sources = []
-        for i, chunk in enumerate(context_chunks, 1):
-            # Extract keywords from content for preview
-            preview = chunk["content"][:400] + "..." if len(chunk["content"]) > 400 else chunk["content"]
-            
-            sources.append({
-                "number": i,
-                "filename": chunk["filename"],
-                "content": chunk["content"],
-                "preview": preview,
-                "similarity": chunk["similarity"],
-                "chunk_index": chunk["chunk_index"],
-                "file_type": chunk.get("file_type", "unknown"),
-                "source_url": chunk.get("source_url")
-            })
-        
-        return answer, sources
-        
+        for event in events:
+            if event["type"] == "token":
+                yield event["text"]
     except Exception as e:
         st.error(f"Error generating answer: {str(e)}")
-        return "Er is een fout opgetreden bij het genereren van het antwoord.", []
+        yield ERROR_ANSWER
+
+def render_sources(sources, key_prefix):
+    """Show source cards directly (not in an expander)"""
+    st.markdown("---")
+    st.markdown(f"### 📚 Sources ({len(sources)})")
+    
+    for source in sources:
+        st.markdown(f"""
+        <div class="source-box">
+            <div class="source-title">
+                [Source {source['number']}] {source['filename']} 
+                <span class="similarity-badge">{source['similarity']:.2%} relevance</span>
+            </div>
+            <div style="font-size: 0.9rem; color: #000000; margin-top: 0.3rem;">
+                📄 {source.get('file_type', 'unknown').upper()} • {source.get('chunk_label', f"Chunk {source['chunk_index']}")}
+            </div>
+            <div style="margin-top: 0.8rem; padding: 0.8rem; background-color: white; border-radius: 0.3rem; font-size: 0.95rem; line-height: 1.6; color: #000000;">
+                <strong>Quote:</strong><br>
+                <em>"{source['preview']}"</em>
+            </div>
+            {f'<a href="{source["source_url"]}" target="_blank" class="source-link">🔗 View Original Source</a>' if source.get('source_url') else ''}
+        </div>
+        """, unsafe_allow_html=True)
+        
+        # Add a "show full content" expander for each source
+        with st.expander(f"🔍 Show full text of Source {source['number']}"):
+            st.text_area(
+                "Full chunk content",
+                source['content'],
+                height=200,
+                key=f"{key_prefix}_{source['number']}",
+                disabled=True
+            )
 
 # Initialize session state
 if "messages" not in st.session_state:
@@ -529,30 +473,52 @@ with st.sidebar:
         help="Minimum similarity score (higher = stricter match)"
     )
     
+    search_mode = SEARCH_MODES[st.selectbox(
+        "Search mode",
+        list(SEARCH_MODES),
+        help="Hybrid also finds exact terms like company names, KPI names and episode numbers"
+    )]
+    
+    with st.expander("🔎 Filters"):
+        filter_options = get_filter_options()
+        search_filters = {
+            "file_type": st.selectbox("File type", ["All"] + filter_options.get("file_types", [])),
+            "company": st.selectbox("Company (KPI)", ["All"] + filter_options.get("companies", [])),
+            "metric": st.selectbox("Metric (KPI)", ["All"] + filter_options.get("metrics", [])),
+            "year": st.selectbox("Year (KPI)", ["All"] + filter_options.get("years", [])),
+        }
+        search_filters = {name: value for name, value in search_filters.items() if value != "All"}
+    
+    engine_health = get_engine_health()
+    use_reranker = st.toggle(
+        "Re-rank results",
+        value=engine_health.get("reranker", "off") != "off",
+        help=f"Score the top {engine_health.get('rerank_candidates', 50)} search results and keep the most relevant ones"
+    )
+    
+    use_kpi_store = st.toggle(
+        "Answer KPI questions directly",
+        value=True,
+        help="Lookups, rankings and ARR bucket averages of the KPI dashboard are answered from its data, without search or LLM"
+    )
+    
+    stream_answers = st.toggle(
+        "Stream answers",
+        value=True,
+        help="Show the answer while it is being written"
+    )
+    
     st.divider()
     
     # Stats
     st.markdown("<h2 style='color: #000000;'>📊 Database Stats</h2>", unsafe_allow_html=True)
-    conn = None
-    cursor = None
-    try:
-        conn = get_db_connection()
-        if conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(DISTINCT filename) as files, COUNT(*) as chunks FROM documents")
-            stats = cursor.fetchone()
-            
-            st.metric("Total Files", f"{stats['files']:,}")
-            st.metric("Total Chunks", f"{stats['chunks']:,}")
-        else:
-            st.error("No database connection")
-    except Exception as e:
-        st.error(f"Could not load stats: {str(e)}")
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+    # O(1): the engine reads the corpus_stats row at most every 30s (shared with the search cache)
+    stats = fetch_corpus_stats()
+    if stats:
+        st.metric("Total Files", f"{stats['files']:,}")
+        st.metric("Total Chunks", f"{stats['chunks']:,}")
+    else:
+        st.error("Could not load stats")
     
     st.divider()
     
@@ -571,37 +537,10 @@ with tab1:
             st.markdown(message["content"])
             
             # Show sources if available - DIRECTLY visible, not in expander
+            if message.get("timings"):
+                st.caption(message["timings"])
             if "sources" in message and message["sources"]:
-                st.markdown("---")
-                st.markdown(f"### 📚 Sources ({len(message['sources'])})")
-                
-                for source in message["sources"]:
-                    st.markdown(f"""
-                    <div class="source-box">
-                        <div class="source-title">
-                            [Source {source['number']}] {source['filename']} 
-                            <span class="similarity-badge">{source['similarity']:.2%} relevance</span>
-                        </div>
-                        <div style="font-size: 0.9rem; color: #000000; margin-top: 0.3rem;">
-                            📄 {source.get('file_type', 'unknown').upper()} • Chunk {source['chunk_index']}
-                        </div>
-                        <div style="margin-top: 0.8rem; padding: 0.8rem; background-color: white; border-radius: 0.3rem; font-size: 0.95rem; line-height: 1.6; color: #000000;">
-                            <strong>Quote:</strong><br>
-                            <em>"{source['preview']}"</em>
-                        </div>
-                        {f'<a href="{source["source_url"]}" target="_blank" class="source-link">🔗 View Original Source</a>' if source.get('source_url') else ''}
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    # Add a "show full content" expander for each source
-                    with st.expander(f"🔍 Show full text of Source {source['number']}"):
-                        st.text_area(
-                            "Full chunk content",
-                            source['content'],
-                            height=200,
-                            key=f"source_{message.get('timestamp', 0)}_{source['number']}",
-                            disabled=True
-                        )
+                render_sources(message["sources"], f"source_{message.get('timestamp', 0)}")
 
     # Chat input
     if prompt := st.chat_input("Ask a question about AI adoption, investors, technology, or company KPIs..."):
@@ -613,61 +552,59 @@ with tab1:
         
         # Generate response
         with st.chat_message("assistant"):
-            with st.spinner("Searching documents..."):
-                # Search for relevant chunks
-                relevant_chunks = search_documents(prompt, match_count, match_threshold)
+            # Search for relevant chunks and keep the best ones. Updating the status lets
+            # Streamlit stop the script (and cancel the search) when the user reruns it.
+            status = st.empty()
+            events = get_engine().stream_answer(
+                prompt,
+                on_wait=lambda elapsed: status.caption(f"🔎 Searching documents... {elapsed:.1f}s"),
+                match_count=match_count,
+                match_threshold=match_threshold,
+                mode=search_mode,
+                filters=search_filters,
+                use_reranker=use_reranker,
+                use_kpi_store=use_kpi_store
+            )
+            try:
+                # The sources arrive first, as soon as retrieval finishes
+                context = next(events, None) or NO_CONTEXT
+            except Exception as e:
+                st.error(f"Error searching documents: {str(e)}")
+                context = NO_CONTEXT
+            status.empty()
+            
+            if not context["sources"]:
+                events.close()
+                response = "I could not find relevant information. Try rephrasing your question or lowering the similarity threshold."
+                st.markdown(response)
+                st.session_state.messages.append({"role": "assistant", "content": response})
+            else:
+                # The answer goes above the sources, but the sources are rendered first
+                answer_container = st.container()
+                sources = context["sources"]
+                timings = context["timings"]
+                render_sources(sources, "new_source")
+                
+                with answer_container:
+                    start = time.perf_counter()
+                    if stream_answers:
+                        answer = st.write_stream(timed_stream(answer_text(events), timings, start))
+                    else:
+                        with st.spinner("Generating answer..."):
+                            answer = "".join(answer_text(events))
+                        st.markdown(answer)
+                    timings["answer"] = time.perf_counter() - start
+                    timing_line = format_timings(timings, context["candidates"], sources)
+                    st.caption(timing_line)
                 
-                if not relevant_chunks:
-                    response = "I could not find relevant information. Try rephrasing your question or lowering the similarity threshold."
-                    st.markdown(response)
-                    st.session_state.messages.append({"role": "assistant", "content": response})
-                else:
-                    # Generate answer
-                    with st.spinner("Generating answer..."):
-                        answer, sources = generate_answer(prompt, relevant_chunks)
-                    
-                    st.markdown(answer)
-                    
-                    # Show sources directly (not in expander)
-                    if sources:
-                        st.markdown("---")
-                        st.markdown(f"### 📚 Sources ({len(sources)})")
-                        
-                        for source in sources:
-                            st.markdown(f"""
-                            <div class="source-box">
-                                <div class="source-title">
-                                    [Source {source['number']}] {source['filename']} 
-                                    <span class="similarity-badge">{source['similarity']:.2%} relevance</span>
-                                </div>
-                                <div style="font-size: 0.9rem; color: #000000; margin-top: 0.3rem;">
-                                    📄 {source.get('file_type', 'unknown').upper()} • Chunk {source['chunk_index']}
-                                </div>
-                                <div style="margin-top: 0.8rem; padding: 0.8rem; background-color: white; border-radius: 0.3rem; font-size: 0.95rem; line-height: 1.6; color: #000000;">
-                                    <strong>Quote:</strong><br>
-                                    <em>"{source['preview']}"</em>
-                                </div>
-                                {f'<a href="{source["source_url"]}" target="_blank" class="source-link">🔗 View Original Source</a>' if source.get('source_url') else ''}
-                            </div>
-                            """, unsafe_allow_html=True)
-                            
-                            # Add a "show full content" expander for each source
-                            with st.expander(f"🔍 Show full text of Source {source['number']}"):
-                                st.text_area(
-                                    "Full chunk content",
-                                    source['content'],
-                                    height=200,
-                                    key=f"new_source_{source['number']}",
-                                    disabled=True
-                                )
-                    
-                    # Save to session state
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": answer,
-                        "sources": sources,
-                        "timestamp": datetime.now().timestamp()
-                    })
+                # Save to session state
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": answer,
+                    "sources": sources,
+                    "timings": timing_line,
+                    "timestamp": datetime.now().timestamp()
+                })
     
     # Footer
     st.divider()
@@ -0,0 +1,201 @@
+"""
+Clients of the retrieval/answer engine for the Streamlit app
+EngineClient runs a RAGEngine in this process, on a background event loop; ServiceClient talks
+to rag_service.py over HTTP. Both have the same synchronous methods, so the app does not know
+where its questions are answered. rag_engine is only imported for an EngineClient, so with a
+service the app process does not load the engine (numpy, database pool, re-ranker).
+
+Long calls take on_wait(elapsed), called every WAIT_POLL_INTERVAL s until there is a result.
+When it raises (Streamlit stops a script for a rerun at its next st call) the client stops
+waiting and the work is cancelled: in-process always, on the service for answer streams
+(closing the connection). Closing an answer stream cancels it as well.
+"""
+
+import asyncio
+import json
+import queue
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+import requests
+
+WAIT_POLL_INTERVAL = 0.1
+SERVICE_TIMEOUT = 120  # seconds without a response (or stream event) from the service
+
+_DONE = object()
+
+
+def _drain(events: queue.Queue, on_wait: Optional[Callable[[float], Any]],
+           poll: float = WAIT_POLL_INTERVAL) -> Iterator:
+    """Items put in events until _DONE, calling on_wait while waiting for the first one"""
+    start = time.perf_counter()
+    first = True
+    while True:
+        try:
+            item = events.get(timeout=poll if first and on_wait else None)
+        except queue.Empty:
+            on_wait(time.perf_counter() - start)
+            continue
+        if item is _DONE:
+            return
+        first = False
+        yield item
+
+
+class EngineClient:
+    """RAGEngine in this process, on an event loop in a background thread"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="rag-engine", daemon=True).start()
+        self.run(engine.open())
+
+    def run(self, coro, on_wait: Optional[Callable[[float], Any]] = None,
+            poll: float = WAIT_POLL_INTERVAL) -> Any:
+        """Run coro on the engine loop and wait for its result (cancelled when on_wait raises)"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        start = time.perf_counter()
+        try:
+            while True:
+                try:
+                    return future.result(timeout=poll)
+                except TimeoutError:
+                    if future.done():
+                        raise  # coro itself timed out
+                    if on_wait:
+                        on_wait(time.perf_counter() - start)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def iterate(self, items: AsyncIterator, on_wait: Optional[Callable[[float], Any]] = None) -> Iterator:
+        """Iterate an async generator running on the engine loop; closing the iterator cancels it"""
+        events = queue.Queue()
+
+        async def pump():
+            try:
+                async for item in items:
+                    events.put(item)
+            finally:
+                events.put(_DONE)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            yield from _drain(events, on_wait)
+            future.result()  # raise the error that ended the generator, if any
+        finally:
+            future.cancel()
+
+    def health(self) -> Dict:
+        return self.engine.health()
+
+    def corpus_stats(self) -> Optional[Dict]:
+        return self.run(self.engine.corpus_stats())
+
+    def filter_options(self) -> Dict:
+        return self.run(self.engine.filter_options())
+
+    def search(self, query: str, on_wait=None, **settings) -> List[Dict]:
+        return self.run(self.engine.search(query, **settings), on_wait)
+
+    def answer(self, query: str, on_wait=None, **settings) -> Dict:
+        return self.run(self.engine.answer(query, **settings), on_wait)
+
+    def stream_answer(self, query: str, on_wait=None, **settings) -> Iterator[Dict]:
+        return self.iterate(self.engine.stream_answer(query, **settings), on_wait)
+
+
+class ServiceClient:
+    """rag_service.py over HTTP (one keep-alive session shared by all sessions of the app)"""
+
+    def __init__(self, url: str, timeout: float = SERVICE_TIMEOUT):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _request(self, method: str, path: str, body: Optional[Dict] = None, **kwargs) -> requests.Response:
+        response = self.session.request(method, self.url + path, json=body, timeout=self.timeout, **kwargs)
+        if response.status_code >= 400:
+            try:
+                error = response.json()["error"]
+            except (ValueError, KeyError):
+                error = response.text[:200]
+            response.close()
+            raise RuntimeError(f"{path}: {error} (HTTP {response.status_code})")
+        return response
+
+    def _call(self, method: str, path: str, body: Optional[Dict] = None, on_wait=None) -> Any:
+        """JSON result of a request, made in a thread so on_wait can interrupt the wait"""
+        results = queue.Queue()
+
+        def call():
+            try:
+                results.put((True, self._request(method, path, body).json()))
+            except Exception as e:
+                results.put((False, e))
+            finally:
+                results.put(_DONE)
+
+        threading.Thread(target=call, daemon=True).start()
+        ok, result = next(_drain(results, on_wait))
+        if not ok:
+            raise result
+        return result
+
+    def health(self) -> Dict:
+        return self._call("GET", "/health")
+
+    def corpus_stats(self) -> Optional[Dict]:
+        return self._call("GET", "/stats")
+
+    def filter_options(self) -> Dict:
+        return self._call("GET", "/filters")
+
+    def search(self, query: str, on_wait=None, **settings) -> List[Dict]:
+        return self._call("POST", "/search", {"query": query, **settings}, on_wait)["results"]
+
+    def answer(self, query: str, on_wait=None, **settings) -> Dict:
+        return self._call("POST", "/answer", {"query": query, **settings}, on_wait)
+
+    def stream_answer(self, query: str, on_wait=None, **settings) -> Iterator[Dict]:
+        """Events of /answer/stream; closing the iterator closes the connection, which cancels
+        the answer on the service"""
+        events = queue.Queue()
+        responses = []
+        closed = threading.Event()
+
+        def read():
+            try:
+                response = self._request("POST", "/answer/stream", {"query": query, **settings}, stream=True)
+                responses.append(response)
+                if closed.is_set():
+                    response.close()
+                    return
+                for line in response.iter_lines():
+                    if line:
+                        events.put(json.loads(line))
+            except Exception as e:
+                events.put({"type": "error", "message": str(e)})
+            finally:
+                events.put(_DONE)
+
+        threading.Thread(target=read, daemon=True).start()
+        try:
+            for event in _drain(events, on_wait):
+                if event["type"] == "error":
+                    raise RuntimeError(event["message"])
+                yield event
+        finally:
+            closed.set()
+            for response in responses:
+                response.close()
+
+
+def connect(service_url: Optional[str] = None, **engine_options):
+    """ServiceClient for service_url, otherwise an EngineClient (engine_options: see RAGEngine)"""
+    if service_url:
+        return ServiceClient(service_url)
+    from rag_engine import RAGEngine
+    return EngineClient(RAGEngine(**engine_options))
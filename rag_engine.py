@@ -0,0 +1,326 @@
+"""
+Retrieval and answer engine of the chat app
+Everything between a question and its answer, without Streamlit: search (the database through
+query_service.py, or a local snapshot), re-ranking, context assembly, prompt and generation. KPI lookups, rankings and ARR bucket
+averages are answered straight from the KPI store (kpi_store.py) without search or generation.
+The engine is async; one engine per process shares its connection pool and the query caches
+between all requests. The Streamlit app uses it in-process or through the HTTP service
+(rag_client.py, rag_service.py).
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import query_cache
+from context_builder import build_context, format_passage
+from kpi_store import KPI_DASHBOARD_PATH, KPIStore, kpi_source
+from local_index import LocalIndex
+from query_service import SEARCH_FILTERS, QueryService
+from reranker import RERANK_CANDIDATES, get_scorer, rerank
+
+# Search a local snapshot instead of the database (python local_index.py snapshot)
+LOCAL_INDEX_PROBES = int(os.getenv("LOCAL_INDEX_PROBES", "0")) or None
+LOCAL_INDEX_EXACT = os.getenv("LOCAL_INDEX_EXACT", "off").lower() in ("on", "1", "true", "yes")
+
+# Search modes: "semantic" = vector only, "hybrid" = vector + full-text fused with RRF
+SEARCH_MODES = ("semantic", "hybrid")
+
+# Re-ranking: RERANK_CANDIDATES chunks are fetched and scored, the best match_count are merged
+# into passages (overlap removed, duplicates dropped) that fit the prompt token budget
+RERANKER = os.getenv("RERANKER", "lexical")  # lexical, cross-encoder or off
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+
+# Dashboard whose COMPANY_DATA answers KPI questions directly ("" = every question goes to RAG)
+KPI_DASHBOARD = os.getenv("KPI_DASHBOARD_PATH", KPI_DASHBOARD_PATH)
+
+# Settings of a question, with their defaults (the JSON body of the HTTP service besides "query")
+QUESTION_SETTINGS = {
+    "match_count": 5,
+    "match_threshold": 0.7,
+    "mode": "semantic",
+    "filters": None,
+    "use_reranker": RERANKER != "off",
+    "use_kpi_store": True,
+}
+
+ANSWER_OPTIONS = {"model": "gpt-4o", "temperature": 0.7, "max_tokens": 1200}
+NO_RESULTS_ANSWER = "I could not find relevant information in the documents. / Ik kon geen relevante informatie vinden in de documenten."
+
+
+def detect_language(query):
+    """Guess the language of the question (DUTCH, SPANISH or ENGLISH)"""
+    query_lower = query.lower()
+
+    # Dutch indicators
+    dutch_words = ['wat', 'hoe', 'welke', 'waarom', 'waar', 'wanneer', 'wie', 'kunnen', 'moet', 'hebben',
+                   'zijn', 'wordt', 'voor', 'met', 'van', 'een', 'het', 'de', 'bij', 'naar', 'over']
+    # Spanish indicators
+    spanish_words = ['qué', 'cómo', 'cuál', 'por qué', 'dónde', 'cuándo', 'quién', 'puede', 'debe',
+                     'tiene', 'son', 'está', 'para', 'con', 'del', 'los', 'las', 'una', 'sobre']
+    # English indicators
+    english_words = ['what', 'how', 'which', 'why', 'where', 'when', 'who', 'can', 'should', 'have',
+                     'is', 'are', 'for', 'with', 'from', 'about', 'the', 'and', 'to', 'of']
+
+    dutch_count = sum(1 for word in dutch_words if word in query_lower)
+    spanish_count = sum(1 for word in spanish_words if word in query_lower)
+    english_count = sum(1 for word in english_words if word in query_lower)
+
+    # Determine language based on highest count
+    if dutch_count > spanish_count and dutch_count > english_count:
+        language = "DUTCH"
+        language_full = "Dutch/Nederlands"
+    elif spanish_count > dutch_count and spanish_count > english_count:
+        language = "SPANISH"
+        language_full = "Spanish/Español"
+    else:
+        language = "ENGLISH"
+        language_full = "English"
+
+    return language, language_full
+
+
+def chunk_label(chunk):
+    """'Chunk 3' or 'Chunks 3-5' for a passage of merged chunks"""
+    indexes = chunk.get("chunk_indexes") or [chunk["chunk_index"]]
+    if len(indexes) == 1:
+        return f"Chunk {indexes[0]}"
+    return f"Chunks {indexes[0]}-{indexes[-1]}"
+
+
+def build_sources(context_chunks):
+    """Source cards for the context passages, numbered like the [Source X] citations"""
+    sources = []
+    for i, chunk in enumerate(context_chunks, 1):
+        # Extract keywords from content for preview
+        preview = chunk["content"][:400] + "..." if len(chunk["content"]) > 400 else chunk["content"]
+
+        sources.append({
+            "number": i,
+            "filename": chunk["filename"],
+            "content": chunk["content"],
+            "preview": preview,
+            "similarity": chunk["similarity"],
+            "chunk_index": chunk["chunk_index"],
+            "chunk_label": chunk_label(chunk),
+            "file_type": chunk.get("file_type", "unknown"),
+            "source_url": chunk.get("source_url"),
+            "tokens": chunk.get("tokens", 0)
+        })
+    return sources
+
+
+def build_messages(query, context_chunks):
+    """Chat completion messages for a question and its context chunks"""
+    language, language_full = detect_language(query)
+
+    # Prepare context with numbered sources
+    context_text = ""
+    for i, chunk in enumerate(context_chunks, 1):
+        context_text += format_passage(i, chunk)
+
+    # Create prompt with VERY explicit language instruction
+    prompt = f"""CRITICAL INSTRUCTION: You MUST answer in {language} ONLY. The user's question is in {language}.
+
+The source documents below may be in Spanish, Dutch, or English, but you MUST translate/answer in {language} regardless of source language.
+
+Sources (ignore their language, answer in {language}):
+{context_text}
+
+User Question (in {language}): {query}
+
+ANSWER REQUIREMENTS (in {language} ONLY):
+1. Write your ENTIRE answer in {language} - DO NOT use Spanish, Dutch, or any other language
+2. Translate information from sources into {language}
+3. Add [Source X] citations after each statement
+4. Include relevant details, examples, and data
+5. If sources are in a different language, TRANSLATE the content to {language}
+
+Begin your answer in {language} now:"""
+
+    return [
+        {"role": "system", "content": f"You are an expert assistant. CRITICAL RULE: You MUST answer ONLY in {language_full}. Even if source documents are in other languages, translate everything to {language_full}. Always cite sources as [Source X]."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+class RAGEngine:
+    """
+    Search, retrieval and answers for the chat app.
+
+    Call open() on the event loop that will use the engine. With local_index_path the
+    searches run on the snapshot and no database is needed. Without a KPI dashboard (or when
+    it cannot be read) all questions go through retrieval.
+    """
+
+    def __init__(self, db_url: Optional[str] = None, api_key: Optional[str] = None,
+                 local_index_path: Optional[str] = None, reranker: str = RERANKER,
+                 context_token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 kpi_dashboard_path: Optional[str] = KPI_DASHBOARD):
+        self.service = QueryService(None if local_index_path else db_url, api_key)
+        self.local_index = LocalIndex(local_index_path) if local_index_path else None
+        self.reranker = reranker
+        self.context_token_budget = context_token_budget
+        self.kpi_store = None
+        if kpi_dashboard_path:
+            try:
+                self.kpi_store = KPIStore.from_html(kpi_dashboard_path)
+            except (OSError, ValueError) as e:
+                print(f"⚠️  KPI store not available, KPI questions go through search: {e}")
+        self._scorer = None
+        self._scorer_lock = threading.Lock()
+
+    async def open(self):
+        await self.service.open()
+
+    async def close(self):
+        await self.service.close()
+
+    def health(self) -> Dict:
+        """Status and the re-ranking setup, so clients can show its defaults without loading it"""
+        return {"status": "ok", "reranker": self.reranker, "rerank_candidates": RERANK_CANDIDATES}
+
+    async def corpus_stats(self) -> Optional[Dict]:
+        """File/chunk counts and version of the corpus (None when the database is not reachable)"""
+        if self.local_index:
+            return await asyncio.to_thread(query_cache.corpus_stats, self.local_index.stats)
+        return await self.service.cached_corpus_stats()
+
+    async def filter_options(self) -> Dict:
+        """Values for the search filters (file types and KPI companies, metrics and years)"""
+        options = query_cache.filter_options.get("options")
+        if options is None:
+            if self.local_index:
+                options = self.local_index.filter_options()
+            else:
+                options = await self.service.filter_options()
+            query_cache.filter_options.set("options", options)
+        return options
+
+    async def search(self, query: str, match_count: int = 5, match_threshold: float = 0.7,
+                     mode: str = "semantic", filters: Optional[Dict[str, str]] = None) -> List[Dict]:
+        """
+        Search for relevant document chunks (results cached until the corpus changes).
+
+        filters restricts the search, e.g. {"company": "Doctify", "year": "2024"}; see SEARCH_FILTERS.
+        """
+        filters = {name: value for name, value in (filters or {}).items() if value}
+        unknown = set(filters) - set(SEARCH_FILTERS)
+        if unknown:
+            raise ValueError(f"Unknown search filters: {', '.join(sorted(unknown))}")
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode} ({', '.join(SEARCH_MODES)})")
+
+        if not self.local_index:
+            # Embedding, full-text search and vector search overlap (see query_service.py)
+            return await self.service.search(query, match_count, match_threshold, mode, filters)
+
+        # The snapshot has no full-text index, hybrid searches run as semantic searches
+        stats = await self.corpus_stats()
+        cache_key = query_cache.search_key(
+            query, mode, filters, match_threshold, match_count, stats["version"] if stats else None
+        )
+        cached = query_cache.search_results.get(cache_key)
+        if cached is not None:
+            return cached
+        query_embedding = await self.service.embed(query)
+        results = await asyncio.to_thread(
+            self.local_index.search, query_embedding, match_threshold, match_count, filters,
+            LOCAL_INDEX_PROBES, LOCAL_INDEX_EXACT
+        )
+        query_cache.search_results.set(cache_key, results)
+        return results
+
+    def _get_scorer(self):
+        """Scorer for the re-ranking stage (a cross-encoder model is loaded once per process)"""
+        with self._scorer_lock:
+            if self._scorer is None:
+                try:
+                    self._scorer = get_scorer(self.reranker)
+                except Exception as e:
+                    print(f"⚠️  Re-ranker '{self.reranker}' not available, using lexical: {e}")
+                    self._scorer = get_scorer("lexical")
+            return self._scorer
+
+    async def retrieve(self, query: str, match_count: int = 5, match_threshold: float = 0.7,
+                       mode: str = "semantic", filters: Optional[Dict[str, str]] = None,
+                       use_reranker: bool = True) -> Tuple[List[Dict], int, Dict[str, float]]:
+        """Search + re-rank + context assembly, returns the passages for the prompt, the number
+        of candidates and the time per stage"""
+        timings = {}
+        start = time.perf_counter()
+        candidates = await self.search(
+            query, RERANK_CANDIDATES if use_reranker else match_count, match_threshold, mode, filters
+        )
+        timings["search"] = time.perf_counter() - start
+
+        # Scoring (a cross-encoder in particular) is CPU work, keep it off the event loop
+        start = time.perf_counter()
+        scorer = await asyncio.to_thread(self._get_scorer) if use_reranker else None
+        chunks = await asyncio.to_thread(rerank, query, candidates, match_count, scorer=scorer)
+        timings["rerank"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        passages = build_context(chunks, self.context_token_budget)
+        timings["context"] = time.perf_counter() - start
+        return passages, len(candidates), timings
+
+    def kpi_answer(self, query: str) -> Optional[Dict]:
+        """
+        Answer from the KPI store for a KPI lookup, ranking or bucket average (None for other
+        questions); candidates is the number of KPI values used, route is "kpi".
+        """
+        if self.kpi_store is None:
+            return None
+        start = time.perf_counter()
+        answer = self.kpi_store.route(query, detect_language(query)[0])
+        elapsed = time.perf_counter() - start
+        if answer is None:
+            return None
+        return {"answer": answer.text, "sources": [kpi_source(answer, self.kpi_store.path)],
+                "candidates": len(answer.records), "timings": {"kpi": elapsed}, "route": "kpi"}
+
+    async def answer(self, query: str, use_kpi_store: bool = True, **settings) -> Dict:
+        """
+        Answer with its sources, the number of search candidates, the time per stage and the
+        route ("kpi" or "rag"). Questions with search filters always go through retrieval.
+        """
+        if use_kpi_store and not settings.get("filters"):
+            direct = self.kpi_answer(query)
+            if direct:
+                return direct
+
+        passages, candidates, timings = await self.retrieve(query, **settings)
+        if not passages:
+            return {"answer": NO_RESULTS_ANSWER, "sources": [], "candidates": candidates, "timings": timings,
+                    "route": "rag"}
+
+        start = time.perf_counter()
+        answer = await self.service.complete(build_messages(query, passages), **ANSWER_OPTIONS)
+        timings["answer"] = time.perf_counter() - start
+        return {"answer": answer, "sources": build_sources(passages), "candidates": candidates,
+                "timings": timings, "route": "rag"}
+
+    async def stream_answer(self, query: str, use_kpi_store: bool = True, **settings) -> AsyncIterator[Dict]:
+        """
+        Answer as events: first {"type": "context", "sources", "candidates", "timings", "route"}
+        as soon as retrieval is done, then {"type": "token", "text"} while the answer is written.
+
+        Without sources no answer is generated. A direct KPI answer is a single token event.
+        """
+        if use_kpi_store and not settings.get("filters"):
+            direct = self.kpi_answer(query)
+            if direct:
+                text = direct.pop("answer")
+                yield {"type": "context", **direct}
+                yield {"type": "token", "text": text}
+                return
+
+        passages, candidates, timings = await self.retrieve(query, **settings)
+        yield {"type": "context", "sources": build_sources(passages), "candidates": candidates,
+               "timings": timings, "route": "rag"}
+        if passages:
+            async for text in self.service.stream(build_messages(query, passages), **ANSWER_OPTIONS):
+                yield {"type": "token", "text": text}
@@ -0,0 +1,168 @@
+"""
+Retrieval/answer HTTP service
+ASGI app around rag_engine.RAGEngine, so questions can be answered (and load tested) without
+Streamlit and scaled with worker processes. Each worker has one engine: one connection pool
+and one set of query caches for all its requests; the embedding cache (SQLite) is shared by
+all workers. Point the chat app at it with RAG_SERVICE_URL.
+
+Endpoints:
+    GET  /health          {"status": "ok", "reranker", "rerank_candidates"}
+    GET  /stats           corpus stats (files, chunks, version)
+    GET  /filters         values for the search filters
+    POST /search          {"query", settings...} -> {"results": [...]}
+    POST /answer          {"query", settings...} -> {"answer", "sources", "candidates", "timings"}
+    POST /answer/stream   same body, newline-delimited JSON events (see RAGEngine.stream_answer)
+
+Settings (all optional): match_count, match_threshold, mode, filters, use_reranker,
+use_kpi_store (/search takes the first four). KPI lookups, rankings and bucket averages are
+answered from the KPI store unless use_kpi_store is false or there are filters.
+
+Usage:
+    python rag_service.py --workers 4 --port 8000
+    uvicorn rag_service:app --workers 4 --port 8000
+"""
+
+import argparse
+import contextlib
+import json
+import os
+
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+from rag_engine import QUESTION_SETTINGS, RAGEngine
+
+load_dotenv()
+
+SEARCH_SETTINGS = ("match_count", "match_threshold", "mode", "filters")
+
+
+def json_response(data, status_code: int = 200) -> Response:
+    # Search results contain UUIDs
+    return Response(json.dumps(data, default=str), status_code=status_code,
+                    media_type="application/json")
+
+
+def error_response(error: Exception, status_code: int) -> Response:
+    return json_response({"error": str(error)}, status_code)
+
+
+async def read_question(request: Request, allowed=tuple(QUESTION_SETTINGS)):
+    """Question and settings from the JSON body, ValueError when they are not valid"""
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise ValueError("Body must be JSON")
+    if not isinstance(body, dict) or not isinstance(body.get("query"), str) or not body["query"].strip():
+        raise ValueError("Body must be a JSON object with a non-empty query")
+    query = body.pop("query")
+    unknown = set(body) - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+    return query, body
+
+
+def engine_of(request: Request) -> RAGEngine:
+    return request.app.state.engine
+
+
+async def health(request: Request) -> Response:
+    return json_response(engine_of(request).health())
+
+
+async def stats(request: Request) -> Response:
+    return json_response(await engine_of(request).corpus_stats())
+
+
+async def filters(request: Request) -> Response:
+    try:
+        return json_response(await engine_of(request).filter_options())
+    except Exception as e:
+        return error_response(e, 503)
+
+
+async def search(request: Request) -> Response:
+    try:
+        query, settings = await read_question(request, SEARCH_SETTINGS)
+        results = await engine_of(request).search(query, **settings)
+    except (ValueError, TypeError) as e:
+        return error_response(e, 400)
+    except Exception as e:
+        return error_response(e, 500)
+    return json_response({"results": results})
+
+
+async def answer(request: Request) -> Response:
+    try:
+        query, settings = await read_question(request)
+        result = await engine_of(request).answer(query, **settings)
+    except (ValueError, TypeError) as e:
+        return error_response(e, 400)
+    except Exception as e:
+        return error_response(e, 500)
+    return json_response(result)
+
+
+async def answer_stream(request: Request) -> Response:
+    try:
+        query, settings = await read_question(request)
+    except ValueError as e:
+        return error_response(e, 400)
+
+    async def events():
+        # A client that disconnects cancels this generator, and with it the OpenAI request
+        try:
+            async for event in engine_of(request).stream_answer(query, **settings):
+                yield json.dumps(event, default=str) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "message": str(e)}) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: Starlette):
+    engine = RAGEngine(
+        os.getenv("SUPABASE_DB_URL"),
+        os.getenv("OPENAI_API_KEY"),
+        local_index_path=os.getenv("LOCAL_INDEX_PATH"),
+    )
+    await engine.open()
+    app.state.engine = engine
+    try:
+        yield
+    finally:
+        await engine.close()
+
+
+app = Starlette(
+    routes=[
+        Route("/health", health),
+        Route("/stats", stats),
+        Route("/filters", filters),
+        Route("/search", search, methods=["POST"]),
+        Route("/answer", answer, methods=["POST"]),
+        Route("/answer/stream", answer_stream, methods=["POST"]),
+    ],
+    lifespan=lifespan,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval/answer HTTP service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("RAG_SERVICE_WORKERS", "1")),
+                        help="worker processes (each with its own connection pool, see DB_POOL_MAX_SIZE)")
+    args = parser.parse_args()
+
+    import uvicorn
+    print(f"🚀 RAG service on http://{args.host}:{args.port} ({args.workers} workers)")
+    uvicorn.run("rag_service:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Re-ranking stage between search and answer generation
+Scores an over-fetched list of candidate chunks against the question and keeps the best ones,
+so the answer prompt gets fewer, more relevant chunks (context_builder fits them into the
+prompt token budget).
+
+Scorers:
+    lexical        BM25 of the question terms over the candidates, blended with the vector
+                   similarity (no model, well under a millisecond per candidate)
+    cross-encoder  multilingual MiniLM cross-encoder on the CPU (pip install sentence-transformers)
+"""
+
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List
+
+RERANK_CANDIDATES = 50  # chunks fetched from the search functions before re-ranking
+CROSS_ENCODER_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")  # EN/NL/ES
+CROSS_ENCODER_BATCH_SIZE = 16
+
+# Lexical scorer: BM25 parameters and the weight of the (max-normalized) BM25 score next to
+# the vector similarity
+BM25_K1 = 1.2
+BM25_B = 0.75
+LEXICAL_WEIGHT = 0.3
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def terms(text: str) -> List[str]:
+    """Lowercase words of at least 3 characters"""
+    return [word for word in _WORD.findall(text.lower()) if len(word) >= 3]
+
+
+class LexicalScorer:
+    """BM25 over the candidate set blended with the vector similarity"""
+
+    name = "lexical"
+
+    def score(self, query: str, candidates: List[Dict]) -> List[float]:
+        query_terms = set(terms(query))
+        documents = [Counter(terms(candidate["content"])) for candidate in candidates]
+        lengths = [sum(document.values()) for document in documents]
+        average_length = (sum(lengths) / len(lengths)) if lengths else 0
+        document_frequency = Counter(term for document in documents for term in query_terms if term in document)
+
+        bm25 = []
+        for document, length in zip(documents, lengths):
+            score = 0.0
+            for term in query_terms:
+                frequency = document.get(term, 0)
+                if not frequency:
+                    continue
+                idf = math.log(1 + (len(documents) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (average_length or 1))
+                score += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+            bm25.append(score)
+
+        best = max(bm25, default=0) or 1
+        return [
+            (candidate.get("similarity") or 0) + LEXICAL_WEIGHT * score / best
+            for candidate, score in zip(candidates, bm25)
+        ]
+
+
+class CrossEncoderScorer:
+    """Cross-encoder relevance of (question, chunk) pairs, scored in batches on the CPU"""
+
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str = CROSS_ENCODER_MODEL):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError:
+            raise RuntimeError("The cross-encoder scorer needs sentence-transformers "
+                               "(pip install sentence-transformers)")
+        self.model = CrossEncoder(model_name, max_length=512, device="cpu")
+
+    def score(self, query: str, candidates: List[Dict]) -> List[float]:
+        pairs = [(query, candidate["content"]) for candidate in candidates]
+        return [float(score) for score in self.model.predict(pairs, batch_size=CROSS_ENCODER_BATCH_SIZE)]
+
+
+SCORERS = {"lexical": LexicalScorer, "cross-encoder": CrossEncoderScorer}
+
+
+def get_scorer(name: str):
+    """Scorer by name (see SCORERS)"""
+    if name not in SCORERS:
+        raise ValueError(f"Unknown re-ranker: {name} ({', '.join(SCORERS)})")
+    return SCORERS[name]()
+
+
+def rerank(query: str, candidates: List[Dict], top_n: int, scorer=None) -> List[Dict]:
+    """
+    Best top_n candidates by scorer, with their rerank_score; without a scorer the search
+    order is kept.
+    """
+    if not candidates:
+        return []
+    scores = scorer.score(query, candidates) if scorer else [None] * len(candidates)
+    order = sorted(range(len(candidates)), key=lambda i: -scores[i]) if scorer else range(len(candidates))
+    return [{**candidates[i], "rerank_score": scores[i]} for i in list(order)[:top_n]]
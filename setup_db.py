@@ -1,5 +1,6 @@
 """Setup the database schema automatically"""
 import os
+import sys
 from dotenv import load_dotenv
 import psycopg2
 
@@ -17,44 +18,401 @@ print("\n1. Enabling pgvector extension...", flush=True)
 cursor.execute("CREATE EXTENSION IF NOT EXISTS vector;")
 print("   ✓ pgvector enabled")
 
-print("\n2. Creating documents table...", flush=True)
+print("\n2. Creating source_documents and chunks tables...", flush=True)
+cursor.execute("SELECT 1 FROM pg_tables WHERE schemaname = current_schema() AND tablename = 'documents'")
+if cursor.fetchone():
+    print("   ✗ documents is still a single table: run migrate_to_chunks.py first")
+    sys.exit(1)
+
 cursor.execute("""
-    CREATE TABLE IF NOT EXISTS documents (
-        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-        filename TEXT NOT NULL,
+    -- One row per uploaded file with everything that is the same for all of its chunks
+    CREATE TABLE IF NOT EXISTS source_documents (
+        id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+        filename TEXT NOT NULL UNIQUE,
         file_type TEXT NOT NULL,
-        content TEXT NOT NULL,
-        chunk_index INTEGER NOT NULL,
         total_chunks INTEGER NOT NULL,
-        embedding vector(1536),
         metadata JSONB,
         created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
         updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
     );
+
+    -- The chunks of each document; only per-chunk data lives here so rows stay narrow
+    CREATE TABLE IF NOT EXISTS chunks (
+        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        document_id BIGINT NOT NULL REFERENCES source_documents(id) ON DELETE CASCADE,
+        chunk_index INTEGER NOT NULL,
+        content TEXT NOT NULL,
+        embedding vector(1536),
+        -- Full-text search over chunk content for hybrid retrieval. The corpus mixes English,
+        -- Dutch and Spanish, so the stems of all three configurations are stored.
+        content_tsv tsvector GENERATED ALWAYS AS (
+            to_tsvector('english', content) ||
+            to_tsvector('dutch', content) ||
+            to_tsvector('spanish', content)
+        ) STORED,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    );
 """)
-print("   ✓ documents table created")
+print("   ✓ source_documents and chunks tables created")
 
 print("\n3. Creating indexes...", flush=True)
-# Note: HNSW index is better for high dimensions but needs more memory
-# For now we skip the vector index and rely on sequential scan (fine for smaller datasets)
-# Or use: USING hnsw (embedding vector_cosine_ops) if available in your Supabase version
+cursor.execute("""
+    -- Which vector index the search functions use. 'full' indexes the vector(1536) column itself
+    -- (6 KB per chunk). The compact modes index an expression over the same column instead, so
+    -- the index is far smaller while the table keeps the full-precision vectors that the
+    -- candidates are re-ranked with (pgvector >= 0.7):
+    --   halfvec      all 1536 dimensions as 16-bit floats                         2x smaller
+    --   halfvec512   the first 512 dimensions as 16-bit floats; text-embedding-3     6x smaller
+    --                embeddings are trained so a prefix ranks like dimensions=512
+    --   bit          binary quantization, one bit per dimension (Hamming distance) 32x smaller
+    -- rerank_count is the number of candidates fetched from a compact index before re-ranking.
+    CREATE TABLE IF NOT EXISTS search_settings (
+        id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),  -- single row
+        vector_storage TEXT NOT NULL DEFAULT 'full'
+            CHECK (vector_storage IN ('full', 'halfvec', 'halfvec512', 'bit')),
+        rerank_count INTEGER NOT NULL DEFAULT 100 CHECK (rerank_count BETWEEN 1 AND 1000)
+    );
+
+    INSERT INTO search_settings (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING;
+""")
+cursor.execute("""
+    -- Switch the vector index: builds the index for the chosen storage and drops the others,
+    -- which is where the memory is saved. Building an HNSW index on a large table takes a while.
+    CREATE OR REPLACE FUNCTION set_vector_storage(storage TEXT, rerank INT DEFAULT NULL)
+    RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+    BEGIN
+        IF storage = 'full' THEN
+            -- A full index of another type (ivfflat from an older setup) is rebuilt as HNSW
+            IF EXISTS (SELECT 1 FROM pg_indexes
+                       WHERE schemaname = current_schema() AND indexname = 'chunks_embedding_idx'
+                         AND indexdef NOT LIKE '%USING hnsw%') THEN
+                DROP INDEX chunks_embedding_idx;
+            END IF;
+            CREATE INDEX IF NOT EXISTS chunks_embedding_idx
+            ON chunks USING hnsw (embedding vector_cosine_ops);
+        ELSIF storage = 'halfvec' THEN
+            CREATE INDEX IF NOT EXISTS chunks_embedding_halfvec_idx
+            ON chunks USING hnsw ((embedding::halfvec(1536)) halfvec_cosine_ops);
+        ELSIF storage = 'halfvec512' THEN
+            CREATE INDEX IF NOT EXISTS chunks_embedding_halfvec512_idx
+            ON chunks USING hnsw ((subvector(embedding, 1, 512)::halfvec(512)) halfvec_cosine_ops);
+        ELSIF storage = 'bit' THEN
+            CREATE INDEX IF NOT EXISTS chunks_embedding_bit_idx
+            ON chunks USING hnsw ((binary_quantize(embedding)::bit(1536)) bit_hamming_ops);
+        ELSE
+            RAISE EXCEPTION 'Unknown vector storage: % (full, halfvec, halfvec512 or bit)', storage;
+        END IF;
+
+        IF storage <> 'full' THEN
+            DROP INDEX IF EXISTS chunks_embedding_idx;
+        END IF;
+        IF storage <> 'halfvec' THEN
+            DROP INDEX IF EXISTS chunks_embedding_halfvec_idx;
+        END IF;
+        IF storage <> 'halfvec512' THEN
+            DROP INDEX IF EXISTS chunks_embedding_halfvec512_idx;
+        END IF;
+        IF storage <> 'bit' THEN
+            DROP INDEX IF EXISTS chunks_embedding_bit_idx;
+        END IF;
+
+        UPDATE search_settings
+        SET vector_storage = storage, rerank_count = COALESCE(rerank, rerank_count);
+    END;
+    $$;
+
+    -- ORDER BY expression (over chunks.embedding and the query vector $1) that the index for a
+    -- vector_storage setting serves
+    CREATE OR REPLACE FUNCTION vector_order_expression(storage TEXT)
+    RETURNS TEXT
+    LANGUAGE sql
+    IMMUTABLE
+    AS $$
+        SELECT CASE storage
+            WHEN 'halfvec' THEN 'chunks.embedding::halfvec(1536) <=> $1::halfvec(1536)'
+            WHEN 'halfvec512' THEN 'subvector(chunks.embedding, 1, 512)::halfvec(512) <=> subvector($1, 1, 512)::halfvec(512)'
+            WHEN 'bit' THEN 'binary_quantize(chunks.embedding)::bit(1536) <~> binary_quantize($1)'
+            ELSE 'chunks.embedding <=> $1'
+        END;
+    $$;
+""")
+# VECTOR_STORAGE=halfvec|halfvec512|bit switches to a compact index (pgvector >= 0.7);
+# without it the current setting is kept
+cursor.execute("SELECT vector_storage FROM search_settings")
+storage = os.getenv("VECTOR_STORAGE") or cursor.fetchone()[0]
 try:
-    cursor.execute("""
-        CREATE INDEX IF NOT EXISTS documents_embedding_idx 
-        ON documents 
-        USING hnsw (embedding vector_cosine_ops);
-    """)
-    print("   ✓ Vector similarity index (HNSW) created")
+    cursor.execute("SELECT set_vector_storage(%s)", (storage,))
+    if storage == "full":
+        print("   ✓ Vector similarity index (HNSW) created")
+    else:
+        print(f"   ✓ Compact vector index ({storage}) created, full vectors are kept for re-ranking")
 except Exception as e:
     print(f"   ⚠ Vector index skipped (will use sequential scan): {e}")
     # Sequential scan works fine for up to ~100k vectors
 
-cursor.execute("CREATE INDEX IF NOT EXISTS documents_filename_idx ON documents(filename);")
-cursor.execute("CREATE INDEX IF NOT EXISTS documents_file_type_idx ON documents(file_type);")
-print("   ✓ Filename and file_type indexes created")
+cursor.execute("CREATE INDEX IF NOT EXISTS chunks_document_id_idx ON chunks(document_id, chunk_index);")
+cursor.execute("CREATE INDEX IF NOT EXISTS source_documents_file_type_idx ON source_documents(file_type);")
+cursor.execute("CREATE INDEX IF NOT EXISTS source_documents_updated_at_idx ON source_documents(updated_at);")
+print("   ✓ document_id, file_type and updated_at indexes created")
+
+cursor.execute("CREATE INDEX IF NOT EXISTS chunks_content_tsv_idx ON chunks USING gin (content_tsv);")
+print("   ✓ Full-text search (EN/NL/ES) GIN index created")
+
+cursor.execute("""
+    -- Metadata filters (company, metric, year, source_type, ...) use containment: metadata @> '{...}'
+    CREATE INDEX IF NOT EXISTS source_documents_metadata_idx ON source_documents USING gin (metadata jsonb_path_ops);
+""")
+print("   ✓ Metadata GIN index created")
+
+cursor.execute("""
+    -- The original one-row-per-chunk shape, for ad-hoc queries and older scripts (read-only)
+    CREATE OR REPLACE VIEW documents AS
+    SELECT
+        chunks.id,
+        source_documents.filename,
+        source_documents.file_type,
+        chunks.content,
+        chunks.chunk_index,
+        source_documents.total_chunks,
+        chunks.embedding,
+        source_documents.metadata,
+        chunks.created_at,
+        chunks.updated_at,
+        chunks.content_tsv,
+        chunks.document_id
+    FROM chunks
+    JOIN source_documents ON source_documents.id = chunks.document_id;
+""")
+print("   ✓ documents view created")
+
+print("\n4. Creating ingest manifest and sources tables...", flush=True)
+cursor.execute("""
+    CREATE TABLE IF NOT EXISTS ingest_manifest (
+        filename TEXT PRIMARY KEY,
+        directory TEXT NOT NULL,
+        file_hash TEXT NOT NULL,
+        chunker TEXT NOT NULL,
+        embedding_model TEXT NOT NULL,
+        total_chunks INTEGER NOT NULL,
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    );
+""")
+cursor.execute("CREATE INDEX IF NOT EXISTS ingest_manifest_directory_idx ON ingest_manifest(directory);")
+print("   ✓ ingest_manifest table created")
+
+cursor.execute("""
+    -- Document-level source information (one row per uploaded file), joined by the search
+    -- functions so links and metadata arrive with the results. Loaded by load_sources.py.
+    CREATE TABLE IF NOT EXISTS sources (
+        filename TEXT PRIMARY KEY,
+        source_url TEXT,
+        file_hash TEXT,
+        language TEXT,
+        file_size BIGINT,
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    );
+""")
+print("   ✓ sources table created (load it with load_sources.py)")
+
+print("\n5. Creating corpus statistics (trigger maintained)...", flush=True)
+cursor.execute("""
+    CREATE TABLE IF NOT EXISTS corpus_stats (
+        id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),  -- single row
+        files BIGINT NOT NULL DEFAULT 0,
+        chunks BIGINT NOT NULL DEFAULT 0,
+        version BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    );
+
+    CREATE OR REPLACE FUNCTION corpus_stats_trigger()
+    RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        delta BIGINT := 0;
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            SELECT COUNT(*) INTO delta FROM new_rows;
+        ELSIF TG_OP = 'DELETE' THEN
+            SELECT -COUNT(*) INTO delta FROM old_rows;
+        ELSIF NOT EXISTS (SELECT 1 FROM new_rows) THEN
+            -- Statements that touched no rows don't change the corpus
+            RETURN NULL;
+        END IF;
+        IF TG_OP <> 'UPDATE' AND delta = 0 THEN
+            RETURN NULL;
+        END IF;
+
+        UPDATE corpus_stats SET
+            files = files + CASE WHEN TG_TABLE_NAME = 'source_documents' THEN delta ELSE 0 END,
+            chunks = chunks + CASE WHEN TG_TABLE_NAME = 'chunks' THEN delta ELSE 0 END,
+            version = version + 1,
+            updated_at = NOW();
+        RETURN NULL;
+    END;
+    $$;
+
+    CREATE OR REPLACE FUNCTION corpus_stats_truncate()
+    RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+    BEGIN
+        UPDATE corpus_stats SET
+            files = CASE WHEN TG_TABLE_NAME = 'source_documents' THEN 0 ELSE files END,
+            chunks = 0,
+            version = version + 1,
+            updated_at = NOW();
+        RETURN NULL;
+    END;
+    $$;
+
+    -- Recompute the statistics from scratch (initial backfill, or repair after manual edits).
+    -- Blocks writes to both tables while counting so no change is missed or counted twice.
+    CREATE OR REPLACE FUNCTION refresh_corpus_stats()
+    RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+    BEGIN
+        LOCK TABLE source_documents, chunks IN SHARE MODE;
+        INSERT INTO corpus_stats (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING;
+        UPDATE corpus_stats SET
+            files = (SELECT COUNT(*) FROM source_documents),
+            chunks = (SELECT COUNT(*) FROM chunks),
+            version = version + 1,
+            updated_at = NOW();
+    END;
+    $$;
+
+    DROP TRIGGER IF EXISTS source_documents_corpus_stats_insert ON source_documents;
+    CREATE TRIGGER source_documents_corpus_stats_insert
+    AFTER INSERT ON source_documents
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION corpus_stats_trigger();
+
+    DROP TRIGGER IF EXISTS source_documents_corpus_stats_update ON source_documents;
+    CREATE TRIGGER source_documents_corpus_stats_update
+    AFTER UPDATE ON source_documents
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION corpus_stats_trigger();
+
+    DROP TRIGGER IF EXISTS source_documents_corpus_stats_delete ON source_documents;
+    CREATE TRIGGER source_documents_corpus_stats_delete
+    AFTER DELETE ON source_documents
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION corpus_stats_trigger();
+
+    DROP TRIGGER IF EXISTS source_documents_corpus_stats_truncate ON source_documents;
+    CREATE TRIGGER source_documents_corpus_stats_truncate
+    AFTER TRUNCATE ON source_documents
+    FOR EACH STATEMENT EXECUTE FUNCTION corpus_stats_truncate();
+
+    DROP TRIGGER IF EXISTS chunks_corpus_stats_insert ON chunks;
+    CREATE TRIGGER chunks_corpus_stats_insert
+    AFTER INSERT ON chunks
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION corpus_stats_trigger();
+
+    DROP TRIGGER IF EXISTS chunks_corpus_stats_update ON chunks;
+    CREATE TRIGGER chunks_corpus_stats_update
+    AFTER UPDATE ON chunks
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION corpus_stats_trigger();
+
+    DROP TRIGGER IF EXISTS chunks_corpus_stats_delete ON chunks;
+    CREATE TRIGGER chunks_corpus_stats_delete
+    AFTER DELETE ON chunks
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION corpus_stats_trigger();
+
+    DROP TRIGGER IF EXISTS chunks_corpus_stats_truncate ON chunks;
+    CREATE TRIGGER chunks_corpus_stats_truncate
+    AFTER TRUNCATE ON chunks
+    FOR EACH STATEMENT EXECUTE FUNCTION corpus_stats_truncate();
 
-print("\n4. Creating search function...", flush=True)
+    SELECT refresh_corpus_stats();
+""")
+print("   ✓ corpus_stats table, triggers and backfill created")
+
+print("\n6. Creating search functions...", flush=True)
 cursor.execute("""
+    -- Nearest-neighbour search that can use the vector index: candidates are ordered by the
+    -- raw distance under LIMIT (an index scan), the similarity threshold is applied afterwards.
+    -- ef_search (HNSW) and probes (IVFFlat) trade recall for latency per call; NULL keeps the
+    -- server default. They are set transaction-locally, so with autocommit they only affect this call.
+    -- Document fields and source links are joined onto the candidates in the same query.
+    -- With a compact vector index (search_settings) the search goes through
+    -- match_documents_filtered, which re-ranks the compact candidates.
+    DROP FUNCTION IF EXISTS match_documents_ann(vector, FLOAT, INT, INT, INT);
+    CREATE OR REPLACE FUNCTION match_documents_ann(
+        query_embedding vector(1536),
+        match_threshold FLOAT DEFAULT 0.5,
+        match_count INT DEFAULT 10,
+        ef_search INT DEFAULT NULL,
+        probes INT DEFAULT NULL
+    )
+    RETURNS TABLE(
+        id UUID,
+        filename TEXT,
+        file_type TEXT,
+        content TEXT,
+        chunk_index INTEGER,
+        similarity FLOAT,
+        source_url TEXT,
+        language TEXT,
+        metadata JSONB
+    )
+    LANGUAGE plpgsql
+    AS $$
+    BEGIN
+        IF COALESCE((SELECT vector_storage FROM search_settings), 'full') <> 'full' THEN
+            RETURN QUERY
+            SELECT * FROM match_documents_filtered(
+                query_embedding, match_threshold, match_count,
+                ef_search => ef_search, probes => probes
+            );
+            RETURN;
+        END IF;
+
+        IF ef_search IS NOT NULL THEN
+            PERFORM set_config('hnsw.ef_search', ef_search::text, true);
+        END IF;
+        IF probes IS NOT NULL THEN
+            PERFORM set_config('ivfflat.probes', probes::text, true);
+        END IF;
+
+        RETURN QUERY
+        SELECT
+            candidates.id,
+            source_documents.filename,
+            source_documents.file_type,
+            candidates.content,
+            candidates.chunk_index,
+            1 - candidates.distance AS similarity,
+            COALESCE(sources.source_url, source_documents.metadata->>'source_url') AS source_url,
+            sources.language,
+            source_documents.metadata
+        FROM (
+            SELECT
+                chunks.id,
+                chunks.document_id,
+                chunks.content,
+                chunks.chunk_index,
+                chunks.embedding <=> query_embedding AS distance
+            FROM chunks
+            ORDER BY chunks.embedding <=> query_embedding
+            LIMIT match_count
+        ) candidates
+        JOIN source_documents ON source_documents.id = candidates.document_id
+        LEFT JOIN sources ON sources.filename = source_documents.filename
+        WHERE 1 - candidates.distance > match_threshold
+        ORDER BY candidates.distance;
+    END;
+    $$;
+
+    -- Search documents by semantic similarity (same results, now index-backed)
     CREATE OR REPLACE FUNCTION match_documents(
         query_embedding vector(1536),
         match_threshold FLOAT DEFAULT 0.5,
@@ -68,25 +426,283 @@ cursor.execute("""
         chunk_index INTEGER,
         similarity FLOAT
     )
+    LANGUAGE sql
+    AS $$
+        SELECT ann.id, ann.filename, ann.file_type, ann.content, ann.chunk_index, ann.similarity
+        FROM match_documents_ann(query_embedding, match_threshold, match_count) ann;
+    $$;
+""")
+cursor.execute("""
+    -- Vector search restricted by file_type and/or metadata filters (NULL = no filter).
+    -- The candidate query is built per call so the planner sees the actual filter values: selective
+    -- filters are ranked exactly over the chunks of the documents found through the file_type /
+    -- metadata indexes on source_documents, broad
+    -- filters use the vector index (with iterative index scans on pgvector >= 0.8). If the vector
+    -- index runs out of candidates before match_count rows pass the filter, the filtered rows are
+    -- ranked exactly instead, so a filter that matches rows never returns an empty result.
+    -- With a compact vector index (search_settings) rerank_count candidates are fetched in the
+    -- compact ordering and re-ranked by the full-precision distance before match_count is applied.
+    DROP FUNCTION IF EXISTS match_documents_filtered(vector, FLOAT, INT, TEXT, TEXT, TEXT, TEXT, TEXT, INT, INT);
+    CREATE OR REPLACE FUNCTION match_documents_filtered(
+        query_embedding vector(1536),
+        match_threshold FLOAT DEFAULT 0.5,
+        match_count INT DEFAULT 10,
+        filter_file_type TEXT DEFAULT NULL,
+        filter_company TEXT DEFAULT NULL,
+        filter_metric TEXT DEFAULT NULL,
+        filter_year TEXT DEFAULT NULL,
+        filter_source_type TEXT DEFAULT NULL,
+        ef_search INT DEFAULT NULL,
+        probes INT DEFAULT NULL
+    )
+    RETURNS TABLE(
+        id UUID,
+        filename TEXT,
+        file_type TEXT,
+        content TEXT,
+        chunk_index INTEGER,
+        similarity FLOAT,
+        source_url TEXT,
+        language TEXT,
+        metadata JSONB
+    )
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        metadata_filter JSONB := jsonb_strip_nulls(jsonb_build_object(
+            'company', filter_company,
+            'metric', filter_metric,
+            'year', filter_year,
+            'source_type', filter_source_type
+        ));
+        filtered BOOLEAN := filter_file_type IS NOT NULL OR metadata_filter <> '{}'::jsonb;
+        storage TEXT := 'full';
+        candidate_count INT := match_count;
+        candidate_sql TEXT;
+        candidate_ids UUID[];
+        candidate_distances FLOAT[];
+        index_scan TEXT;
+    BEGIN
+        SELECT search_settings.vector_storage, GREATEST(search_settings.rerank_count, match_count)
+        INTO storage, candidate_count
+        FROM search_settings;
+        IF storage IS NULL OR storage = 'full' THEN
+            storage := 'full';
+            candidate_count := match_count;
+        END IF;
+
+        IF ef_search IS NOT NULL THEN
+            PERFORM set_config('hnsw.ef_search', ef_search::text, true);
+        END IF;
+        -- An HNSW scan returns at most ef_search rows
+        IF storage <> 'full' AND COALESCE(current_setting('hnsw.ef_search', true), '40')::int < candidate_count THEN
+            PERFORM set_config('hnsw.ef_search', LEAST(candidate_count, 1000)::text, true);
+        END IF;
+        IF probes IS NOT NULL THEN
+            PERFORM set_config('ivfflat.probes', probes::text, true);
+        END IF;
+        IF filtered AND current_setting('hnsw.iterative_scan', true) IS NOT NULL THEN
+            PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+            PERFORM set_config('ivfflat.iterative_scan', 'relaxed_order', true);
+        END IF;
+
+        -- %s is the ORDER BY expression: the one the vector index serves, or the exact distance
+        candidate_sql := 'SELECT array_agg(c.id ORDER BY c.distance), array_agg(c.distance ORDER BY c.distance) '
+            || 'FROM (SELECT r.id, r.distance FROM (SELECT chunks.id, chunks.embedding <=> $1 AS distance FROM chunks'
+            || CASE WHEN filtered THEN ' JOIN source_documents ON source_documents.id = chunks.document_id' ELSE '' END
+            || ' WHERE TRUE'
+            || CASE WHEN filter_file_type IS NOT NULL THEN ' AND source_documents.file_type = $2' ELSE '' END
+            || CASE WHEN metadata_filter <> '{}'::jsonb THEN ' AND source_documents.metadata @> $3' ELSE '' END
+            || ' ORDER BY %s LIMIT $5) r ORDER BY r.distance LIMIT $4) c';
+
+        EXECUTE format(candidate_sql, vector_order_expression(storage))
+            INTO candidate_ids, candidate_distances
+            USING query_embedding, filter_file_type, metadata_filter, match_count, candidate_count;
+
+        IF filtered AND COALESCE(cardinality(candidate_ids), 0) < match_count THEN
+            index_scan := current_setting('enable_indexscan');
+            PERFORM set_config('enable_indexscan', 'off', true);
+            EXECUTE format(candidate_sql, vector_order_expression('full'))
+                INTO candidate_ids, candidate_distances
+                USING query_embedding, filter_file_type, metadata_filter, match_count, match_count;
+            PERFORM set_config('enable_indexscan', index_scan, true);
+        END IF;
+
+        RETURN QUERY
+        SELECT
+            chunks.id,
+            source_documents.filename,
+            source_documents.file_type,
+            chunks.content,
+            chunks.chunk_index,
+            1 - candidates.distance AS similarity,
+            COALESCE(sources.source_url, source_documents.metadata->>'source_url') AS source_url,
+            sources.language,
+            source_documents.metadata
+        FROM unnest(candidate_ids, candidate_distances) WITH ORDINALITY AS candidates(doc_id, distance, position)
+        JOIN chunks ON chunks.id = candidates.doc_id
+        JOIN source_documents ON source_documents.id = chunks.document_id
+        LEFT JOIN sources ON sources.filename = source_documents.filename
+        WHERE 1 - candidates.distance > match_threshold
+        ORDER BY candidates.position;
+    END;
+    $$;
+
+    -- Any-word full-text query for a question in English, Dutch or Spanish
+    CREATE OR REPLACE FUNCTION multilingual_tsquery(query_text TEXT)
+    RETURNS tsquery
+    LANGUAGE sql
+    IMMUTABLE
+    AS $$
+        SELECT replace(plainto_tsquery('english', query_text)::text, ' & ', ' | ')::tsquery ||
+               replace(plainto_tsquery('dutch', query_text)::text, ' & ', ' | ')::tsquery ||
+               replace(plainto_tsquery('spanish', query_text)::text, ' & ', ' | ')::tsquery;
+    $$;
+
+    -- Full-text search on its own: ts_rank_cd over the GIN index, with the same filters as
+    -- match_documents_filtered. match_documents_hybrid fuses it with the vector ranking; the
+    -- async query path (query_service.py) runs it while the query embedding is being created.
+    CREATE OR REPLACE FUNCTION match_documents_lexical(
+        query_text TEXT,
+        match_count INT DEFAULT 50,
+        filter_file_type TEXT DEFAULT NULL,
+        filter_company TEXT DEFAULT NULL,
+        filter_metric TEXT DEFAULT NULL,
+        filter_year TEXT DEFAULT NULL,
+        filter_source_type TEXT DEFAULT NULL
+    )
+    RETURNS TABLE(
+        id UUID,
+        filename TEXT,
+        file_type TEXT,
+        content TEXT,
+        chunk_index INTEGER,
+        text_rank FLOAT,
+        source_url TEXT,
+        language TEXT,
+        metadata JSONB
+    )
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        text_query tsquery := multilingual_tsquery(query_text);
+        metadata_filter JSONB := jsonb_strip_nulls(jsonb_build_object(
+            'company', filter_company,
+            'metric', filter_metric,
+            'year', filter_year,
+            'source_type', filter_source_type
+        ));
+    BEGIN
+        RETURN QUERY
+        SELECT
+            chunks.id,
+            source_documents.filename,
+            source_documents.file_type,
+            chunks.content,
+            chunks.chunk_index,
+            matches.lexical_rank AS text_rank,
+            COALESCE(sources.source_url, source_documents.metadata->>'source_url') AS source_url,
+            sources.language,
+            source_documents.metadata
+        FROM (
+            SELECT chunks.id AS chunk_id, ts_rank_cd(chunks.content_tsv, text_query)::FLOAT AS lexical_rank
+            FROM chunks
+            JOIN source_documents ON source_documents.id = chunks.document_id
+            WHERE chunks.content_tsv @@ text_query
+              AND (filter_file_type IS NULL OR source_documents.file_type = filter_file_type)
+              AND (metadata_filter = '{}'::jsonb OR source_documents.metadata @> metadata_filter)
+            ORDER BY lexical_rank DESC, chunks.id
+            LIMIT match_count
+        ) matches
+        JOIN chunks ON chunks.id = matches.chunk_id
+        JOIN source_documents ON source_documents.id = chunks.document_id
+        LEFT JOIN sources ON sources.filename = source_documents.filename
+        ORDER BY matches.lexical_rank DESC, chunks.id;
+    END;
+    $$;
+
+    -- Hybrid search: fuses the vector ranking (match_documents_filtered, threshold applies to it)
+    -- and the full-text ranking (match_documents_lexical) with reciprocal rank fusion.
+    -- Exact terms such as company names, "Rule of 40" or episode numbers are found through
+    -- the lexical side even when their similarity is below the threshold.
+    DROP FUNCTION IF EXISTS match_documents_hybrid(vector, TEXT, FLOAT, INT, INT, INT, INT, INT);
+    DROP FUNCTION IF EXISTS match_documents_hybrid(vector, TEXT, FLOAT, INT, INT, INT, INT, INT, TEXT, TEXT, TEXT, TEXT, TEXT);
+    CREATE OR REPLACE FUNCTION match_documents_hybrid(
+        query_embedding vector(1536),
+        query_text TEXT,
+        match_threshold FLOAT DEFAULT 0.5,
+        match_count INT DEFAULT 10,
+        candidate_count INT DEFAULT 50,
+        rrf_k INT DEFAULT 60,
+        ef_search INT DEFAULT NULL,
+        probes INT DEFAULT NULL,
+        filter_file_type TEXT DEFAULT NULL,
+        filter_company TEXT DEFAULT NULL,
+        filter_metric TEXT DEFAULT NULL,
+        filter_year TEXT DEFAULT NULL,
+        filter_source_type TEXT DEFAULT NULL
+    )
+    RETURNS TABLE(
+        id UUID,
+        filename TEXT,
+        file_type TEXT,
+        content TEXT,
+        chunk_index INTEGER,
+        similarity FLOAT,
+        rrf_score FLOAT,
+        source_url TEXT,
+        language TEXT,
+        metadata JSONB
+    )
     LANGUAGE plpgsql
     AS $$
     BEGIN
         RETURN QUERY
+        WITH semantic AS (
+            SELECT ann.id AS doc_id, row_number() OVER (ORDER BY ann.similarity DESC) AS position
+            FROM match_documents_filtered(
+                query_embedding, match_threshold, candidate_count,
+                filter_file_type, filter_company, filter_metric, filter_year, filter_source_type,
+                ef_search, probes
+            ) ann
+        ),
+        lexical AS (
+            SELECT matches.id AS doc_id, row_number() OVER (ORDER BY matches.text_rank DESC, matches.id) AS position
+            FROM match_documents_lexical(
+                query_text, candidate_count,
+                filter_file_type, filter_company, filter_metric, filter_year, filter_source_type
+            ) matches
+        ),
+        fused AS (
+            SELECT
+                COALESCE(semantic.doc_id, lexical.doc_id) AS doc_id,
+                (COALESCE(1.0 / (rrf_k + semantic.position), 0) +
+                 COALESCE(1.0 / (rrf_k + lexical.position), 0))::FLOAT AS score
+            FROM semantic
+            FULL OUTER JOIN lexical ON semantic.doc_id = lexical.doc_id
+            ORDER BY score DESC
+            LIMIT match_count
+        )
         SELECT
-            documents.id,
-            documents.filename,
-            documents.file_type,
-            documents.content,
-            documents.chunk_index,
-            1 - (documents.embedding <=> query_embedding) AS similarity
-        FROM documents
-        WHERE 1 - (documents.embedding <=> query_embedding) > match_threshold
-        ORDER BY documents.embedding <=> query_embedding
-        LIMIT match_count;
+            chunks.id,
+            source_documents.filename,
+            source_documents.file_type,
+            chunks.content,
+            chunks.chunk_index,
+            1 - (chunks.embedding <=> query_embedding) AS similarity,
+            fused.score AS rrf_score,
+            COALESCE(sources.source_url, source_documents.metadata->>'source_url') AS source_url,
+            sources.language,
+            source_documents.metadata
+        FROM fused
+        JOIN chunks ON chunks.id = fused.doc_id
+        JOIN source_documents ON source_documents.id = chunks.document_id
+        LEFT JOIN sources ON sources.filename = source_documents.filename
+        ORDER BY fused.score DESC;
     END;
     $$;
 """)
-print("   ✓ match_documents() function created")
+print("   ✓ match_documents_ann(), match_documents(), match_documents_filtered(), match_documents_lexical() and match_documents_hybrid() functions created")
 
 cursor.close()
 conn.close()
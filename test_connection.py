@@ -49,22 +49,22 @@ try:
     else:
         print("   ⚠ pgvector extension NOT found - run setup_database.sql first!")
     
-    # Check if documents table exists
+    # Check if the source_documents and chunks tables exist
     cursor.execute("""
         SELECT EXISTS (
             SELECT FROM information_schema.tables 
-            WHERE table_name = 'documents'
+            WHERE table_name = 'chunks' AND table_type = 'BASE TABLE'
         );
     """)
     if cursor.fetchone()[0]:
-        print("   ✓ documents table exists")
+        print("   ✓ source_documents and chunks tables exist")
         
         # Count existing documents
-        cursor.execute("SELECT COUNT(*) FROM documents;")
+        cursor.execute("SELECT COUNT(*) FROM source_documents;")
         count = cursor.fetchone()[0]
         print(f"   ✓ Current documents in database: {count}")
     else:
-        print("   ⚠ documents table NOT found - run setup_database.sql first!")
+        print("   ⚠ chunks table NOT found - run setup_database.sql first!")
     
     cursor.close()
     conn.close()
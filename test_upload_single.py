@@ -50,31 +50,38 @@ cursor = conn.cursor()
 
 cursor.execute(
     """
-    INSERT INTO documents 
-    (filename, file_type, content, chunk_index, total_chunks, embedding, metadata)
-    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    INSERT INTO source_documents 
+    (filename, file_type, total_chunks, metadata)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (filename) DO UPDATE SET updated_at = NOW()
     RETURNING id
     """,
     (
         test_file.name,
         "txt",
-        test_chunk,
-        0,
         1,
-        embedding,
         Json({"test": True, "file_size": test_file.stat().st_size})
     )
 )
+cursor.execute(
+    """
+    INSERT INTO chunks 
+    (document_id, chunk_index, content, embedding)
+    VALUES (%s, %s, %s, %s::vector)
+    RETURNING id
+    """,
+    (cursor.fetchone()[0], 0, test_chunk, str(embedding))
+)
 
 doc_id = cursor.fetchone()[0]
 conn.commit()
 print(f"   ✓ Inserted! Document ID: {doc_id}")
 
 # Verify
-cursor.execute("SELECT COUNT(*) FROM documents")
+cursor.execute("SELECT COUNT(*) FROM chunks")
 count = cursor.fetchone()[0]
 print(f"\n4. Verification:")
-print(f"   ✓ Total documents in database: {count}")
+print(f"   ✓ Total chunks in database: {count}")
 
 cursor.close()
 conn.close()
@@ -10,19 +10,28 @@ load_dotenv()
 SUPABASE_DB_URL = os.getenv("SUPABASE_DB_URL")
 
 def update_document_url(filename: str, new_url: str):
-    """Update the source_url for all chunks of a specific document"""
+    """Update the source_url of a specific document"""
     conn = psycopg2.connect(SUPABASE_DB_URL)
     cursor = conn.cursor()
     
     try:
-        # Update source_url in metadata for all chunks of this document
+        # Update source_url in the document metadata
         cursor.execute("""
-            UPDATE documents 
-            SET metadata = jsonb_set(metadata, '{source_url}', %s::jsonb)
+            UPDATE source_documents 
+            SET metadata = jsonb_set(metadata, '{source_url}', %s::jsonb), updated_at = NOW()
             WHERE filename = %s
+            RETURNING total_chunks
         """, (f'"{new_url}"', filename))
+        row = cursor.fetchone()
         
-        updated_count = cursor.rowcount
+        updated_count = row[0] if row else 0
+        
+        # The search functions read the link from the sources table
+        cursor.execute("""
+            INSERT INTO sources (filename, source_url)
+            VALUES (%s, %s)
+            ON CONFLICT (filename) DO UPDATE SET source_url = EXCLUDED.source_url, updated_at = NOW()
+        """, (filename, new_url))
         conn.commit()
         
         print(f"✅ Updated {updated_count} chunks for '{filename}'")
@@ -5,16 +5,19 @@ Uploads TXT and PDF files, creates embeddings using OpenAI, and stores them in S
 
 import os
 import sys
+import argparse
+from functools import partial
 from pathlib import Path
 from typing import List, Dict, Optional
 import psycopg2
-from psycopg2.extras import execute_values
 from openai import OpenAI
 from dotenv import load_dotenv
-import PyPDF2
-import hashlib
-import time
-from tenacity import retry, stop_after_attempt, wait_exponential
+from embedding_batcher import create_embeddings
+from embedding_cache import get_cache
+import ingest_pipeline
+from ingest_pipeline import PreparedDocument, run_pipeline
+from document_store import DocumentWriter
+import document_store
 
 # Load environment variables
 load_dotenv()
@@ -29,11 +32,20 @@ EMBEDDING_DIMENSIONS = 1536
 CHUNK_SIZE = 1000  # characters per chunk
 CHUNK_OVERLAP = 200  # overlap between chunks for context
 
+# Pipeline settings (workers per stage)
+READ_WORKERS = ingest_pipeline.READ_WORKERS  # processes reading/chunking files
+EMBED_WORKERS = ingest_pipeline.EMBED_WORKERS  # threads sending embedding requests
+QUEUE_SIZE = ingest_pipeline.QUEUE_SIZE  # documents buffered between stages
+
+# Database write settings
+FLUSH_SIZE = document_store.FLUSH_SIZE  # rows per bulk insert
+WRITE_METHOD = "values"  # "values" (execute_values) or "copy" (COPY FROM STDIN)
+
 
 class DocumentUploader:
     """Handles uploading documents to Supabase with vector embeddings"""
 
-    def __init__(self):
+    def __init__(self, flush_size: int = FLUSH_SIZE, write_method: str = WRITE_METHOD):
         """Initialize the uploader with OpenAI and Supabase connections"""
         if not OPENAI_API_KEY:
             raise ValueError("OPENAI_API_KEY not found in environment variables")
@@ -41,8 +53,11 @@ class DocumentUploader:
             raise ValueError("SUPABASE_DB_URL not found in environment variables")
 
         self.openai_client = OpenAI(api_key=OPENAI_API_KEY)
+        self.embedding_cache = get_cache()
         self.db_conn = None
         self._connect_to_database()
+        self.writer = DocumentWriter(self.db_conn, flush_size=flush_size, method=write_method)
+        self.pending_files = {}  # filename -> rows waiting in the write buffer
 
     def _connect_to_database(self):
         """Establish connection to Supabase database"""
@@ -55,151 +70,117 @@ class DocumentUploader:
 
     def read_txt_file(self, file_path: Path) -> str:
         """Read content from a TXT file"""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        except UnicodeDecodeError:
-            # Try with different encoding
-            with open(file_path, 'r', encoding='latin-1') as f:
-                return f.read()
+        return ingest_pipeline.read_txt_file(file_path)
 
     def read_pdf_file(self, file_path: Path) -> str:
         """Read content from a PDF file"""
-        text = ""
-        with open(file_path, 'rb') as f:
-            pdf_reader = PyPDF2.PdfReader(f)
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-        return text
+        return ingest_pipeline.read_pdf_file(file_path)
 
     def chunk_text(self, text: str, chunk_size: int = CHUNK_SIZE, 
                    overlap: int = CHUNK_OVERLAP) -> List[str]:
         """Split text into overlapping chunks"""
-        chunks = []
-        start = 0
-        text_length = len(text)
+        return ingest_pipeline.chunk_text(text, chunk_size, overlap)
+
+    def create_embeddings(self, texts: List[str], label: str = "") -> List[Optional[List[float]]]:
+        """Create embeddings for many chunks in batched requests (None for failed batches)"""
+        def progress(done, total):
+            print(f"   [{done}/{total}] embeddings created {label}".rstrip(), flush=True)
+
+        return create_embeddings(
+            self.openai_client,
+            texts,
+            model=EMBEDDING_MODEL,
+            dimensions=EMBEDDING_DIMENSIONS,
+            raise_on_error=False,
+            progress=progress,
+            cache=self.embedding_cache
+        )
 
-        while start < text_length:
-            end = start + chunk_size
-            chunk = text[start:end]
-            
-            # Try to break at sentence or word boundary if not at end
-            if end < text_length:
-                # Look for sentence end
-                last_period = chunk.rfind('. ')
-                last_newline = chunk.rfind('\n')
-                last_break = max(last_period, last_newline)
-                
-                if last_break > chunk_size * 0.5:  # Only break if we're past halfway
-                    chunk = chunk[:last_break + 1]
-                    end = start + last_break + 1
-
-            chunks.append(chunk.strip())
-            start = end - overlap
-
-        return [c for c in chunks if c]  # Remove empty chunks
-
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=4, max=10),
-        reraise=True
-    )
     def create_embedding(self, text: str) -> List[float]:
-        """Create embedding for text using OpenAI with retry logic"""
-        try:
-            response = self.openai_client.embeddings.create(
-                model=EMBEDDING_MODEL,
-                input=text,
-                dimensions=EMBEDDING_DIMENSIONS
-            )
-            time.sleep(0.1)  # Small delay to avoid rate limiting
-            return response.data[0].embedding
-        except Exception as e:
-            print(f"✗ Failed to create embedding (retrying...): {e}", flush=True)
-            raise
-
-    def upload_document(self, file_path: Path) -> int:
-        """Upload a single document to Supabase"""
+        """Create embedding for a single text using OpenAI with retry logic"""
+        return create_embeddings(
+            self.openai_client,
+            [text],
+            model=EMBEDDING_MODEL,
+            dimensions=EMBEDDING_DIMENSIONS,
+            cache=self.embedding_cache
+        )[0]
+
+    def prepare_document(self, file_path: Path) -> PreparedDocument:
+        """Read and chunk a single file"""
+        return ingest_pipeline.prepare_document(file_path, CHUNK_SIZE, CHUNK_OVERLAP)
+
+    def embed_document(self, doc: PreparedDocument) -> List[Optional[List[float]]]:
+        """Create embeddings for all chunks of a prepared document"""
+        return self.create_embeddings(doc.chunks, label=f"({doc.file_path.name})")
+
+    def write_document(self, doc: PreparedDocument,
+                       embeddings: Optional[List[Optional[List[float]]]]) -> int:
+        """Queue the embedded chunks of a prepared document for the next bulk insert"""
         print(f"\n{'='*60}", flush=True)
-        print(f"📄 Processing: {file_path.name}", flush=True)
+        print(f"📄 Processing: {doc.file_path.name}", flush=True)
         print(f"{'='*60}", flush=True)
 
-        # Read file content
-        file_extension = file_path.suffix.lower()
-        try:
-            print(f"   Reading {file_extension} file...", flush=True)
-            if file_extension == '.txt':
-                content = self.read_txt_file(file_path)
-            elif file_extension == '.pdf':
-                content = self.read_pdf_file(file_path)
-            else:
-                print(f"✗ Unsupported file type: {file_extension}", flush=True)
-                return 0
-            print(f"   ✓ Read {len(content)} characters", flush=True)
-        except Exception as e:
-            print(f"✗ Failed to read file: {e}", flush=True)
+        if doc.error:
+            print(f"✗ {doc.error}", flush=True)
             return 0
 
-        if not content.strip():
-            print(f"✗ File is empty or could not extract content", flush=True)
-            return 0
+        print(f"   ✓ Read {doc.content_length} characters", flush=True)
+        print(f"   ✓ Split into {len(doc.chunks)} chunks", flush=True)
 
-        # Chunk the content
-        print(f"   Chunking text...", flush=True)
-        chunks = self.chunk_text(content)
-        print(f"   ✓ Split into {len(chunks)} chunks", flush=True)
+        # Collect the embedded chunks, then queue them together for the next bulk insert, so a
+        # failing document leaves no rows behind in the write buffer
+        rows = []
+        for idx, (chunk, embedding) in enumerate(zip(doc.chunks, embeddings)):
+            if embedding is None:
+                print(f"   ✗ Skipping chunk {idx}: no embedding", flush=True)
+                continue
+            rows.append((idx, chunk, embedding))
 
-        # Process each chunk
-        uploaded_count = 0
-        cursor = self.db_conn.cursor()
+        metadata = {
+            "original_filename": doc.file_path.name,
+            "file_size": doc.file_size,
+            "file_hash": doc.file_hash
+        }
+        self.writer.add_document(doc.file_path.name, doc.file_type, len(doc.chunks), rows, metadata)
+        queued = len(rows)
 
-        print(f"\n   Uploading chunks to Supabase:", flush=True)
-        for idx, chunk in enumerate(chunks):
-            try:
-                # Progress indicator
-                print(f"   [{idx+1}/{len(chunks)}] Creating embedding...", end=' ', flush=True)
-                embedding = self.create_embedding(chunk)
-                print(f"✓ Uploading...", end=' ', flush=True)
-
-                # Prepare metadata
-                metadata = {
-                    "original_filename": file_path.name,
-                    "file_size": file_path.stat().st_size,
-                    "chunk_size": len(chunk),
-                    "file_hash": hashlib.md5(content.encode()).hexdigest()
-                }
-
-                # Insert into database
-                cursor.execute(
-                    """
-                    INSERT INTO documents 
-                    (filename, file_type, content, chunk_index, total_chunks, embedding, metadata)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    """,
-                    (
-                        file_path.name,
-                        file_extension[1:],  # Remove the dot
-                        chunk,
-                        idx,
-                        len(chunks),
-                        embedding,
-                        psycopg2.extras.Json(metadata)
-                    )
-                )
-                uploaded_count += 1
-                print(f"✓", flush=True)
+        self.pending_files[doc.file_path.name] = queued
+        print(f"   ✓ Queued {queued}/{len(doc.chunks)} chunks for upload", flush=True)
+        return queued
 
-            except Exception as e:
-                print(f"\n   ✗ Failed to upload chunk {idx}: {e}", flush=True)
-                continue
+    def flush(self) -> Dict[str, int]:
+        """Bulk insert all queued rows and commit, returns rows written per file"""
+        try:
+            written = self.writer.flush()
+            self.db_conn.commit()
+        except Exception:
+            self.db_conn.rollback()
+            self.pending_files = {}
+            raise
 
-        self.db_conn.commit()
-        cursor.close()
-        print(f"\n   ✅ Successfully uploaded {uploaded_count}/{len(chunks)} chunks!", flush=True)
-        return uploaded_count
+        flushed, self.pending_files = self.pending_files, {}
+        if written:
+            print(f"\n   ✅ Uploaded {written} chunks from {len(flushed)} files to Supabase", flush=True)
+        return flushed
 
-    def upload_directory(self, directory_path: str) -> Dict[str, int]:
-        """Upload all TXT and PDF files from a directory"""
+    def upload_document(self, file_path: Path) -> int:
+        """Upload a single document to Supabase"""
+        doc = self.prepare_document(file_path)
+        embeddings = self.embed_document(doc) if not doc.error else None
+        self.write_document(doc, embeddings)
+        return self.flush().get(doc.file_path.name, 0)
+
+    def upload_directory(self, directory_path: str,
+                         read_workers: int = READ_WORKERS,
+                         embed_workers: int = EMBED_WORKERS,
+                         queue_size: int = QUEUE_SIZE) -> Dict[str, int]:
+        """
+        Upload all TXT and PDF files from a directory.
+
+        Reading/chunking, embedding and inserting run as overlapping pipeline
+        stages; see ingest_pipeline.run_pipeline for the concurrency model.
+        """
         dir_path = Path(directory_path)
         
         if not dir_path.exists():
@@ -209,43 +190,69 @@ class DocumentUploader:
             raise ValueError(f"Path is not a directory: {directory_path}")
 
         # Find all TXT and PDF files
-        files = list(dir_path.glob("*.txt")) + list(dir_path.glob("*.pdf"))
+        files = ingest_pipeline.find_documents(dir_path)
         
         if not files:
             print(f"✗ No TXT or PDF files found in {directory_path}")
-            return {"total_files": 0, "total_chunks": 0}
+            return {"total_files": 0, "successful_files": 0, "total_chunks": 0}
 
         print(f"\n{'='*60}")
         print(f"Found {len(files)} files to upload")
+        print(f"  Workers: {read_workers} read, {embed_workers} embed, 1 write")
         print(f"{'='*60}")
 
-        total_chunks = 0
-        successful_files = 0
+        totals = {"chunks": 0, "files": 0}
 
-        for file_path in files:
+        def flush():
             try:
-                chunks_uploaded = self.upload_document(file_path)
+                flushed = self.flush()
+            except Exception as e:
+                print(f"✗ Bulk insert failed: {e}", flush=True)
+                return
+            for chunks_uploaded in flushed.values():
                 if chunks_uploaded > 0:
-                    total_chunks += chunks_uploaded
-                    successful_files += 1
+                    totals["chunks"] += chunks_uploaded
+                    totals["files"] += 1
+
+        def write(doc, embeddings):
+            try:
+                self.write_document(doc, embeddings)
             except Exception as e:
-                print(f"✗ Error processing {file_path.name}: {e}")
-                continue
+                print(f"✗ Error processing {doc.file_path.name}: {e}")
+            if self.writer.pending >= self.writer.flush_size:
+                flush()
+
+        run_pipeline(
+            files,
+            prepare=partial(ingest_pipeline.prepare_document,
+                            chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP),
+            embed=self.embed_document,
+            write=write,
+            read_workers=read_workers,
+            embed_workers=embed_workers,
+            queue_size=queue_size
+        )
+        flush()
 
         print(f"\n{'='*60}")
         print(f"Upload Complete!")
-        print(f"  Successfully uploaded: {successful_files}/{len(files)} files")
-        print(f"  Total chunks created: {total_chunks}")
+        print(f"  Successfully uploaded: {totals['files']}/{len(files)} files")
+        print(f"  Total chunks created: {totals['chunks']}")
+        if self.embedding_cache:
+            stats = self.embedding_cache.stats()
+            print(f"  Embedding cache: {stats['hits']} hits, {stats['misses']} misses")
         print(f"{'='*60}\n")
 
         return {
             "total_files": len(files),
-            "successful_files": successful_files,
-            "total_chunks": total_chunks
+            "successful_files": totals["files"],
+            "total_chunks": totals["chunks"]
         }
 
     def close(self):
-        """Close database connection"""
+        """Flush queued rows and close database connection"""
+        if self.writer.pending:
+            self.flush()
         if self.db_conn:
             self.db_conn.close()
             print("✓ Database connection closed")
@@ -253,16 +260,31 @@ class DocumentUploader:
 
 def main():
     """Main entry point"""
-    if len(sys.argv) < 2:
-        print("Usage: python upload_documents.py <directory_path>")
-        print("\nExample: python upload_documents.py ./documents")
-        sys.exit(1)
-
-    directory_path = sys.argv[1]
+    parser = argparse.ArgumentParser(
+        description="Upload TXT and PDF files to Supabase with vector embeddings",
+        epilog="Example: python upload_documents.py ./documents"
+    )
+    parser.add_argument("directory_path", help="Directory with TXT/PDF files")
+    parser.add_argument("--read-workers", type=int, default=READ_WORKERS,
+                        help=f"Processes reading and chunking files (default: {READ_WORKERS}, 0 = in-process)")
+    parser.add_argument("--embed-workers", type=int, default=EMBED_WORKERS,
+                        help=f"Concurrent embedding requests (default: {EMBED_WORKERS})")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE,
+                        help=f"Documents buffered between stages (default: {QUEUE_SIZE})")
+    parser.add_argument("--flush-size", type=int, default=FLUSH_SIZE,
+                        help=f"Rows per bulk insert (default: {FLUSH_SIZE})")
+    parser.add_argument("--write-method", choices=["values", "copy"], default=WRITE_METHOD,
+                        help="Bulk insert with execute_values or COPY FROM STDIN")
+    args = parser.parse_args()
 
     try:
-        uploader = DocumentUploader()
-        results = uploader.upload_directory(directory_path)
+        uploader = DocumentUploader(flush_size=args.flush_size, write_method=args.write_method)
+        results = uploader.upload_directory(
+            args.directory_path,
+            read_workers=args.read_workers,
+            embed_workers=args.embed_workers,
+            queue_size=args.queue_size
+        )
         uploader.close()
         
         if results["successful_files"] == 0:
@@ -1,15 +1,22 @@
 """
 Upload KPI documents to Supabase database
+Incremental and non-interactive: documents are matched on their stable KPI ID (kpi_id in the
+metadata) and only documents whose content changed are re-embedded, see upload_kpi_documents.
+
+Usage:
+    python upload_kpi_to_supabase.py [kpi_documents.json] [--dry-run]
 """
 
+import argparse
 import json
 import psycopg2
-from psycopg2.extras import execute_values
-import openai
+from psycopg2.extras import Json, execute_values
 from openai import OpenAI
 import os
 from dotenv import load_dotenv
-from tqdm import tqdm
+from document_store import DocumentWriter, FLUSH_SIZE, chunk_hash
+from embedding_batcher import create_embeddings
+from embedding_cache import get_cache
 
 # Load environment variables
 load_dotenv()
@@ -21,16 +28,81 @@ def get_db_connection():
     """Get database connection"""
     return psycopg2.connect(os.getenv('SUPABASE_DB_URL'))
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = 1536
+KPI_FILE_TYPE = 'KPI_DASHBOARD'
+
 def get_embedding(text):
-    """Generate embedding for text using OpenAI"""
-    response = client.embeddings.create(
-        input=text,
-        model="text-embedding-3-small"
-    )
-    return response.data[0].embedding
+    """Generate embedding for text using OpenAI (served from the local cache when possible)"""
+    return create_embeddings(
+        client,
+        [text],
+        model=EMBEDDING_MODEL,
+        dimensions=EMBEDDING_DIMENSIONS,
+        cache=get_cache()
+    )[0]
+
+def load_stored_kpi_documents(cursor):
+    """Stored KPI documents: dicts with the row id, filename, kpi_id (None for documents uploaded
+    before there were IDs), metadata and the md5 of the content (None when a document does not
+    have exactly one chunk)"""
+    cursor.execute("""
+        SELECT d.id, d.filename, d.metadata->>'kpi_id', d.metadata,
+               array_agg(md5(c.content)) FILTER (WHERE c.id IS NOT NULL)
+        FROM source_documents d
+        LEFT JOIN chunks c ON c.document_id = d.id
+        WHERE d.file_type = %s
+        GROUP BY d.id
+    """, (KPI_FILE_TYPE,))
+    return [
+        {
+            'id': row_id,
+            'filename': filename,
+            'kpi_id': kpi_id,
+            'metadata': metadata or {},
+            'hash': hashes[0] if hashes and len(hashes) == 1 else None,
+        }
+        for row_id, filename, kpi_id, metadata, hashes in cursor.fetchall()
+    ]
+
+def plan_kpi_sync(documents, stored):
+    """
+    What to write for the generated documents, given the stored ones:
+    (new, changed, metadata-only updates, unchanged count, stale rows)
 
-def upload_kpi_documents(json_file='kpi_documents.json'):
-    """Upload KPI documents to Supabase"""
+    Documents are matched to stored rows by kpi_id, so a new filename is a metadata-only update
+    (a rename) instead of a delete and re-embed. Rows without a kpi_id are matched by filename
+    once, after which they carry the ID. changed and metadata-only updates are (document, row)
+    pairs.
+    """
+    by_id = {row['kpi_id']: row for row in stored if row['kpi_id']}
+    legacy = {row['filename']: row for row in stored if not row['kpi_id']}
+    new, changed, metadata_only, unchanged = [], [], [], 0
+    matched = set()
+    for doc in documents:
+        row = by_id.get(doc['id']) or legacy.get(doc['filename'])
+        if row is None:
+            new.append(doc)
+            continue
+        matched.add(row['id'])
+        if row['hash'] != chunk_hash(doc['content']):
+            changed.append((doc, row))
+        elif row['metadata'] != doc['metadata'] or row['filename'] != doc['filename']:
+            metadata_only.append((doc, row))
+        else:
+            unchanged += 1
+    stale = sorted((row for row in stored if row['id'] not in matched), key=lambda row: row['filename'])
+    return new, changed, metadata_only, unchanged, stale
+
+def upload_kpi_documents(json_file='kpi_documents.json', flush_size=FLUSH_SIZE, dry_run=False):
+    """
+    Sync the KPI documents in Supabase with json_file, without prompting.
+
+    Stored documents are matched by kpi_id. Only new documents and documents whose content hash
+    changed are embedded and written; documents with only new metadata or a new filename get
+    them updated in place, and KPI documents whose ID is no longer generated are deleted. Everything happens in one transaction, so the chat never
+    sees a half-updated KPI set.
+    """
     
     # Load documents
     print(f"Loading documents from {json_file}...")
@@ -38,104 +110,137 @@ def upload_kpi_documents(json_file='kpi_documents.json'):
         documents = json.load(f)
     
     print(f"✓ Loaded {len(documents)} documents")
+    for key in ('id', 'filename'):
+        duplicates = len(documents) - len({doc[key] for doc in documents})
+        if duplicates:
+            raise ValueError(f"{duplicates} duplicate {key}s in {json_file}")
     
     # Connect to database
     print("Connecting to Supabase...")
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Check if documents already exist
-    print("Checking for existing KPI documents...")
-    cursor.execute("""
-        SELECT COUNT(*) FROM documents 
-        WHERE filename LIKE 'KPI_Dashboard_%' 
-           OR filename LIKE 'Company_%KPI%'
-           OR filename LIKE 'Top_Performers_%'
-           OR filename LIKE 'ARR_Bucket_Analysis_%'
-    """)
-    existing_count = cursor.fetchone()[0]
-    
-    if existing_count > 0:
-        print(f"\n⚠ Found {existing_count} existing KPI documents in database")
-        response = input("Delete existing KPI documents and re-upload? (y/n): ")
-        
-        if response.lower() == 'y':
-            print("Deleting existing KPI documents...")
-            cursor.execute("""
-                DELETE FROM documents 
-                WHERE filename LIKE 'KPI_Dashboard_%' 
-                   OR filename LIKE 'Company_%'
-                   OR filename LIKE 'Top_Performers_%'
-                   OR filename LIKE 'ARR_Bucket_Analysis_%'
-            """)
-            conn.commit()
-            print(f"✓ Deleted {existing_count} existing documents")
-        else:
-            print("Skipping upload. Exiting...")
-            cursor.close()
-            conn.close()
-            return
-    
-    # Upload documents
-    print(f"\nUploading {len(documents)} documents to Supabase...")
-    
-    uploaded = 0
-    failed = 0
-    
-    for doc in tqdm(documents, desc="Uploading"):
-        try:
-            # Generate embedding
-            embedding = get_embedding(doc['content'])
-            
-            # Prepare metadata
-            metadata = json.dumps(doc['metadata'])
-            
-            # Insert into database
-            cursor.execute("""
-                INSERT INTO documents (filename, content, embedding, chunk_index, total_chunks, file_type, metadata)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (
-                doc['filename'],
-                doc['content'],
-                embedding,
-                0,  # Single chunk per document
-                1,  # Total chunks = 1
-                'KPI_DASHBOARD',
-                metadata
-            ))
-            
-            uploaded += 1
-            
-        except Exception as e:
-            print(f"\n✗ Failed to upload {doc['filename']}: {e}")
-            failed += 1
+    # Compare with what is stored (content hash per document)
+    print("Comparing with existing KPI documents...")
+    stored = load_stored_kpi_documents(cursor)
+    new, changed, metadata_only, unchanged, stale = plan_kpi_sync(documents, stored)
+    print(f"✓ {unchanged} unchanged, {len(new)} new, {len(changed)} changed, "
+          f"{len(metadata_only)} metadata only, {len(stale)} removed")
+    renamed = [(doc, row) for doc, row in changed + metadata_only if row['filename'] != doc['filename']]
+    for label, names in (("new", [doc['id'] for doc in new]),
+                         ("changed", [doc['id'] for doc, row in changed]),
+                         ("renamed", [f"{row['filename']} -> {doc['filename']}" for doc, row in renamed]),
+                         ("removed", [row['kpi_id'] or row['filename'] for row in stale])):
+        for name in names:
+            print(f"  {label}: {name}")
+    
+    if dry_run or not (new or changed or metadata_only or stale):
+        print("\nNothing written" + (" (dry run)" if dry_run else ", KPI documents are up to date"))
+        cursor.close()
+        conn.close()
+        return
+    
+    # Embed only the new and changed documents
+    to_embed = new + [doc for doc, row in changed]
+    print(f"\nEmbedding {len(to_embed)} documents...")
+    embeddings = create_embeddings(
+        client,
+        [doc['content'] for doc in to_embed],
+        model=EMBEDDING_MODEL,
+        dimensions=EMBEDDING_DIMENSIONS,
+        raise_on_error=False,
+        cache=get_cache()
+    )
+    failed = [doc['id'] for doc, embedding in zip(to_embed, embeddings) if embedding is None]
+    for doc_id in failed:
+        print(f"✗ Failed to embed {doc_id}")
+    
+    # Removed documents first, so their filenames are free for new and renamed ones (chunks cascade)
+    if stale:
+        cursor.execute(
+            "DELETE FROM source_documents WHERE file_type = %s AND id = ANY(%s)",
+            (KPI_FILE_TYPE, [row['id'] for row in stale])
+        )
+    
+    # Renames in two steps, so documents can swap filenames without violating the unique filename
+    for names in ([(row['id'], f"{KPI_FILE_TYPE}/renaming/{row['id']}") for doc, row in renamed],
+                  [(row['id'], doc['filename']) for doc, row in renamed]):
+        if names:
+            execute_values(
+                cursor,
+                "UPDATE source_documents AS d SET filename = v.filename FROM (VALUES %s) AS v(id, filename) "
+                "WHERE d.id = v.id",
+                names,
+                page_size=1000
+            )
+    
+    # Replace the chunk of changed documents (a document that failed to embed keeps its old one)
+    replaced = [row['id'] for (doc, row), embedding in zip(changed, embeddings[len(new):])
+                if embedding is not None]
+    if replaced:
+        cursor.execute("DELETE FROM chunks WHERE document_id = ANY(%s)", (replaced,))
+    
+    writer = DocumentWriter(conn, flush_size=flush_size)
+    for doc, embedding in zip(to_embed, embeddings):
+        if embedding is None:
             continue
+        writer.add(
+            doc['filename'],
+            KPI_FILE_TYPE,
+            doc['content'],
+            0,  # Single chunk per document
+            1,  # Total chunks = 1
+            embedding,
+            doc['metadata']
+        )
+        writer.flush_if_full()
+    writer.flush()
     
-    # Commit all changes
+    # The writer merges metadata into what is stored; KPI metadata of matched rows is replaced
+    # as a whole (new rows already have exactly theirs)
+    updated = [(doc, row) for (doc, row), embedding in zip(changed, embeddings[len(new):])
+               if embedding is not None] + metadata_only
+    if updated:
+        execute_values(
+            cursor,
+            """
+            UPDATE source_documents AS d
+            SET metadata = v.metadata::jsonb, updated_at = NOW()
+            FROM (VALUES %s) AS v(id, metadata)
+            WHERE d.id = v.id AND d.metadata IS DISTINCT FROM v.metadata::jsonb
+            """,
+            [(row['id'], Json(doc['metadata'])) for doc, row in updated],
+            page_size=1000
+        )
     conn.commit()
     
     # Print statistics
     print(f"\n{'='*50}")
     print(f"Upload Complete!")
     print(f"{'='*50}")
-    print(f"✓ Successfully uploaded: {uploaded}")
-    if failed > 0:
-        print(f"✗ Failed: {failed}")
+    print(f"✓ Embedded and written: {writer.written}")
+    print(f"✓ Metadata updated: {len(metadata_only)}")
+    print(f"✓ Renamed: {len(renamed)}")
+    print(f"✓ Removed: {len(stale)}")
+    if failed:
+        print(f"✗ Failed: {len(failed)} (run again to retry)")
     
     # Get final count
-    cursor.execute("""
-        SELECT COUNT(*) FROM documents 
-        WHERE file_type = 'KPI_DASHBOARD'
-    """)
+    cursor.execute("SELECT COUNT(*) FROM source_documents WHERE file_type = %s", (KPI_FILE_TYPE,))
     total_kpi = cursor.fetchone()[0]
     
-    cursor.execute("SELECT COUNT(*) FROM documents")
+    cursor.execute("SELECT chunks FROM corpus_stats")
     total_all = cursor.fetchone()[0]
     
     print(f"\nDatabase Statistics:")
     print(f"- Total KPI documents: {total_kpi}")
     print(f"- Total all documents: {total_all}")
     
+    cache = get_cache()
+    if cache:
+        stats = cache.stats()
+        print(f"- Embedding cache: {stats['hits']} hits, {stats['misses']} misses")
+    
     # Close connection
     cursor.close()
     conn.close()
@@ -143,10 +248,16 @@ def upload_kpi_documents(json_file='kpi_documents.json'):
     print("\n✓ Upload complete! KPI data is now searchable in the RAG system.")
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sync KPI documents (extract_kpi_data.py output) to Supabase")
+    parser.add_argument("json_file", nargs="?", default="kpi_documents.json")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only show which documents would be written or removed")
+    args = parser.parse_args()
+    
     try:
-        upload_kpi_documents()
+        upload_kpi_documents(args.json_file, dry_run=args.dry_run)
     except FileNotFoundError:
-        print("✗ Error: kpi_documents.json not found")
+        print(f"✗ Error: {args.json_file} not found")
         print("Run 'python extract_kpi_data.py' first to generate the documents")
     except Exception as e:
         print(f"✗ Error: {e}")
@@ -1,18 +1,21 @@
 """
 Robust uploader that skips already uploaded files
+With --sync it re-indexes incrementally based on content hashes instead of filenames
 """
 import os
-import sys
+import argparse
+from functools import partial
 from pathlib import Path
-from typing import List, Set
+from typing import Dict, List, Optional, Set
 import psycopg2
-from psycopg2.extras import Json
 from openai import OpenAI
 from dotenv import load_dotenv
-import PyPDF2
-import hashlib
-import time
-from tenacity import retry, stop_after_attempt, wait_exponential
+from embedding_batcher import create_embeddings
+from embedding_cache import get_cache
+import ingest_pipeline
+from ingest_pipeline import PreparedDocument, run_pipeline
+import document_store
+from document_store import DocumentWriter
 
 load_dotenv()
 
@@ -22,190 +25,359 @@ EMBEDDING_MODEL = "text-embedding-3-small"
 EMBEDDING_DIMENSIONS = 1536
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
+READ_WORKERS = ingest_pipeline.READ_WORKERS
+EMBED_WORKERS = ingest_pipeline.EMBED_WORKERS
+QUEUE_SIZE = ingest_pipeline.QUEUE_SIZE
+FLUSH_SIZE = document_store.FLUSH_SIZE
+CHUNKER = f"chars:{CHUNK_SIZE}:{CHUNK_OVERLAP}"  # recorded in the sync manifest
 
 
 class RobustUploader:
-    def __init__(self):
+    def __init__(self, flush_size: int = FLUSH_SIZE, write_method: str = "values"):
         self.openai_client = OpenAI(api_key=OPENAI_API_KEY)
+        self.embedding_cache = get_cache()
         self.db_conn = psycopg2.connect(SUPABASE_DB_URL)
+        self.writer = DocumentWriter(self.db_conn, flush_size=flush_size, method=write_method)
+        self.pending_files = {}
         self.uploaded_files = self._get_uploaded_files()
         print(f"✓ Connected - Found {len(self.uploaded_files)} already uploaded files")
 
     def _get_uploaded_files(self) -> Set[str]:
         """Get set of filenames already in database"""
         cursor = self.db_conn.cursor()
-        cursor.execute("SELECT DISTINCT filename FROM documents")
+        cursor.execute("SELECT filename FROM source_documents")
         files = {row[0] for row in cursor.fetchall()}
         cursor.close()
         return files
 
     def read_txt_file(self, file_path: Path) -> str:
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        except UnicodeDecodeError:
-            with open(file_path, 'r', encoding='latin-1') as f:
-                return f.read()
+        return ingest_pipeline.read_txt_file(file_path)
 
     def read_pdf_file(self, file_path: Path) -> str:
-        text = ""
-        with open(file_path, 'rb') as f:
-            pdf_reader = PyPDF2.PdfReader(f)
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-        return text
+        return ingest_pipeline.read_pdf_file(file_path)
 
     def chunk_text(self, text: str) -> List[str]:
-        chunks = []
-        start = 0
-        text_length = len(text)
-
-        while start < text_length:
-            end = start + CHUNK_SIZE
-            chunk = text[start:end]
-            
-            if end < text_length:
-                last_period = chunk.rfind('. ')
-                last_newline = chunk.rfind('\n')
-                last_break = max(last_period, last_newline)
-                
-                if last_break > CHUNK_SIZE * 0.5:
-                    chunk = chunk[:last_break + 1]
-                    end = start + last_break + 1
-
-            chunks.append(chunk.strip())
-            start = end - CHUNK_OVERLAP
-
-        return [c for c in chunks if c]
-
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=4, max=10))
-    def create_embedding(self, text: str) -> List[float]:
-        response = self.openai_client.embeddings.create(
+        return ingest_pipeline.chunk_text(text, CHUNK_SIZE, CHUNK_OVERLAP)
+
+    def create_embeddings(self, texts: List[str]) -> List[Optional[List[float]]]:
+        return create_embeddings(
+            self.openai_client,
+            texts,
             model=EMBEDDING_MODEL,
-            input=text,
-            dimensions=EMBEDDING_DIMENSIONS
+            dimensions=EMBEDDING_DIMENSIONS,
+            raise_on_error=False,
+            cache=self.embedding_cache
         )
-        time.sleep(0.1)
-        return response.data[0].embedding
 
-    def upload_document(self, file_path: Path) -> int:
-        # Skip if already uploaded
-        if file_path.name in self.uploaded_files:
-            print(f"⏭️  SKIP: {file_path.name} (already uploaded)", flush=True)
+    def create_embedding(self, text: str) -> List[float]:
+        return create_embeddings(
+            self.openai_client,
+            [text],
+            model=EMBEDDING_MODEL,
+            dimensions=EMBEDDING_DIMENSIONS,
+            cache=self.embedding_cache
+        )[0]
+
+    def embed_document(self, doc: PreparedDocument) -> List[Optional[List[float]]]:
+        return self.create_embeddings(doc.chunks)
+
+    def write_document(self, doc: PreparedDocument,
+                       embeddings: Optional[List[Optional[List[float]]]]) -> int:
+        print(f"\n📄 {doc.file_path.name}", flush=True)
+
+        if doc.error:
+            print(f"   ✗ {doc.error}", flush=True)
             return 0
 
-        print(f"\n📄 {file_path.name}", flush=True)
+        print(f"   📦 {len(doc.chunks)} chunks", flush=True)
+
+        # Queue the chunks together (all or none), they are written in bulk once the buffer is full
+        rows = [(idx, chunk, embedding)
+                for idx, (chunk, embedding) in enumerate(zip(doc.chunks, embeddings))
+                if embedding is not None]
+        self.writer.add_document(doc.file_path.name, doc.file_type, len(doc.chunks), rows,
+                                 {"file_size": doc.file_size})
+        queued = len(rows)
 
-        # Read file
-        file_extension = file_path.suffix.lower()
+        self.pending_files[doc.file_path.name] = queued
+        print(f"   ⏳ {queued}/{len(doc.chunks)} queued", flush=True)
+        return queued
+
+    def flush(self) -> Dict[str, int]:
+        """Bulk insert queued rows, commit and mark their files as uploaded"""
         try:
-            if file_extension == '.txt':
-                content = self.read_txt_file(file_path)
-            elif file_extension == '.pdf':
-                content = self.read_pdf_file(file_path)
-            else:
-                print(f"   ✗ Unsupported: {file_extension}", flush=True)
-                return 0
-        except Exception as e:
-            print(f"   ✗ Read error: {e}", flush=True)
-            return 0
+            written = self.writer.flush()
+            self.db_conn.commit()
+        except Exception:
+            self.db_conn.rollback()
+            self.pending_files = {}
+            raise
+
+        flushed, self.pending_files = self.pending_files, {}
+        self.uploaded_files.update(flushed)
+        if written:
+            print(f"   💾 {written} chunks written ({len(flushed)} files)", flush=True)
+        return flushed
 
-        if not content.strip():
-            print(f"   ✗ Empty file", flush=True)
+    def upload_document(self, file_path: Path) -> int:
+        # Skip if already uploaded
+        if file_path.name in self.uploaded_files:
+            print(f"⏭️  SKIP: {file_path.name} (already uploaded)", flush=True)
             return 0
 
-        # Chunk
-        chunks = self.chunk_text(content)
-        print(f"   📦 {len(chunks)} chunks", flush=True)
+        doc = ingest_pipeline.prepare_document(file_path, CHUNK_SIZE, CHUNK_OVERLAP)
+        embeddings = self.embed_document(doc) if not doc.error else None
+        self.write_document(doc, embeddings)
+        return self.flush().get(doc.file_path.name, 0)
 
-        # Upload chunks
-        uploaded = 0
-        cursor = self.db_conn.cursor()
+    def upload_directory(self, directory_path: str,
+                         read_workers: int = READ_WORKERS,
+                         embed_workers: int = EMBED_WORKERS,
+                         queue_size: int = QUEUE_SIZE):
+        dir_path = Path(directory_path)
+        files = ingest_pipeline.find_documents(dir_path)
+        todo = [f for f in files if f.name not in self.uploaded_files]
+        
+        print(f"\n{'='*60}")
+        print(f"📁 {len(files)} files | {len(files) - len(todo)} already done")
+        print(f"⚙️  {read_workers} read | {embed_workers} embed | 1 write")
+        print(f"{'='*60}\n")
+
+        totals = {"chunks": 0, "files": 0}
 
-        for idx, chunk in enumerate(chunks):
+        def flush():
             try:
-                if (idx + 1) % 10 == 0 or idx == 0:
-                    print(f"   [{idx+1}/{len(chunks)}]", end=' ', flush=True)
-                
-                embedding = self.create_embedding(chunk)
-                
-                metadata = {
-                    "file_size": file_path.stat().st_size,
-                    "chunk_size": len(chunk)
-                }
-
-                cursor.execute(
-                    """
-                    INSERT INTO documents 
-                    (filename, file_type, content, chunk_index, total_chunks, embedding, metadata)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    """,
-                    (
-                        file_path.name,
-                        file_extension[1:],
-                        chunk,
-                        idx,
-                        len(chunks),
-                        embedding,
-                        Json(metadata)
-                    )
-                )
-                uploaded += 1
+                flushed = self.flush()
+            except Exception as e:
+                print(f"✗ Write error: {str(e)[:80]}", flush=True)
+                return
+            for chunks in flushed.values():
+                if chunks > 0:
+                    totals["chunks"] += chunks
+                    totals["files"] += 1
 
-            except KeyboardInterrupt:
-                raise
+        def write(doc, embeddings):
+            try:
+                self.write_document(doc, embeddings)
             except Exception as e:
-                print(f"\n   ✗ Chunk {idx} error: {str(e)[:50]}", flush=True)
-                continue
+                print(f"✗ Error: {doc.file_path.name}: {e}", flush=True)
+            if self.writer.pending >= self.writer.flush_size:
+                flush()
 
-        self.db_conn.commit()
-        cursor.close()
-        print(f" ✅ {uploaded}/{len(chunks)}", flush=True)
-        
-        # Mark as uploaded
-        self.uploaded_files.add(file_path.name)
-        return uploaded
+        try:
+            run_pipeline(
+                todo,
+                prepare=partial(ingest_pipeline.prepare_document,
+                                chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP),
+                embed=self.embed_document,
+                write=write,
+                read_workers=read_workers,
+                embed_workers=embed_workers,
+                queue_size=queue_size
+            )
+        except KeyboardInterrupt:
+            print(f"\n\n⚠️  Interrupted by user")
+        flush()
 
-    def upload_directory(self, directory_path: str):
-        dir_path = Path(directory_path)
-        files = list(dir_path.glob("*.txt")) + list(dir_path.glob("*.pdf"))
-        
         print(f"\n{'='*60}")
-        print(f"📁 {len(files)} files | {len(self.uploaded_files)} already done")
+        print(f"✅ Done: {totals['files']} files, {totals['chunks']} chunks")
+        self.print_cache_stats()
         print(f"{'='*60}\n")
 
-        total_chunks = 0
-        successful = 0
+    def sync_directory(self, directory_path: str,
+                       read_workers: int = READ_WORKERS,
+                       embed_workers: int = EMBED_WORKERS,
+                       queue_size: int = QUEUE_SIZE):
+        """
+        Incrementally sync a directory with the database.
+
+        Unchanged files (same content hash and chunker/model) are skipped without
+        being parsed, renamed files are moved without re-embedding, changed files
+        only embed chunks whose content is not stored yet, and rows of files that
+        disappeared from the directory are removed.
+        """
+        dir_path = Path(directory_path)
+        directory = dir_path.resolve().name
+        files = ingest_pipeline.find_documents(dir_path)
+        manifest = document_store.load_manifest(self.db_conn, directory)
+        hashes = {f.name: ingest_pipeline.file_hash(f) for f in files}
+
+        def current(entry, file_hash):
+            return (entry["file_hash"] == file_hash and entry["chunker"] == CHUNKER
+                    and entry["embedding_model"] == EMBEDDING_MODEL)
 
+        # Manifest entries whose file is gone are either renames or deletions
+        gone = {name: entry for name, entry in manifest.items() if name not in hashes}
+        gone_by_hash = {entry["file_hash"]: name for name, entry in gone.items()}
+
+        changed, renamed = [], []
+        unchanged = 0
         for file_path in files:
+            entry = manifest.get(file_path.name)
+            file_hash = hashes[file_path.name]
+            if entry and current(entry, file_hash):
+                unchanged += 1
+            elif not entry and file_hash in gone_by_hash and current(gone[gone_by_hash[file_hash]], file_hash):
+                old_name = gone_by_hash.pop(file_hash)
+                renamed.append((old_name, file_path.name))
+                del gone[old_name]
+            else:
+                changed.append(file_path)
+
+        print(f"\n{'='*60}")
+        print(f"🔄 {len(files)} files | {unchanged} unchanged | {len(changed)} new/changed "
+              f"| {len(renamed)} renamed | {len(gone)} deleted")
+        print(f"{'='*60}\n")
+
+        try:
+            for old_name, new_name in renamed:
+                document_store.rename_document(self.db_conn, old_name, new_name)
+                print(f"✏️  {old_name} → {new_name}", flush=True)
+            for name in gone:
+                deleted = document_store.delete_document(self.db_conn, name)
+                print(f"🗑️  {name} ({deleted} chunks removed)", flush=True)
+            self.db_conn.commit()
+        except Exception:
+            self.db_conn.rollback()
+            raise
+
+        # Existing chunks of changed files, grouped by content hash, can be kept as is
+        existing = document_store.load_chunk_hashes(self.db_conn, [f.name for f in changed])
+        purge = {}
+        for name, chunks in existing.items():
+            entry = manifest.get(name)
+            if entry and entry["embedding_model"] != EMBEDDING_MODEL:
+                purge[name] = [i for ids in chunks.values() for i in ids]
+                existing[name] = {}
+
+        def embed(doc):
+            known = {h: len(ids) for h, ids in existing[doc.file_path.name].items()}
+            todo = []
+            for idx, chunk in enumerate(doc.chunks):
+                h = document_store.chunk_hash(chunk)
+                if known.get(h):
+                    known[h] -= 1
+                else:
+                    todo.append(idx)
+
+            embeddings = [None] * len(doc.chunks)
+            vectors = self.create_embeddings([doc.chunks[i] for i in todo]) if todo else []
+            for idx, vector in zip(todo, vectors):
+                embeddings[idx] = vector
+            return embeddings
+
+        totals = {"files": 0, "embedded": 0, "reused": 0, "removed": 0}
+
+        def write(doc, embeddings):
+            name = doc.file_path.name
             try:
-                chunks = self.upload_document(file_path)
-                if chunks > 0:
-                    total_chunks += chunks
-                    successful += 1
-            except KeyboardInterrupt:
-                print(f"\n\n⚠️  Interrupted by user")
-                break
+                embedded, reused, removed = self.sync_document(
+                    doc, embeddings, existing[name], purge.get(name, []), hashes[name], directory
+                )
             except Exception as e:
-                print(f"✗ Error: {file_path.name}: {e}", flush=True)
-                continue
+                print(f"✗ Error: {name}: {e}", flush=True)
+                return
+            totals["files"] += 1
+            totals["embedded"] += embedded
+            totals["reused"] += reused
+            totals["removed"] += removed
+
+        try:
+            run_pipeline(
+                changed,
+                prepare=partial(ingest_pipeline.prepare_document,
+                                chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP),
+                embed=embed,
+                write=write,
+                read_workers=read_workers,
+                embed_workers=embed_workers,
+                queue_size=queue_size
+            )
+        except KeyboardInterrupt:
+            print(f"\n\n⚠️  Interrupted by user")
 
         print(f"\n{'='*60}")
-        print(f"✅ Done: {successful} files, {total_chunks} chunks")
+        print(f"✅ Synced: {totals['files']} files | {totals['embedded']} chunks embedded "
+              f"| {totals['reused']} reused | {totals['removed']} removed")
+        self.print_cache_stats()
         print(f"{'='*60}\n")
 
+    def sync_document(self, doc: PreparedDocument,
+                      embeddings: Optional[List[Optional[List[float]]]],
+                      existing: dict, purge: List[str], file_hash: str, directory: str):
+        """Apply the chunk-level diff of one changed file in a single transaction"""
+        name = doc.file_path.name
+        print(f"\n📄 {name}", flush=True)
+
+        if doc.error:
+            print(f"   ✗ {doc.error}", flush=True)
+            return 0, 0, 0
+
+        available = {h: list(ids) for h, ids in existing.items()}
+        kept, rows = [], []
+        missing = 0
+        for idx, (chunk, embedding) in enumerate(zip(doc.chunks, embeddings)):
+            ids = available.get(document_store.chunk_hash(chunk))
+            if ids:
+                kept.append((ids.pop(), idx))
+            elif embedding is not None:
+                rows.append((idx, chunk, embedding))
+            else:
+                missing += 1
+        stale = [i for ids in available.values() for i in ids] + purge
+
+        try:
+            self.writer.add_document(name, doc.file_type, len(doc.chunks), rows,
+                                     {"file_size": doc.file_size})
+            embedded = self.writer.flush()
+            document_store.reindex_chunks(self.db_conn, kept, len(doc.chunks))
+            removed = document_store.delete_chunks(self.db_conn, stale)
+            if not missing:
+                # Only record the file as synced when every chunk is stored
+                document_store.upsert_manifest(
+                    self.db_conn, name, directory, file_hash,
+                    CHUNKER, EMBEDDING_MODEL, len(doc.chunks)
+                )
+            self.db_conn.commit()
+        except Exception:
+            self.db_conn.rollback()
+            raise
+
+        self.uploaded_files.add(name)
+        print(f"   ♻️  {len(kept)} kept | 🆕 {embedded} embedded | 🗑️  {removed} removed"
+              + (f" | ✗ {missing} failed" if missing else ""), flush=True)
+        return embedded, len(kept), removed
+
+    def print_cache_stats(self):
+        if self.embedding_cache:
+            stats = self.embedding_cache.stats()
+            print(f"🧠 Embedding cache: {stats['hits']} hits | {stats['misses']} misses")
+
     def close(self):
         if self.db_conn:
             self.db_conn.close()
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python upload_robust.py <directory_path>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Upload TXT/PDF files, skipping already uploaded ones")
+    parser.add_argument("directory_path")
+    parser.add_argument("--read-workers", type=int, default=READ_WORKERS)
+    parser.add_argument("--embed-workers", type=int, default=EMBED_WORKERS)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--flush-size", type=int, default=FLUSH_SIZE)
+    parser.add_argument("--write-method", choices=["values", "copy"], default="values")
+    parser.add_argument("--sync", action="store_true",
+                        help="Incremental sync: re-embed changed chunks, handle renames and deletions")
+    args = parser.parse_args()
 
-    uploader = RobustUploader()
+    uploader = RobustUploader(flush_size=args.flush_size, write_method=args.write_method)
+    upload = uploader.sync_directory if args.sync else uploader.upload_directory
     try:
-        uploader.upload_directory(sys.argv[1])
+        upload(
+            args.directory_path,
+            read_workers=args.read_workers,
+            embed_workers=args.embed_workers,
+            queue_size=args.queue_size
+        )
     finally:
         uploader.close()